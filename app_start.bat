@@ -66,6 +66,10 @@ echo Running unit conversion pipeline...
 python data\pipeline\unit_conversion_pipe.py
 IF ERRORLEVEL 1 GOTO setup_fail
 
+echo Building recipe requirements artifact...
+python data\pipeline\build_recipe_artifact.py
+IF ERRORLEVEL 1 GOTO setup_fail
+
 echo Setup completed successfully.
 echo success > setup_complete.flag
 GOTO run_app
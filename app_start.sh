@@ -25,6 +25,7 @@ else
     # === python3 data/pipeline/run_product_mapping_pipe.py will not be run ===
     python3 data/pipeline/populate_mapped_ingredients.py
     python3 data/pipeline/unit_conversion_pipe.py
+    python3 data/pipeline/build_recipe_artifact.py
 
     # === 6. Mark setup complete ===
     echo "Setup complete" > setup_complete.flag
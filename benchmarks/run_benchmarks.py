@@ -0,0 +1,307 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+# Allow running as a script from anywhere in the repo
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+import numpy as np
+from sqlalchemy.orm import selectinload
+from database.tables import Recipe
+from recommender_system import recipe_recommender_sys
+from recommender_system.recipe_recommender_sys import RecipeRecommender
+from services.pantry_manager import PantryManager
+from benchmarks.synthetic_data import build_synthetic_database
+
+BASELINE_VERSION = 1
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baseline.json"
+
+# name -> (recipes, pantry lots)
+SCALES = {
+    "small": (1_000, 10),
+    "medium": (10_000, 1_000),
+    "large": (100_000, 10_000),
+}
+
+# Pantry sizes for --pantry-scaling, on a small recipe catalog.
+PANTRY_SCALING_LOTS = (1_000, 10_000, 100_000)
+
+# A timing regresses when it is this much slower than the baseline ...
+DEFAULT_THRESHOLD = 0.25
+
+# ... and slower by at least this many seconds, so sub-millisecond noise never fails a run.
+MIN_REGRESSION_SECONDS = 0.002
+
+
+def time_call(fn, repeat, setup=None):
+    """Run `fn` once to warm up, then `repeat` times. Returns {"min", "median"} seconds."""
+    if setup:
+        setup()
+    fn()
+
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return {"min": min(samples), "median": statistics.median(samples)}
+
+
+def clear_result_cache():
+    """Recommendation lists are cached per pantry state; clear them so the ranking is measured."""
+    recipe_recommender_sys._RESULT_CACHE.clear()
+
+
+def pantry_timings(pm, repeat):
+    """Time the pantry readers used by every page render and recommender call."""
+    return {
+        "get_pantry_columns": time_call(pm.get_pantry_columns, repeat),
+        "get_pantry_items": time_call(pm.get_pantry_items, repeat),
+        "get_all_items": time_call(lambda: list(pm.get_all_items()), repeat),
+    }
+
+
+def benchmark_scale(n_recipes, n_lots, repeat, seed=0):
+    """Build a synthetic database of the given size in a temp dir and time the recommender entry points."""
+    with tempfile.TemporaryDirectory() as tmp:
+        started = time.perf_counter()
+        session = build_synthetic_database(
+            os.path.join(tmp, "bench.sqlite"), n_recipes=n_recipes, n_lots=n_lots, seed=seed
+        )
+        build_seconds = time.perf_counter() - started
+
+        try:
+            recommender = RecipeRecommender(session)
+            state = recommender.pm.get_all_items()
+
+            # Recipe with the most ingredients, loaded once so only the apply is timed
+            row = int(np.argmax(np.diff(recommender.engine.requirements.indptr)))
+            recipe = (
+                session.query(Recipe)
+                .options(selectinload(Recipe.ingredients))
+                .filter(Recipe.recipe_id == int(recommender.engine.recipe_ids[row]))
+                .one()
+            )
+            top = recommender.recommend_recipes(limit=1, max_missing=3)
+            rationale_id = top[0]["recipe_id"] if top else recipe.recipe_id
+
+            timings = {
+                "calculate_item_scores": time_call(
+                    recommender.calculate_item_scores, repeat
+                ),
+                "recommend_recipes": time_call(
+                    lambda: recommender.recommend_recipes(limit=10), repeat, clear_result_cache
+                ),
+                "recommend_by_category": time_call(
+                    lambda: recommender.recommend_by_category("dinner", limit=10), repeat, clear_result_cache
+                ),
+                "get_rationale": time_call(
+                    lambda: recommender.get_rationale(rationale_id), repeat
+                ),
+                "_apply_recipe_to_virtual_state": time_call(
+                    lambda: recommender._apply_recipe_to_virtual_state(recipe, state), repeat
+                ),
+                **pantry_timings(recommender.pm, repeat),
+            }
+        finally:
+            session.close()
+            session.get_bind().dispose()
+
+    return {
+        "params": {"recipes": n_recipes, "lots": n_lots, "seed": seed},
+        "build_seconds": build_seconds,
+        "timings": timings,
+    }
+
+
+def benchmark_pantry_scaling(lot_counts=PANTRY_SCALING_LOTS, repeat=5, seed=0, n_recipes=200):
+    """Time the pantry readers at growing pantry sizes. Returns {"pantry-<lots>": result}."""
+    results = {}
+    for n_lots in lot_counts:
+        with tempfile.TemporaryDirectory() as tmp:
+            started = time.perf_counter()
+            session = build_synthetic_database(
+                os.path.join(tmp, "bench.sqlite"), n_recipes=n_recipes, n_lots=n_lots, seed=seed
+            )
+            build_seconds = time.perf_counter() - started
+            try:
+                timings = pantry_timings(PantryManager(session), repeat)
+            finally:
+                session.close()
+                session.get_bind().dispose()
+
+        results[f"pantry-{n_lots}"] = {
+            "params": {"recipes": n_recipes, "lots": n_lots, "seed": seed},
+            "build_seconds": build_seconds,
+            "timings": timings,
+        }
+    return results
+
+
+def scaling_exponent(results, op):
+    """
+    Least-squares slope of log(time) against log(lots) across pantry sizes:
+    about 1 for linear scaling, 2 for quadratic.
+    """
+    points = [(r["params"]["lots"], r["timings"][op]["min"]) for r in results.values()]
+    if len(points) < 2:
+        return None
+    lots, seconds = np.log([p[0] for p in points]), np.log([p[1] for p in points])
+    return float(np.polyfit(lots, seconds, 1)[0])
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "numpy": np.__version__,
+    }
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare the min timings of every (scale, operation) present in both runs.
+    Returns a list of (scale, operation, baseline_s, current_s, ratio, regressed).
+    """
+    rows = []
+    for scale, result in current["results"].items():
+        base_scale = baseline.get("results", {}).get(scale)
+        if not base_scale or base_scale.get("params") != result["params"]:
+            continue
+        for op, timing in result["timings"].items():
+            base = base_scale["timings"].get(op)
+            if base is None:
+                continue
+            before, after = base["min"], timing["min"]
+            ratio = after / before if before > 0 else float("inf")
+            regressed = ratio > 1 + threshold and after - before > MIN_REGRESSION_SECONDS
+            rows.append((scale, op, before, after, ratio, regressed))
+    return rows
+
+
+def load_baseline(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            baseline = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return baseline if baseline.get("version") == BASELINE_VERSION else None
+
+
+def write_json(path, payload):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=2)
+    os.replace(tmp, path)
+
+
+def run_benchmarks(scales, repeat=5, baseline_path=DEFAULT_BASELINE, threshold=DEFAULT_THRESHOLD,
+                   update_baseline=False, output=None, seed=0, pantry_lots=()):
+    """
+    Time every scale (and the pantry readers at each size in `pantry_lots`)
+    and check it against the baseline file. The baseline is
+    written when it does not exist yet or `update_baseline` is set.
+    Returns True when no operation regressed beyond `threshold`.
+    """
+    current = {
+        "version": BASELINE_VERSION,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "environment": environment(),
+        "results": {},
+    }
+    for name, (n_recipes, n_lots) in scales.items():
+        print(f"[{name}] {n_recipes} recipes, {n_lots} lots")
+        result = benchmark_scale(n_recipes, n_lots, repeat, seed)
+        current["results"][name] = result
+        print(f"  synthetic data built in {result['build_seconds']:.1f}s")
+        for op, timing in result["timings"].items():
+            print(f"  {op:<32} min {timing['min'] * 1000:9.2f} ms   median {timing['median'] * 1000:9.2f} ms")
+
+    if pantry_lots:
+        scaling = benchmark_pantry_scaling(pantry_lots, repeat, seed)
+        current["results"].update(scaling)
+        print("[pantry scaling] per-lot time and log-log slope (1.0 = linear)")
+        for op in next(iter(scaling.values()))["timings"]:
+            per_lot = "  ".join(
+                f"{r['params']['lots']}: {r['timings'][op]['min'] / r['params']['lots'] * 1e6:6.2f} us"
+                for r in scaling.values()
+            )
+            exponent = scaling_exponent(scaling, op)
+            slope = f"slope {exponent:.2f}" if exponent is not None else ""
+            print(f"  {op:<20} {per_lot}   {slope}")
+
+    if output:
+        write_json(output, current)
+
+    baseline = load_baseline(baseline_path)
+    if baseline is None or update_baseline:
+        if baseline is not None:
+            # Keep scales that were not re-run in this invocation
+            current["results"] = {**baseline["results"], **current["results"]}
+        write_json(baseline_path, current)
+        print(f"Baseline written to {baseline_path}")
+        return True
+
+    rows = compare(baseline, current, threshold)
+    regressions = [row for row in rows if row[5]]
+    print(f"\nCompared with baseline from {baseline.get('created')} (threshold +{threshold:.0%}):")
+    for scale, op, before, after, ratio, regressed in rows:
+        flag = "REGRESSION" if regressed else ""
+        print(f"  {scale:<8} {op:<32} {before * 1000:9.2f} -> {after * 1000:9.2f} ms  x{ratio:5.2f}  {flag}")
+
+    if regressions:
+        print(f"\n{len(regressions)} operation(s) regressed by more than {threshold:.0%}.")
+    return not regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the recipe recommender on synthetic catalogs.")
+    parser.add_argument("--scale", nargs="+", choices=sorted(SCALES), default=["small", "medium"],
+                        help="Preset sizes to run (default: small medium).")
+    parser.add_argument("--recipes", type=int, help="Custom number of recipes (runs a 'custom' scale).")
+    parser.add_argument("--lots", type=int, default=100, help="Pantry lots for --recipes (default: 100).")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per operation (default: 5).")
+    parser.add_argument("--seed", type=int, default=0, help="Synthetic data seed (default: 0).")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE),
+                        help="Baseline JSON file (default: benchmarks/baseline.json).")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Allowed slowdown before failing, as a fraction (default: 0.25).")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="Overwrite the baseline with this run instead of comparing.")
+    parser.add_argument("--output", help="Also write this run's results to a JSON file.")
+    parser.add_argument("--pantry-scaling", nargs="*", type=int, metavar="LOTS",
+                        help="Also time the pantry readers at these pantry sizes "
+                             "(default: 1000 10000 100000).")
+    args = parser.parse_args()
+
+    if args.recipes:
+        scales = {"custom": (args.recipes, args.lots)}
+    else:
+        scales = {name: SCALES[name] for name in args.scale}
+
+    ok = run_benchmarks(
+        scales,
+        repeat=args.repeat,
+        baseline_path=args.baseline,
+        threshold=args.threshold,
+        update_baseline=args.update_baseline,
+        output=args.output,
+        seed=args.seed,
+        pantry_lots=(
+            () if args.pantry_scaling is None else tuple(args.pantry_scaling) or PANTRY_SCALING_LOTS
+        ),
+    )
+    sys.exit(0 if ok else 1)
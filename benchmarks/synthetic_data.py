@@ -0,0 +1,198 @@
+import itertools
+import random
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from database.tables import create_all_tables, Recipe, Ingredient, TJInventory, PantryItem
+
+# (category, sub_category, share of the catalog, shelf life range in days),
+# shaped after trader_joes_products_v3.csv and FoodKeeper storage times.
+PRODUCT_PROFILES = [
+    ("Meat, Seafood & Plant-based", "Beef, Pork & Lamb", 0.035, (2, 5)),
+    ("Meat, Seafood & Plant-based", "Chicken & Turkey", 0.025, (1, 3)),
+    ("Meat, Seafood & Plant-based", "Fish & Seafood", 0.01, (1, 3)),
+    ("Fresh Fruits & Veggies", "Veggies", 0.05, (3, 14)),
+    ("Fresh Fruits & Veggies", "Fruits", 0.025, (3, 10)),
+    ("Fresh Prepared Foods", "Salads, Soups & Sides", 0.045, (3, 7)),
+    ("Fresh Prepared Foods", "Entrées & Center of Plate", 0.03, (3, 5)),
+    ("Cheese", "Wedges, Wheels, Loaves, Logs", 0.03, (21, 60)),
+    ("Cheese", "Slices, Shreds, Crumbles", 0.03, (14, 30)),
+    ("Dairy & Eggs", "Yogurt", 0.02, (7, 21)),
+    ("Dairy & Eggs", None, 0.015, (7, 28)),
+    ("Bakery", "Loaves, Rolls, Buns", 0.04, (4, 7)),
+    ("Bakery", "Sweet Stuff", 0.025, (3, 7)),
+    ("Dips, Sauces & Dressings", "Dip/Spread", 0.03, (7, 21)),
+    ("Dips, Sauces & Dressings", "Salsa & Hot Sauce", 0.05, (30, 180)),
+    ("From The Freezer", "Entrées & Sides", 0.1, (90, 365)),
+    ("From The Freezer", "Cool Desserts", 0.06, (60, 240)),
+    ("For the Pantry", "Pastas & Grains", 0.05, (365, 730)),
+    ("For the Pantry", "For Baking & Cooking", 0.05, (180, 730)),
+    ("For the Pantry", "Spices", 0.03, (365, 1095)),
+    ("For the Pantry", "Nut Butters & Fruit Spreads", 0.03, (90, 365)),
+    ("Snacks & Sweets", "Candies & Cookies", 0.11, (60, 270)),
+    ("Snacks & Sweets", "Chips, Crackers & Crunchy Bites", 0.06, (30, 120)),
+]
+
+# Relative weight of each top-level category among recipe ingredients;
+# recipes lean on fresh produce and staples, rarely on snacks.
+INGREDIENT_CATEGORY_WEIGHT = {
+    "Meat, Seafood & Plant-based": 2.0,
+    "Fresh Fruits & Veggies": 4.0,
+    "Fresh Prepared Foods": 0.6,
+    "Cheese": 2.0,
+    "Dairy & Eggs": 2.5,
+    "Bakery": 1.0,
+    "Dips, Sauces & Dressings": 1.2,
+    "From The Freezer": 0.5,
+    "For the Pantry": 3.0,
+    "Snacks & Sweets": 0.3,
+}
+
+# Recipe category strings and their share, after trader_joes_recipes.csv.
+RECIPE_CATEGORIES = [
+    ("Appetizers & Sides", 0.28),
+    ("Dinner", 0.16),
+    ("Desserts", 0.15),
+    ("Breakfast", 0.10),
+    ("Lunch", 0.08),
+    ("Beverages", 0.07),
+    ("Dinner & Lunch", 0.06),
+    ("Lunch & Dinner", 0.04),
+    ("Appetizers & Sides & Lunch", 0.02),
+    ("Breakfast & Desserts", 0.01),
+    ("Appetizers & Sides, Dinner & Lunch", 0.01),
+    ("Breakfast & Lunch", 0.01),
+    (None, 0.01),
+]
+
+UNMATCHED_INGREDIENTS = ["salt", "water", "black pepper", "ice", "fresh herbs", "lemon juice"]
+
+PACKAGE_SIZES = [4, 6, 8, 10, 12, 16, 24, 32]
+
+# Share of matched ingredients whose amount could not be converted.
+UNCONVERTED_SHARE = 0.08
+
+# Rows per executemany batch.
+INSERT_BATCH = 20_000
+
+
+def _bulk_insert(session, table, rows):
+    for start in range(0, len(rows), INSERT_BATCH):
+        session.execute(insert(table), rows[start:start + INSERT_BATCH])
+
+
+def generate_products(rng, n_products):
+    """tj_inventory rows with a catalog-like category mix and shelf lives."""
+    cum_share = list(itertools.accumulate(p[2] for p in PRODUCT_PROFILES))
+    rows = []
+    for pid in range(1, n_products + 1):
+        category, sub_category, _, (lo, hi) = rng.choices(PRODUCT_PROFILES, cum_weights=cum_share)[0]
+        rows.append({
+            "product_id": pid,
+            "name": f"{sub_category or category} {pid}",
+            "norm_name": f"product {pid}",
+            "unit": "oz",
+            "quantity": rng.choice(PACKAGE_SIZES),
+            "price": round(rng.uniform(1.5, 12), 2),
+            "category": category,
+            "sub_category": sub_category,
+            "shelf_life_days": rng.randint(lo, hi),
+        })
+    return rows
+
+
+def generate_recipes(rng, n_recipes, products):
+    """recipe + ingredient rows: 4-14 ingredients each, popular products reused across many recipes."""
+    # Zipf-like popularity on top of the category weight, so a few staples
+    # (oil, garlic, onions...) show up everywhere like in real recipes
+    order = list(range(len(products)))
+    rng.shuffle(order)
+    popularity = [0.0] * len(products)
+    for rank, i in enumerate(order):
+        popularity[i] = INGREDIENT_CATEGORY_WEIGHT[products[i]["category"]] / (rank + 1) ** 0.8
+    cum_popularity = list(itertools.accumulate(popularity))
+
+    categories = [c for c, _ in RECIPE_CATEGORIES]
+    cum_category = list(itertools.accumulate(w for _, w in RECIPE_CATEGORIES))
+
+    recipes, ingredients = [], []
+    for rid in range(1, n_recipes + 1):
+        recipes.append({
+            "recipe_id": rid,
+            "title": f"Recipe {rid}",
+            "category": rng.choices(categories, cum_weights=cum_category)[0],
+            "serves": str(rng.choice([1, 2, 4, 6])),
+            "time": f"{rng.choice([10, 20, 30, 45, 60])} min",
+        })
+
+        n_ing = min(max(int(rng.gauss(8, 2.5)), 4), 14)
+        for product in rng.choices(products, cum_weights=cum_popularity, k=n_ing):
+            if rng.random() < 0.12:
+                name = rng.choice(UNMATCHED_INGREDIENTS)
+                ingredients.append({
+                    "recipe_id": rid, "raw_text": name, "name": name, "norm_name": name,
+                    "matched_product_id": None, "pantry_amount": None, "pantry_unit": None,
+                })
+                continue
+
+            amount = None
+            if rng.random() >= UNCONVERTED_SHARE:
+                amount = round(product["quantity"] * rng.choice([0.1, 0.25, 0.5, 0.5, 1, 1, 1.5]), 2)
+            ingredients.append({
+                "recipe_id": rid,
+                "raw_text": product["name"],
+                "name": product["norm_name"],
+                "norm_name": product["norm_name"],
+                "matched_product_id": product["product_id"],
+                "pantry_amount": amount,
+                "pantry_unit": "oz",
+            })
+    return recipes, ingredients
+
+
+def generate_pantry(rng, n_lots, products, now):
+    """
+    Pantry lots bought over the past weeks: fresh products are bought more
+    often, and each lot is somewhere inside its shelf life, so some expire
+    within days and a few have already expired.
+    """
+    weights = [INGREDIENT_CATEGORY_WEIGHT[p["category"]] for p in products]
+    rows = []
+    for product in rng.choices(products, weights, k=n_lots):
+        shelf_life = product["shelf_life_days"]
+        age = rng.uniform(0, min(shelf_life * 1.05, 60))
+        added = now - timedelta(days=age)
+        rows.append({
+            "product_id": product["product_id"],
+            "amount": round(product["quantity"] * rng.choice([0.25, 0.5, 1, 1, 1, 2]), 2),
+            "unit": "oz",
+            "date_added": added,
+            "expiration_date": added + timedelta(days=shelf_life),
+        })
+    return rows
+
+
+def build_synthetic_database(path, n_recipes=1_000, n_lots=100, n_products=None, seed=0, now=None):
+    """
+    Create a SQLite database at `path` with synthetic tj_inventory, recipe,
+    ingredient and pantry tables. The catalog defaults to the size of the
+    real one, growing with the recipe count. Returns an open Session.
+    """
+    rng = random.Random(seed)
+    now = now or datetime.now()
+    n_products = n_products or max(1_300, n_recipes // 20)
+
+    engine = create_engine(f"sqlite:///{path}")
+    create_all_tables(engine)
+    session = sessionmaker(bind=engine)()
+
+    products = generate_products(rng, n_products)
+    recipes, ingredients = generate_recipes(rng, n_recipes, products)
+    pantry = generate_pantry(rng, n_lots, products, now)
+
+    _bulk_insert(session, TJInventory, products)
+    _bulk_insert(session, Recipe, recipes)
+    _bulk_insert(session, Ingredient, ingredients)
+    _bulk_insert(session, PantryItem, pantry)
+    session.commit()
+    return session
@@ -0,0 +1,121 @@
+import argparse
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+# Allow pipeline scripts to import database + services
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+sys.path.append(str(PROJECT_ROOT))
+
+from sqlalchemy import create_engine, inspect, insert, text
+from sqlalchemy.orm import sessionmaker
+from database.config import DATABASE_URL
+from database.tables import RecipeRecommended
+from recommender_system.scoring_engine import get_scoring_engine
+from recommender_system.catalog import get_product_catalog
+from recommender_system.batch_recommender import BatchRecommender, HouseholdPantries
+from recommender_system.recipe_recommender_sys import CATEGORY_MULTIPLIERS
+
+SNAPSHOT_COLUMNS = ["household_id", "product_id", "amount", "expiration_date"]
+
+# Rows per executemany batch when writing recommendations.
+INSERT_BATCH = 50_000
+
+
+def ensure_household_column(engine):
+    """Databases created before batch mode have no recipe_recommended.household_id yet."""
+    columns = {c["name"] for c in inspect(engine).get_columns("recipe_recommended")}
+    if "household_id" not in columns:
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE recipe_recommended ADD COLUMN household_id INTEGER"))
+
+
+def read_snapshots(path):
+    """
+    Pantry snapshots as one CSV (or Parquet) row per lot:
+    household_id, product_id, amount, expiration_date.
+    """
+    if str(path).endswith(".parquet"):
+        df = pd.read_parquet(path, columns=SNAPSHOT_COLUMNS)
+    else:
+        df = pd.read_csv(path, usecols=SNAPSHOT_COLUMNS)
+
+    df["expiration_date"] = pd.to_datetime(df["expiration_date"], errors="coerce")
+    return df
+
+
+def run_batch_recommend(snapshot_path, limit=5, max_missing=1, replace=False, database_url=DATABASE_URL):
+    """
+    Score every household in the snapshot file against all recipes and bulk
+    insert their top `limit` recipes into recipe_recommended (one row per
+    household x recipe, all sharing one recommended_at timestamp).
+    """
+    engine = create_engine(database_url)
+    ensure_household_column(engine)
+    Session = sessionmaker(bind=engine)
+    session = Session()
+
+    started = time.perf_counter()
+    now = datetime.now()
+
+    df = read_snapshots(snapshot_path)
+    scoring_engine = get_scoring_engine(session)
+    catalog = get_product_catalog(session, CATEGORY_MULTIPLIERS)
+
+    pantries = HouseholdPantries.from_lots(
+        scoring_engine,
+        catalog,
+        df["household_id"].to_numpy(),
+        df["product_id"].to_numpy(),
+        df["amount"].fillna(0).to_numpy(),
+        df["expiration_date"].to_numpy(dtype="datetime64[us]"),
+        now=now,
+    )
+    print(f"Loaded {len(df)} lots for {pantries.n_households} households.")
+
+    households, recipes, _, scores = BatchRecommender(scoring_engine).top_k(
+        pantries, limit=limit, max_missing=max_missing
+    )
+    scored = time.perf_counter()
+    print(f"Scored {pantries.n_households} households in {scored - started:.2f}s.")
+
+    try:
+        if replace and len(pantries.household_ids):
+            session.execute(
+                RecipeRecommended.__table__.delete().where(
+                    RecipeRecommended.household_id.in_(pantries.household_ids.tolist())
+                )
+            )
+
+        rows = [
+            {"household_id": h, "recipe_id": r, "score": round(s, 3), "recommended_at": now}
+            for h, r, s in zip(households.tolist(), recipes.tolist(), scores.tolist())
+        ]
+        for start in range(0, len(rows), INSERT_BATCH):
+            session.execute(insert(RecipeRecommended.__table__), rows[start:start + INSERT_BATCH])
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+    print(f"Wrote {len(rows)} recommendations in {time.perf_counter() - scored:.2f}s.")
+    return len(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recommend recipes for many household pantries at once.")
+    parser.add_argument("snapshots",
+                        help="CSV or Parquet file with household_id, product_id, amount, expiration_date per lot.")
+    parser.add_argument("--limit", type=int, default=5, help="Recipes kept per household (default: 5).")
+    parser.add_argument("--max-missing", type=int, default=1,
+                        help="Most missing ingredients a recipe may have (default: 1).")
+    parser.add_argument("--replace", action="store_true",
+                        help="Delete earlier recommendations of the same households first.")
+    args = parser.parse_args()
+
+    run_batch_recommend(args.snapshots, limit=args.limit, max_missing=args.max_missing, replace=args.replace)
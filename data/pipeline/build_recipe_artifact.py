@@ -0,0 +1,51 @@
+import sys
+from pathlib import Path
+
+# Allow pipeline scripts to import database + services
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+sys.path.append(str(PROJECT_ROOT))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from database.config import DATABASE_URL
+from recommender_system.requirements_artifact import (
+    artifact_dir_for,
+    build_requirements_artifact,
+)
+from recommender_system.scoring_engine import get_scoring_engine
+from recommender_system.catalog import get_product_catalog
+from recommender_system.overlap_index import build_overlap_index
+from recommender_system.recipe_recommender_sys import CATEGORY_MULTIPLIERS
+
+
+def run_build_recipe_artifact():
+    """
+    Compile recipe requirements (recipe -> matched products + pantry amounts)
+    into the memory-mapped artifact read by the recommender and grocery list,
+    then precompute the recipe overlap index used by complementary().
+    Must run after unit conversion, since it stores Ingredient.pantry_amount.
+    """
+    engine = create_engine(DATABASE_URL)
+    Session = sessionmaker(bind=engine)
+    session = Session()
+
+    directory = artifact_dir_for(session)
+    print(f"Building recipe requirements artifact in {directory}.")
+    requirements = build_requirements_artifact(session, directory)
+
+    print(
+        f"Completed artifact build. {requirements.n_recipes} recipes, "
+        f"{len(requirements.indices)} matched ingredients, "
+        f"{len(requirements.product_ids)} products."
+    )
+
+    print("Building recipe overlap index.")
+    engine = get_scoring_engine(session)
+    catalog = get_product_catalog(session, CATEGORY_MULTIPLIERS)
+    index = build_overlap_index(session, engine, catalog, directory)
+
+    print(f"Completed overlap index. {len(index.indices)} recipe neighbours stored.")
+
+
+if __name__ == "__main__":
+    run_build_recipe_artifact()
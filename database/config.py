@@ -8,3 +8,6 @@ DB_FILE = BASE_DIR / "database" / "team-no-food-waste-for-you.sqlite"
 
 # SQLAlchemy-compatible database URL
 DATABASE_URL = f"sqlite:///{DB_FILE}"
+
+# Compiled recipe-requirement arrays (built by data/pipeline/build_recipe_artifact.py)
+ARTIFACT_DIR = DB_FILE.with_suffix(".requirements")
@@ -105,6 +105,7 @@ class RecipeRecommended(Base):
     recipe_id = Column(Integer, ForeignKey("recipe.recipe_id"))
     recommended_at = Column(DateTime, default=datetime.now)
     score = Column(Float, nullable=True)  #### waste reduction score, model score, etc.
+    household_id = Column(Integer, nullable=True)  # set by batch runs over many pantries
 
     recipe = relationship("Recipe")
 
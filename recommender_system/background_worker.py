@@ -0,0 +1,166 @@
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from services.pantry_manager import add_pantry_listener, remove_pantry_listener
+from recommender_system.result_cache import TIME_BUCKET_MINUTES
+from recommender_system.recipe_recommender_sys import RecipeRecommender, CATEGORY_MULTIPLIERS
+from recommender_system.scoring_context import get_scoring_context
+
+# Wait this long after a pantry event before recomputing, so a burst of
+# writes (bulk add, clearing the pantry) costs one recomputation.
+DEBOUNCE_SECONDS = 0.25
+
+
+class WorkerResult:
+    """A completed recomputation: the recommendations and when they were computed."""
+
+    __slots__ = ("value", "computed_at", "generation")
+
+    def __init__(self, value, computed_at, generation):
+        self.value = value
+        self.computed_at = computed_at
+        self.generation = generation
+
+    @property
+    def age_seconds(self):
+        return (datetime.now() - self.computed_at).total_seconds()
+
+
+class RecommendationWorker:
+    """
+    Daemon thread that recomputes real-pantry recommendations off the
+    Streamlit request path.
+
+    Pages `track()` the parameter sets they display. The worker listens for
+    PantryManager writes to its database, and after each burst of writes
+    (and at least every time bucket, since urgency decays with the clock) it
+    recomputes every tracked set from one ScoringContext snapshot, read
+    with its own session. Pages read the latest completed result with
+    `latest()` and use `is_stale()` to tell whether a newer pantry state is
+    still being processed. The recomputation also
+    warms the shared score and result caches, so a synchronous call that
+    follows is usually a cache hit.
+    """
+
+    def __init__(self, database_url, refresh_seconds=TIME_BUCKET_MINUTES * 60, debounce=DEBOUNCE_SECONDS):
+        self.engine = create_engine(database_url)
+        self.Session = sessionmaker(bind=self.engine)
+        self.refresh_seconds = refresh_seconds
+        self.debounce = debounce
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._jobs = {}
+        self._results = {}
+        self._generation = 0
+        self._thread = None
+        self.last_error = None
+
+    @staticmethod
+    def job_key(categories, limit=5, max_missing=1):
+        return (tuple(categories), limit, max_missing)
+
+    def start(self):
+        """Start the thread and subscribe to pantry writes (idempotent)."""
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        self._stop.clear()
+        add_pantry_listener(self._on_pantry_change)
+        self._thread = threading.Thread(target=self._run, name="recommendation-worker", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        remove_pantry_listener(self._on_pantry_change)
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def track(self, categories, limit=5, max_missing=1):
+        """Keep {category: recommendations} for these parameters up to date. Returns the job key."""
+        key = self.job_key(categories, limit, max_missing)
+        with self._lock:
+            if key not in self._jobs:
+                self._jobs[key] = {"categories": list(categories), "limit": limit, "max_missing": max_missing}
+                self._wake.set()
+        return key
+
+    def latest(self, key):
+        """Latest completed WorkerResult for a job key, or None before the first run finishes."""
+        with self._lock:
+            return self._results.get(key)
+
+    def pantry_changed(self, result):
+        """True when the pantry was written since `result` was computed."""
+        if result is None:
+            return True
+        with self._lock:
+            return result.generation != self._generation
+
+    def is_stale(self, result):
+        """True when the pantry changed since `result` was computed, or it is older than a time bucket."""
+        return self.pantry_changed(result) or result.age_seconds > self.refresh_seconds
+
+    def wait_idle(self, timeout=None):
+        """Block until every tracked job has a result for the current pantry state (used by scripts)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                done = all(
+                    key in self._results and self._results[key].generation == self._generation
+                    for key in self._jobs
+                )
+            if done:
+                return True
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+
+    def _on_pantry_change(self, session, product_ids):
+        if str(session.get_bind().url) != str(self.engine.url):
+            return
+        with self._lock:
+            self._generation += 1
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.refresh_seconds)
+            if self._stop.is_set():
+                break
+            self._wake.clear()
+            time.sleep(self.debounce)
+            # Events arriving during the debounce are covered by this pass
+            self._wake.clear()
+
+            try:
+                self._recompute()
+                self.last_error = None
+            except Exception as exc:  # keep serving the last good result
+                self.last_error = exc
+
+    def _recompute(self):
+        with self._lock:
+            jobs = dict(self._jobs)
+            generation = self._generation
+
+        session = self.Session()
+        try:
+            # Every job of a pass scores the same snapshot
+            context = get_scoring_context(session, CATEGORY_MULTIPLIERS)
+            recommender = RecipeRecommender(session, context=context)
+            for key, params in jobs.items():
+                value = recommender.recommend_all_categories(
+                    params["categories"],
+                    limit=params["limit"],
+                    max_missing=params["max_missing"],
+                )
+                with self._lock:
+                    self._results[key] = WorkerResult(value, datetime.now(), generation)
+        finally:
+            session.close()
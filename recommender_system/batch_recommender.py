@@ -0,0 +1,209 @@
+from datetime import datetime
+import numpy as np
+
+# Households scored per dense block; bounds memory at chunk x n_recipes floats.
+HOUSEHOLD_CHUNK = 1024
+
+
+class HouseholdPantries:
+    """
+    Pantry snapshots of many households as FEFO-sorted lot arrays over the
+    engine's product columns.
+
+    Lots are ordered by (household, product column, expiration), so every
+    household owns the lot range lot_indptr[h]:lot_indptr[h+1] and, inside it,
+    one segment per product it has on hand. Segment e covers lots
+    entry_lo[e]:entry_hi[e] of product column entry_cols[e]; household h owns
+    segments entry_indptr[h]:entry_indptr[h+1]. Each lot keeps its `amount`
+    and per-unit `urgency` (multiplier / hours remaining), so a recipe draws
+    from the soonest-expiring lots first, exactly as in the single-pantry
+    engine.
+    """
+
+    def __init__(self, household_ids, lot_indptr, amount, urgency, entry_indptr, entry_cols, entry_lo, entry_hi):
+        self.household_ids = np.asarray(household_ids, dtype=np.int64)
+        self.lot_indptr = np.asarray(lot_indptr, dtype=np.int64)
+        self.amount = np.asarray(amount, dtype=np.float64)
+        self.urgency = np.asarray(urgency, dtype=np.float64)
+        self.entry_indptr = np.asarray(entry_indptr, dtype=np.int64)
+        self.entry_cols = np.asarray(entry_cols, dtype=np.int64)
+        self.entry_lo = np.asarray(entry_lo, dtype=np.int64)
+        self.entry_hi = np.asarray(entry_hi, dtype=np.int64)
+
+    @property
+    def n_households(self):
+        return len(self.household_ids)
+
+    @property
+    def entry_rows(self):
+        """Household row of every product segment."""
+        return np.repeat(np.arange(self.n_households), np.diff(self.entry_indptr))
+
+    def slice(self, start, end):
+        """Households start:end as a new HouseholdPantries (lots and segments are views)."""
+        lo, hi = self.lot_indptr[start], self.lot_indptr[end]
+        e_lo, e_hi = self.entry_indptr[start], self.entry_indptr[end]
+        return HouseholdPantries(
+            self.household_ids[start:end],
+            self.lot_indptr[start:end + 1] - lo,
+            self.amount[lo:hi],
+            self.urgency[lo:hi],
+            self.entry_indptr[start:end + 1] - e_lo,
+            self.entry_cols[e_lo:e_hi],
+            self.entry_lo[e_lo:e_hi] - lo,
+            self.entry_hi[e_lo:e_hi] - lo,
+        )
+
+    @classmethod
+    def from_lots(cls, engine, catalog, household_ids, product_ids, amounts, expirations, now=None):
+        """
+        Build the snapshot from flat pantry lots (one entry per lot, like
+        rows of the pantry table tagged with a household).
+
+        Lots without an expiration date, already expired or for products no
+        recipe uses are dropped, as in `calculate_item_scores`. Lots of one
+        product stay separate and are sorted by expiration (ties in input
+        order), like the FEFO lot arrays of `RecipeScoringEngine`.
+        """
+        now = now or datetime.now()
+        hids = np.asarray(household_ids, dtype=np.int64)
+        pids = np.asarray(product_ids, dtype=np.int64)
+        amount = np.array([a or 0 for a in amounts], dtype=np.float64)
+        exp = np.asarray(expirations)
+        if exp.dtype.kind != "M":
+            exp = np.array(
+                [np.datetime64("NaT") if e is None else e for e in expirations],
+                dtype="datetime64[us]",
+            )
+        exp = exp.astype("datetime64[us]")
+
+        seconds = (exp - np.datetime64(now, "us")) / np.timedelta64(1, "s")
+        keep = ~np.isnat(exp) & (seconds >= 0)
+
+        n_cols = len(engine.product_ids)
+        cols = np.minimum(np.searchsorted(engine.product_ids, pids), max(n_cols - 1, 0))
+        if n_cols:
+            keep &= engine.product_ids[cols] == pids
+        else:
+            keep[:] = False
+
+        household_ids, household_row = np.unique(hids, return_inverse=True)
+        amount = np.maximum(amount, 0)
+
+        live = keep & (amount > 0) & (seconds > 0)
+        hours = np.where(live, seconds, 1.0) / 3600
+        unit = np.where(live, catalog.multipliers_for(pids) / hours, 0.0)
+
+        # FEFO order per (household, product); lexsort is stable
+        rows, cols, seconds = household_row[keep], cols[keep], seconds[keep]
+        order = np.lexsort((seconds, cols, rows))
+        rows, cols = rows[order], cols[order]
+        amount, unit = amount[keep][order], unit[keep][order]
+
+        lot_indptr = np.zeros(len(household_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(household_ids)), out=lot_indptr[1:])
+
+        # One segment per run of equal (household, product)
+        new_run = np.ones(len(rows), dtype=bool)
+        new_run[1:] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+        entry_lo = np.flatnonzero(new_run)
+        entry_hi = np.append(entry_lo[1:], len(rows)).astype(np.int64)
+
+        entry_indptr = np.zeros(len(household_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows[entry_lo], minlength=len(household_ids)), out=entry_indptr[1:])
+
+        return cls(household_ids, lot_indptr, amount, unit, entry_indptr, cols[entry_lo], entry_lo, entry_hi)
+
+
+class BatchRecommender:
+    """
+    Top-k recipes for many households at once.
+
+    Only (household, ingredient) pairs where the household has the
+    ingredient's product can score, so they are gathered from the engine's
+    product -> ingredient index without touching any other pair. Every pair
+    is then allocated FEFO over the household's lots of that product with
+    the engine's own segment kernels (allocate_segments /
+    evaluate_segments), and the results are summed per (household, recipe).
+    Scores, matched and missing counts are therefore the same as
+    `RecipeScoringEngine.score_all` on each household's pantry alone.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.ingredient_counts = np.diff(engine.requirements.indptr)
+
+    def _pairs(self, pantries):
+        """(household row, ingredient) for every product segment x ingredient using its product, plus the segment."""
+        engine = self.engine
+        lo = engine.product_indptr[pantries.entry_cols]
+        lens = engine.product_indptr[pantries.entry_cols + 1] - lo
+
+        entry = np.repeat(np.arange(len(pantries.entry_cols)), lens)
+        offsets = np.repeat(lo - np.cumsum(lens) + lens, lens)
+        ing = engine.ingredients_by_product[np.arange(lens.sum()) + offsets]
+        return pantries.entry_rows[entry], ing, entry
+
+    def score(self, pantries):
+        """
+        Score every recipe for every household in `pantries`.
+
+        Returns dense (households x recipes) arrays: score, matched, missing.
+        """
+        engine = self.engine
+        n_h, n_r = pantries.n_households, engine.n_recipes
+
+        household, ing, entry = self._pairs(pantries)
+        lo, hi = pantries.entry_lo[entry], pantries.entry_hi[entry]
+        has_lots, short, k, rem = engine.allocate_segments(lo, hi, engine.ing_needed[ing], pantries.amount)
+        ing_score = engine.evaluate_segments(lo, k, rem, pantries.urgency, pantries.amount)
+
+        flat = household * n_r + engine.ing_row[ing]
+        size = n_h * n_r
+        score = np.bincount(flat, weights=ing_score, minlength=size).reshape(n_h, n_r)
+        matched = np.bincount(flat, weights=has_lots, minlength=size).reshape(n_h, n_r).astype(np.int64)
+        shorts = np.bincount(flat, weights=short, minlength=size).reshape(n_h, n_r).astype(np.int64)
+
+        missing = self.ingredient_counts[None, :] - matched + shorts
+        return {"score": score, "matched": matched, "missing": missing}
+
+    def top_k(self, pantries, limit=5, max_missing=1, chunk=HOUSEHOLD_CHUNK):
+        """
+        Best `limit` recipes per household with the recommender filters
+        (matched > 0, missing <= max_missing, score rounded to 3 places > 0).
+        Ties keep recipe_id order. Households are scored `chunk` at a time.
+
+        Returns flat arrays (household_id, recipe_id, rank, score), ordered by
+        household and rank.
+        """
+        engine = self.engine
+        out_h, out_r, out_rank, out_s = [], [], [], []
+
+        for start in range(0, pantries.n_households, chunk):
+            part = pantries.slice(start, min(start + chunk, pantries.n_households))
+            batch = self.score(part)
+
+            rounded = np.round(batch["score"], 3)
+            keep = (batch["matched"] > 0) & (batch["missing"] <= max_missing) & (rounded > 0)
+            rounded[~keep] = -np.inf
+
+            # Stable descending sort, so equal scores stay in recipe_id order
+            order = np.argsort(-rounded, axis=1, kind="stable")[:, :limit]
+            best = np.take_along_axis(rounded, order, axis=1)
+            valid = np.isfinite(best)
+
+            h, rank = np.nonzero(valid)
+            out_h.append(part.household_ids[h])
+            out_r.append(engine.recipe_ids[order[valid]])
+            out_rank.append(rank)
+            out_s.append(best[valid])
+
+        if not out_h:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, empty, np.zeros(0)
+        return (
+            np.concatenate(out_h),
+            np.concatenate(out_r),
+            np.concatenate(out_rank),
+            np.concatenate(out_s),
+        )
@@ -0,0 +1,103 @@
+import numpy as np
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+from database.tables import TJInventory
+
+# Bumped whenever a TJInventory row is written through the ORM, so the cached
+# catalog is dropped even if an edit leaves the table fingerprint unchanged.
+_catalog_version = 0
+_CATALOG_CACHE = {}
+
+
+def _bump_catalog_version(*_):
+    global _catalog_version
+    _catalog_version += 1
+
+
+for _evt in ("after_insert", "after_update", "after_delete"):
+    event.listen(TJInventory, _evt, _bump_catalog_version)
+
+
+class ProductCatalog:
+    """
+    product_id -> waste multiplier lookup built from tj_inventory in one query.
+
+    Multipliers come from CATEGORY_MULTIPLIERS keyed on sub_category, falling
+    back to category and then to "other", the same rule as
+    `RecipeRecommender._compute_waste_score`.
+    """
+
+    def __init__(self, product_ids, categories, category_multipliers):
+        order = np.argsort(product_ids)
+        self.product_ids = np.asarray(product_ids, dtype=np.int64)[order]
+        self.categories = [categories[i] for i in order]
+
+        default = category_multipliers["other"]
+        self.multipliers = np.array(
+            [category_multipliers.get(c, default) for c in self.categories],
+            dtype=np.float64,
+        )
+        self.default_multiplier = float(default)
+
+    @classmethod
+    def from_session(cls, session: Session, category_multipliers):
+        rows = session.query(
+            TJInventory.product_id,
+            TJInventory.sub_category,
+            TJInventory.category,
+        ).all()
+
+        product_ids = [r.product_id for r in rows]
+        categories = [(r.sub_category or r.category or "").lower() for r in rows]
+        return cls(product_ids, categories, category_multipliers)
+
+    def multipliers_for(self, product_ids):
+        """Vectorized multiplier lookup; unknown products get the "other" multiplier."""
+        pids = np.asarray(product_ids, dtype=np.int64)
+        out = np.full(pids.shape, self.default_multiplier, dtype=np.float64)
+        if not len(self.product_ids) or not pids.size:
+            return out
+
+        idx = np.minimum(np.searchsorted(self.product_ids, pids), len(self.product_ids) - 1)
+        found = self.product_ids[idx] == pids
+        out[found] = self.multipliers[idx[found]]
+        return out
+
+
+def catalog_fingerprint(session: Session):
+    """Cheap aggregate over tj_inventory that changes when products are added, removed or recategorized."""
+    return tuple(
+        session.query(
+            func.count(TJInventory.product_id),
+            func.max(TJInventory.product_id),
+            func.sum(func.length(TJInventory.category)),
+            func.sum(func.length(TJInventory.sub_category)),
+        ).one()
+    )
+
+
+def get_product_catalog(session: Session, category_multipliers):
+    """
+    Return the cached ProductCatalog for this database, rebuilding it only
+    when the catalog fingerprint, the ORM write counter or the multiplier
+    table changed.
+    """
+    key = str(session.get_bind().url)
+    version = (
+        _catalog_version,
+        catalog_fingerprint(session),
+        tuple(sorted(category_multipliers.items())),
+    )
+
+    cached = _CATALOG_CACHE.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    catalog = ProductCatalog.from_session(session, category_multipliers)
+    _CATALOG_CACHE[key] = (version, catalog)
+    return catalog
+
+
+def invalidate_product_catalog():
+    """Drop every cached catalog (e.g. after bulk pipeline writes to tj_inventory)."""
+    _CATALOG_CACHE.clear()
@@ -0,0 +1,347 @@
+import numpy as np
+from datetime import datetime, timedelta
+from recommender_system.meal_slots import MEAL_SLOTS, SLOT_KEYWORDS
+
+
+
+def recipe_lot_layout(indptr, ing_col, ing_needed, seg_start, seg_end, row):
+    """
+    Lot positions recipe `row` can draw from, grouped per product, and the
+    total amount it needs of each product. FEFO-consuming two ingredients of
+    the same product one after the other equals consuming their sum, so
+    duplicates are merged. Returns (idx, group, starts, needed, cols).
+    """
+    cols = ing_col[indptr[row]:indptr[row + 1]]
+    needed = ing_needed[indptr[row]:indptr[row + 1]]
+    wanted = needed > 0
+
+    cols, inverse = np.unique(cols[wanted], return_inverse=True)
+    needed = np.bincount(inverse, weights=needed[wanted], minlength=len(cols))
+
+    lo, hi = seg_start[cols], seg_end[cols]
+    lens = hi - lo
+    starts = np.cumsum(lens) - lens
+    idx = np.arange(lens.sum()) + np.repeat(lo - starts, lens)
+    group = np.repeat(np.arange(len(cols)), lens)
+    return idx, group, starts, needed, cols
+
+
+def fefo_take(amount, layout):
+    """
+    What one recipe (a recipe_lot_layout) would take FEFO from the lot
+    `amount` vector: the amount taken from each lot in layout[0] and the
+    shortfall per product. `amount` is not modified.
+    """
+    idx, group, starts, needed, _ = layout
+    if not len(idx):
+        return np.zeros(0), needed.copy()
+
+    avail = amount[idx]
+    cum = np.cumsum(avail)
+    before = cum - avail - (cum - avail)[starts[group]]
+    taken = np.minimum(avail, np.maximum(needed[group] - before, 0))
+
+    have = np.bincount(group, weights=avail, minlength=len(needed))
+    return taken, np.maximum(needed - have, 0)
+
+
+def consume_fefo(amount, layout):
+    """Like fefo_take, but also removes the taken amounts from `amount` in place."""
+    taken, short = fefo_take(amount, layout)
+    amount[layout[0]] -= taken
+    return taken, short
+
+
+class PantryLots:
+    """
+    A pantry snapshot as FEFO-sorted lot arrays on the scoring engine's
+    product columns: `cols`, `exp` (timestamps), `amount` and `mult` (the
+    category multiplier of each lot), plus the per-product segments.
+    Lots of products no recipe uses are kept aside, since they can only be
+    trashed.
+    """
+
+    def __init__(self, engine, cols, exp, amount, mult, now, unusable_exp=None, unusable_weight=None):
+        self.engine = engine
+        self.cols = cols
+        self.exp = exp
+        self.amount = amount
+        self.mult = mult
+        self.now = now
+        self.unusable_exp = np.zeros(0) if unusable_exp is None else unusable_exp
+        self.unusable_weight = np.zeros(0) if unusable_weight is None else unusable_weight
+        self.seg_start, self.seg_end = engine.segments(cols)
+        self._layouts = {}
+
+    @classmethod
+    def from_items(cls, engine, items, catalog, now=None):
+        """
+        Build lots from pantry-item dicts (product_id, amount,
+        expiration_date), as returned by PantryManager.get_all_items or
+        import_state. Items without a date or already expired are ignored.
+        """
+        now = now or datetime.now()
+        now_ts = now.timestamp()
+
+        pids, amounts, exps = [], [], []
+        for item in items:
+            exp = item.get("expiration_date")
+            if exp is None:
+                continue
+            if not isinstance(exp, datetime):
+                exp = datetime.combine(exp, datetime.min.time())
+            if exp.timestamp() <= now_ts:
+                continue
+            pids.append(item["product_id"])
+            amounts.append(max(item.get("amount") or 0, 0))
+            exps.append(exp.timestamp())
+
+        pids = np.array(pids, dtype=np.int64)
+        amounts = np.array(amounts, dtype=np.float64)
+        exps = np.array(exps, dtype=np.float64)
+        mult = catalog.multipliers_for(pids) if len(pids) else np.zeros(0)
+
+        if len(engine.product_ids) and len(pids):
+            cols = np.minimum(np.searchsorted(engine.product_ids, pids), len(engine.product_ids) - 1)
+            known = engine.product_ids[cols] == pids
+        else:
+            cols = np.zeros(len(pids), dtype=np.int64)
+            known = np.zeros(len(pids), dtype=bool)
+
+        unusable_exp, unusable_weight = exps[~known], (amounts * mult)[~known]
+
+        cols, exps, amounts, mult = cols[known], exps[known], amounts[known], mult[known]
+        order = np.lexsort((exps, cols))
+
+        return cls(
+            engine,
+            cols[order],
+            exps[order],
+            amounts[order],
+            mult[order],
+            now,
+            unusable_exp,
+            unusable_weight,
+        )
+
+    def unusable_waste(self, end_ts):
+        """Weighted amount of unusable lots that expire by `end_ts`."""
+        return float(self.unusable_weight[self.unusable_exp <= end_ts].sum())
+
+    def layout(self, row):
+        """recipe_lot_layout of engine row `row` on these lots (memoized)."""
+        layout = self._layouts.get(row)
+        if layout is None:
+            engine = self.engine
+            layout = recipe_lot_layout(
+                engine.requirements.indptr, engine.ing_col, engine.ing_needed,
+                self.seg_start, self.seg_end, row,
+            )
+            self._layouts[row] = layout
+        return layout
+
+
+class _PlanState:
+    """One partial plan in the beam: remaining lot amounts plus what it has cooked so far."""
+
+    __slots__ = ("amount", "used", "plan", "waste", "averted")
+
+    def __init__(self, amount, used, plan, waste, averted):
+        self.amount = amount
+        self.used = used
+        self.plan = plan
+        self.waste = waste
+        self.averted = averted
+
+
+class HorizonPlanner:
+    """
+    Whole-plan optimizer for a multi-day horizon.
+
+    The pantry is a vector of FEFO-sorted lots (one segment per product
+    column of the scoring engine). A plan is simulated slot by slot: lots
+    are trashed once they pass their expiration date, and a cooked recipe
+    consumes its ingredients FEFO. Projected waste is the leftover amount of
+    every lot expiring inside the horizon, weighted by its category
+    multiplier, so the plan with the most weighted in-horizon consumption
+    wastes the least.
+
+    The search is a beam search over the slots in chronological order. For
+    each partial plan the candidate recipes of a slot are evaluated in one
+    vectorized allocation; the `branch` most urgent ones are expanded and the
+    `beam_width` best plans are kept (least waste committed by the end of
+    the day, then most waste averted).
+    """
+
+    def __init__(self, lots, max_missing=1, beam_width=4, branch=6):
+        self.lots = lots
+        self.engine = engine = lots.engine
+        self.cols, self.exp, self.amount, self.mult = lots.cols, lots.exp, lots.amount, lots.mult
+        self.seg_start, self.seg_end = lots.seg_start, lots.seg_end
+        self.now = lots.now
+        self.max_missing = max_missing
+        self.beam_width = beam_width
+        self.branch = branch
+
+        keyword_masks = {
+            slot: np.logical_or.reduce([engine.category_mask(k) for k in keywords])
+            for slot, keywords in SLOT_KEYWORDS.items()
+        }
+        uncategorized = ~np.logical_or.reduce(list(keyword_masks.values()))
+        self._slot_masks = {slot: mask | uncategorized for slot, mask in keyword_masks.items()}
+        self._uncategorized = uncategorized
+
+    @classmethod
+    def from_items(cls, engine, items, catalog, now=None, **kwargs):
+        """Build a planner from pantry-item dicts; see PantryLots.from_items."""
+        return cls(PantryLots.from_items(engine, items, catalog, now), **kwargs)
+
+    def plan(self, days=14, slots=None, occupied=None):
+        """
+        Search for the schedule with the least projected waste.
+
+        `occupied` is a set of (date string, slot) pairs that are already
+        taken and left alone. Returns:
+            {
+                "schedule": [{planned_for, meal_slot, recipe_id, title, averted}],
+                "projected_waste": waste left with the schedule,
+                "baseline_waste": waste if nothing is cooked,
+            }
+        """
+        slots = list(MEAL_SLOTS if slots is None else slots)
+        occupied = occupied or set()
+
+        today = datetime.combine(self.now.date(), datetime.min.time())
+        horizon_end = (today + timedelta(days=days)).timestamp()
+        window = self.exp <= horizon_end
+        self._weight = self.mult * window
+
+        beam = [_PlanState(
+            self.amount.copy(),
+            np.zeros(self.engine.n_recipes, dtype=bool),
+            [],
+            0.0,
+            0.0,
+        )]
+
+        for d in range(days):
+            day = today + timedelta(days=d)
+            t = self.now.timestamp() if d == 0 else day.timestamp()
+            # Lots trashed at the next day boundary unless cooked today
+            expiring = self.exp <= (day + timedelta(days=1)).timestamp()
+            beam = [self._advance(state, t) for state in beam]
+
+            for slot in slots:
+                if (str(day.date()), slot) in occupied:
+                    continue
+                beam = self._step(beam, self._slot_mask(slot), t, expiring, (str(day.date()), slot))
+
+        beam = [self._advance(state, horizon_end) for state in beam]
+        best = min(beam, key=lambda s: (s.waste, -s.averted))
+
+        baseline = float((self.amount * self._weight).sum()) + self.lots.unusable_waste(horizon_end)
+        return {
+            "schedule": [
+                {
+                    "planned_for": planned_for,
+                    "meal_slot": slot,
+                    "recipe_id": int(self.engine.recipe_ids[row]),
+                    "title": self.engine.titles[row],
+                    "averted": round(averted, 3),
+                }
+                for planned_for, slot, row, averted in best.plan
+            ],
+            "projected_waste": round(max(baseline - best.averted, 0.0), 3),
+            "baseline_waste": round(baseline, 3),
+        }
+
+    def _slot_mask(self, slot):
+        return self._slot_masks.get(slot, self._uncategorized)
+
+    def _advance(self, state, t):
+        """Trash every lot that expires by `t`; its leftover becomes committed waste."""
+        expired = (self.exp <= t) & (state.amount > 0)
+        if not expired.any():
+            return state
+        amount = state.amount.copy()
+        waste = state.waste + float((amount[expired] * self._weight[expired]).sum())
+        amount[expired] = 0
+        return _PlanState(amount, state.used, state.plan, waste, state.averted)
+
+    def _step(self, beam, slot_mask, t, expiring, key):
+        """
+        Expand every plan in the beam by one slot and keep the best
+        `beam_width`: least waste committed so far plus waste that will be
+        committed at the next day boundary, then most waste averted.
+        Plans that cook the same set of recipes are ranked first and only
+        the best placement of each set is kept.
+        """
+        children = []
+        for state in beam:
+            expansions = [state] + [self._cook(state, row, key) for row in self._candidates(state, slot_mask, t)]
+            for child in expansions:
+                at_risk = float((child.amount[expiring] * self._weight[expiring]).sum())
+                children.append((child.waste + at_risk, -child.averted, len(children), child))
+
+        children.sort(key=lambda c: c[:3])
+        kept, seen = [], set()
+        for *_, child in children:
+            signature = frozenset(r for _, _, r, _ in child.plan)
+            if signature in seen:
+                continue
+            seen.add(signature)
+            kept.append(child)
+            if len(kept) == self.beam_width:
+                break
+        return kept
+
+    def _candidates(self, state, slot_mask, t):
+        """
+        Rows of the `branch` most urgent recipes that fit the slot, were not
+        cooked yet, pass max_missing and avert some waste.
+        """
+        engine = self.engine
+        amount = state.amount
+
+        keep = slot_mask & ~state.used
+        if self.max_missing is not None:
+            keep &= engine.feasible(engine.pantry_bits(self.cols[amount > 0]), self.max_missing)
+        rows = np.flatnonzero(keep)
+        if not len(rows):
+            return []
+
+        ing, local = engine.ingredients_of_rows(rows)
+        _, short, k, rem = engine.allocate(ing, self.seg_start, self.seg_end, amount)
+
+        cum_amount = np.concatenate(([0.0], np.cumsum(amount)))
+        col = engine.ing_col[ing]
+        has_stock = (cum_amount[self.seg_end[col]] - cum_amount[self.seg_start[col]]) > 0
+
+        hours = np.where(self.exp > t, (self.exp - t) / 3600, 1.0)
+        averted = engine.evaluate(self.seg_start, k, rem, self._weight, amount, ing)
+        urgency = engine.evaluate(self.seg_start, k, rem, self._weight / hours, amount, ing)
+
+        n = len(rows)
+        averted = np.bincount(local, weights=averted, minlength=n)
+        urgency = np.bincount(local, weights=urgency, minlength=n)
+        matched = np.bincount(local, weights=has_stock, minlength=n)
+        missing = np.bincount(local, weights=~has_stock | short, minlength=n)
+
+        ok = (matched > 0) & (averted > 1e-9)
+        if self.max_missing is not None:
+            ok &= missing <= self.max_missing
+        idx = np.flatnonzero(ok)
+        idx = idx[np.argsort(-urgency[idx], kind="stable")[:self.branch]]
+        return rows[idx].tolist()
+
+    def _cook(self, state, row, key):
+        """Apply recipe `row` FEFO, the same consumption as _apply_recipe_to_virtual_state."""
+        layout = self.lots.layout(row)
+        amount = state.amount.copy()
+        taken, _ = consume_fefo(amount, layout)
+        averted = float((taken * self._weight[layout[0]]).sum())
+
+        used = state.used.copy()
+        used[row] = True
+        plan = state.plan + [(key[0], key[1], row, averted)]
+        return _PlanState(amount, used, plan, state.waste, state.averted + averted)
@@ -0,0 +1,32 @@
+MEAL_SLOTS = ["Breakfast", "Lunch", "Dinner", "Snack", "Dessert", "Beverage"]
+
+# Hour of day each slot is cooked at, for scoring lots against their expiry
+SLOT_HOURS = {
+    "Breakfast": 8,
+    "Lunch": 12,
+    "Dinner": 18,
+    "Snack": 15,
+    "Dessert": 20,
+    "Beverage": 17,
+}
+
+# Category keywords that make a recipe eligible for each meal slot. Recipes
+# matching none of them fit every slot.
+SLOT_KEYWORDS = {
+    "Breakfast": ["breakfast"],
+    "Lunch": ["lunch"],
+    "Dinner": ["dinner"],
+    "Snack": ["appetizer", "side", "snack"],
+    "Dessert": ["dessert"],
+    "Beverage": ["beverage", "drink", "cocktail"],
+}
+
+
+def allowed_slots(category):
+    """Meal slots (in MEAL_SLOTS order) a recipe with this category label can be planned in."""
+    category = (category or "").lower()
+    slots = [
+        slot for slot in MEAL_SLOTS
+        if any(keyword in category for keyword in SLOT_KEYWORDS[slot])
+    ]
+    return slots or list(MEAL_SLOTS)
@@ -0,0 +1,178 @@
+import hashlib
+import json
+import os
+import threading
+import numpy as np
+from scipy.sparse import csr_matrix
+from sqlalchemy.orm import Session
+from recommender_system.requirements_artifact import artifact_dir_for, write_atomic
+
+# Bump when the on-disk layout or the similarity definition changes.
+OVERLAP_VERSION = 1
+
+# Neighbours kept per recipe; complementary() can return at most this many.
+OVERLAP_TOP_K = 50
+
+# Products whose waste multiplier is above this count as perishable.
+PERISHABLE_MIN_MULTIPLIER = 1.0
+
+# Recipe rows per sparse product, bounding the size of each intermediate.
+CHUNK_ROWS = 2048
+
+MANIFEST_FILE = "overlap_manifest.json"
+ARRAY_FILES = ("overlap_indptr", "overlap_indices", "overlap_similarity")
+
+_LOADED = {}
+# Serializes index builds and loads between the pages and the background worker.
+_BUILD_LOCK = threading.RLock()
+
+
+class OverlapIndex:
+    """
+    Recipe -> most similar recipes by shared perishable products.
+
+    Row r lists its neighbours (engine rows) in indices[indptr[r]:indptr[r+1]],
+    sorted by descending similarity, so the best k are a slice.
+    """
+
+    def __init__(self, indptr, indices, similarity, checksum):
+        self.indptr = indptr
+        self.indices = indices
+        self.similarity = similarity
+        self.checksum = checksum
+
+    def neighbors(self, row, k):
+        """(rows, similarities) of the `k` most similar recipes to `row`."""
+        start = int(self.indptr[row])
+        end = min(int(self.indptr[row + 1]), start + max(k, 0))
+        return self.indices[start:end], self.similarity[start:end]
+
+
+def perishable_weights(engine, catalog):
+    """Per engine product column: its waste multiplier when perishable, else 0."""
+    mult = catalog.multipliers_for(engine.product_ids)
+    return np.where(mult > PERISHABLE_MIN_MULTIPLIER, mult, 0.0)
+
+
+def overlap_checksum(engine, weights):
+    """Ties a stored index to the recipe requirements and the perishable weights it was built from."""
+    digest = hashlib.sha1()
+    digest.update(repr((OVERLAP_VERSION, OVERLAP_TOP_K, engine.version)).encode())
+    digest.update(np.ascontiguousarray(weights, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
+def compute_overlap_index(engine, weights, top_k=OVERLAP_TOP_K, checksum=None):
+    """
+    Weighted Jaccard similarity over perishable products for every recipe
+    pair that shares one:
+
+        sim(a, b) = w(A & B) / (w(A) + w(B) - w(A & B))
+
+    The intersections are the sparse product X W X^T of the binary
+    recipe x product matrix, computed in row chunks; only the `top_k` best
+    neighbours of each recipe are kept (ties in recipe_id order).
+    """
+    n = engine.n_recipes
+    n_cols = len(engine.product_ids)
+
+    perishable = weights[engine.ing_col] > 0
+    x = csr_matrix(
+        (np.ones(int(perishable.sum())), (engine.ing_row[perishable], engine.ing_col[perishable])),
+        shape=(n, n_cols),
+    )
+    # Duplicate products within a recipe count once
+    x.sum_duplicates()
+    x.data[:] = 1.0
+
+    size = x @ weights
+    xw = x.multiply(weights).tocsr()
+    xt = x.T.tocsr()
+
+    rows_out, cols_out, sims_out = [], [], []
+    for start in range(0, n, CHUNK_ROWS):
+        inter = (xw[start:start + CHUNK_ROWS] @ xt).tocoo()
+        r = inter.row.astype(np.int64) + start
+        c = inter.col.astype(np.int64)
+        shared = inter.data
+
+        keep = (r != c) & (shared > 0)
+        r, c, shared = r[keep], c[keep], shared[keep]
+        sim = shared / (size[r] + size[c] - shared)
+
+        order = np.lexsort((c, -sim, r))
+        r, c, sim = r[order], c[order], sim[order]
+        rank = np.arange(len(r)) - np.searchsorted(r, r, side="left")
+        best = rank < top_k
+
+        rows_out.append(r[best])
+        cols_out.append(c[best])
+        sims_out.append(sim[best])
+
+    rows = np.concatenate(rows_out) if rows_out else np.zeros(0, dtype=np.int64)
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+
+    return OverlapIndex(
+        indptr,
+        (np.concatenate(cols_out) if cols_out else np.zeros(0)).astype(np.int32),
+        np.concatenate(sims_out) if sims_out else np.zeros(0),
+        checksum or overlap_checksum(engine, weights),
+    )
+
+
+def build_overlap_index(session: Session, engine, catalog, directory=None):
+    """Compute the index and store it next to the requirements artifact (manifest written last)."""
+    directory = directory or artifact_dir_for(session)
+    with _BUILD_LOCK:
+        weights = perishable_weights(engine, catalog)
+        index = compute_overlap_index(engine, weights)
+        os.makedirs(directory, exist_ok=True)
+
+        for name, arr in zip(ARRAY_FILES, (index.indptr, index.indices, index.similarity)):
+            write_atomic(directory, f"{name}.npy", lambda f: np.save(f, arr))
+
+        manifest = {"version": OVERLAP_VERSION, "checksum": index.checksum, "top_k": OVERLAP_TOP_K}
+        write_atomic(directory, MANIFEST_FILE, lambda f: f.write(json.dumps(manifest).encode("utf-8")))
+
+        _LOADED[str(directory)] = index
+    return index
+
+
+def load_overlap_index(session: Session, engine, catalog, directory=None):
+    """
+    Return the overlap index for the current recipes and catalog, memory
+    mapped from disk. It is rebuilt when missing or stale, and computed in
+    memory when the directory cannot be written.
+    """
+    directory = directory or artifact_dir_for(session)
+    checksum = overlap_checksum(engine, perishable_weights(engine, catalog))
+
+    loaded = _LOADED.get(str(directory))
+    if loaded is not None and loaded.checksum == checksum:
+        return loaded
+
+    with _BUILD_LOCK:
+        loaded = _LOADED.get(str(directory))
+        if loaded is not None and loaded.checksum == checksum:
+            return loaded
+
+        try:
+            with open(os.path.join(directory, MANIFEST_FILE), encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = None
+
+        if not manifest or manifest.get("checksum") != checksum:
+            try:
+                return build_overlap_index(session, engine, catalog, directory)
+            except OSError:
+                return compute_overlap_index(engine, perishable_weights(engine, catalog), checksum=checksum)
+
+        try:
+            arrays = [np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r") for name in ARRAY_FILES]
+        except (OSError, ValueError):
+            return compute_overlap_index(engine, perishable_weights(engine, catalog), checksum=checksum)
+        index = OverlapIndex(*arrays, checksum)
+        _LOADED[str(directory)] = index
+    return index
@@ -1,7 +1,18 @@
 from sqlalchemy.orm import Session
 from services.pantry_manager import PantryManager
-from database.tables import Recipe, PantryItem, TJInventory
-from datetime import datetime
+from database.tables import Recipe, Ingredient, PantryItem, TJInventory
+from recommender_system.scoring_engine import get_scoring_engine
+from recommender_system.score_cache import get_score_cache
+from recommender_system.scoring_context import get_scoring_context
+from recommender_system.result_cache import LRUResultCache, state_fingerprint, time_bucket
+from recommender_system.horizon_planner import HorizonPlanner, PantryLots
+from recommender_system.meal_slots import MEAL_SLOTS
+from recommender_system.shelf_clearer import clear_expiring_shelf
+from recommender_system.scenario_simulator import ScenarioSimulator
+from recommender_system.overlap_index import load_overlap_index
+from recommender_system.virtual_pantry import VirtualPantry
+from datetime import datetime, timedelta
+import numpy as np
 import streamlit as st
 
 CATEGORY_MULTIPLIERS = {
@@ -21,27 +32,82 @@ CATEGORY_MULTIPLIERS = {
     "other": 1.0
 }
 
+# Ranked lists shared by every RecipeRecommender in the process, keyed on the
+# pantry state, so Streamlit reruns with an unchanged pantry skip scoring.
+_RESULT_CACHE = LRUResultCache(max_entries=256)
+
 class RecipeRecommender:
 
-    def __init__(self, session: Session):
+    def __init__(self, session: Session, context=None):
+        """
+        `context` pins a ScoringContext, so every call scores the same
+        snapshot (e.g. a background job). Without one, each call scores the
+        current snapshot of the session's database.
+        """
         self.session = session
         self.pm = PantryManager(session)
+        self._context = context
+        self._engine = None
+
+    @property
+    def context(self):
+        """The pinned ScoringContext, or the current one for this database."""
+        if self._context is not None:
+            return self._context
+        return get_scoring_context(self.session, CATEGORY_MULTIPLIERS)
+
+    @property
+    def engine(self):
+        """Batch scoring engine, shared across reruns until the recipe/ingredient tables change."""
+        if self._context is not None:
+            return self._context.engine
+        if self._engine is None:
+            self._engine = get_scoring_engine(self.session)
+        return self._engine
+
+    def _items(self, ctx, virtual_pantry_state):
+        """Pantry-item dicts of the snapshot's real pantry, or of a virtual pantry state."""
+        if virtual_pantry_state is None:
+            return ctx.items()
+        return self.pm.import_state(virtual_pantry_state)
+
+    def _score_batch(self, ctx, virtual_pantry_state=None, max_missing=None):
+        """
+        Score every recipe. The real pantry is served from the incremental
+        score cache; a virtual pantry is scored from scratch. Recipes that
+        cannot meet `max_missing` are dropped by the bitset filter first.
+        Returns the batch.
+        """
+        if virtual_pantry_state is None:
+            return get_score_cache(ctx).scores(ctx, max_missing=max_missing)
+
+        item_scores = self.calculate_item_scores(virtual_pantry_state, context=ctx)
+        return ctx.engine.score_all(item_scores, max_missing=max_missing)
 
-    def calculate_item_scores(self, virtual_state=None):
+    def _prepared_lots(self, ctx, virtual_pantry_state):
+        """Lots in engine.prepare_lots form: the warm score cache for the real pantry."""
+        if virtual_pantry_state is None:
+            return get_score_cache(ctx).refreshed_lots(ctx)
+        return ctx.engine.prepare_lots(self.calculate_item_scores(virtual_pantry_state, context=ctx))
+
+    def _state_key(self, ctx, virtual_pantry_state):
+        if virtual_pantry_state is None:
+            return ctx.pantry_key
+        return state_fingerprint(virtual_pantry_state)
+
+    def calculate_item_scores(self, virtual_state=None, context=None):
         """
         Returns list of:
             { product_id, amount, expiration_date, per_unit_score }
         """
 
+        ctx = context or self.context
         now = datetime.now()
 
         # Load either the real pantry or the virtual pantry (FEFO list)
-        if virtual_state is None:
-            items = self.pm.get_all_items()
-        else:
-            items = self.pm.import_state(virtual_state)
+        items = self._items(ctx, virtual_state)
 
-        scored = []
+        kept = []
         for item in items:
 
             exp = item.get("expiration_date")
@@ -59,16 +125,28 @@ class RecipeRecommender:
             if exp_dt < now:
                 continue
 
-            per_unit = self._compute_waste_score(item)
+            kept.append((item, exp_dt))
+
+        if not kept:
+            return []
+
+        per_unit = self._compute_waste_scores(
+            [item["product_id"] for item, _ in kept],
+            [item.get("amount", 0) for item, _ in kept],
+            [exp_dt for _, exp_dt in kept],
+            now,
+            ctx.catalog,
+        )
 
-            scored.append({
+        return [
+            {
                 "product_id": item["product_id"],
                 "expiration_date": exp_dt,
                 "amount": item["amount"],
-                "per_unit_score": per_unit,
-            })
-
-        return scored
+                "per_unit_score": float(score),
+            }
+            for (item, exp_dt), score in zip(kept, per_unit)
+        ]
 
 
 
@@ -133,71 +211,348 @@ class RecipeRecommender:
         }
 
     def recommend_recipes(self, limit=5, max_missing=1, virtual_pantry_state=None):
-        item_scores = self.calculate_item_scores(virtual_pantry_state)
-        recipes = self.session.query(Recipe).all()
+        return self._ranked([None], limit, max_missing, virtual_pantry_state)[0]
+    
+    def recommend_by_category(self, category, limit=5, max_missing=1, virtual_pantry_state=None):
+        return self._ranked([category], limit, max_missing, virtual_pantry_state)[0]
 
-        scored = [
-            self.score_recipe(r, item_scores, virtual_pantry_state)
-            for r in recipes
-        ]
+    def recommend_all_categories(self, categories, limit=5, max_missing=1, virtual_pantry_state=None):
+        """
+        Top `limit` recommendations for several category keywords at once.
+        The pantry is scored a single time and each category is ranked from
+        the engine's category index. Returns {category: [recommendation, ...]}.
+        """
+        categories = list(categories)
+        ranked = self._ranked(categories, limit, max_missing, virtual_pantry_state)
+        return dict(zip(categories, ranked))
 
-        scored = [s for s in scored if s["matched"] > 0]
-        scored = [s for s in scored if s["missing"] <= max_missing]
-        scored = [s for s in scored if s["score"] > 0]
-        ranked = sorted(scored, key=lambda x: x["score"], reverse=True)
+    def iter_recommendations(self, limit=5, max_missing=1, virtual_pantry_state=None, categories=(None,)):
+        """
+        Stream recommendations for progressive rendering.
+
+        Yields (category, recommendations) every time a batch of recipes,
+        taken in descending upper-bound order, changes a category's
+        provisional top `limit`. The last list yielded for a category is
+        final and equal to `recommend_by_category` (`recommend_recipes` for
+        None). Categories are produced one after the other and share exact
+        scores; a result cache hit yields the final lists straight away.
+        """
+        categories = list(categories)
+        ctx = self.context
+        engine = ctx.engine
+
+        key = (
+            self._state_key(ctx, virtual_pantry_state),
+            engine.version,
+            time_bucket(),
+            tuple(categories),
+            limit,
+            max_missing,
+        )
+        cached = _RESULT_CACHE.get(key)
+        if cached is not None:
+            for category, recs in zip(categories, cached):
+                yield category, [dict(rec) for rec in recs]
+            return
+
+        lots = self._prepared_lots(ctx, virtual_pantry_state)
+
+        memo = {}
+        final = []
+        for category in categories:
+            recs = []
+            for recs in engine.iter_top_k(
+                lots,
+                limit=limit,
+                max_missing=max_missing,
+                candidates=None if category is None else engine.category_mask(category),
+                memo=memo,
+            ):
+                yield category, [dict(rec) for rec in recs]
+            final.append(recs)
+
+        _RESULT_CACHE.put(key, final)
+
+    def _ranked(self, categories, limit, max_missing, virtual_pantry_state):
+        """
+        One ranked list per category keyword (None = all recipes), served
+        from the result cache when the pantry state, engine and time bucket
+        match a previous call.
+        """
+        ctx = self.context
+        key = (
+            self._state_key(ctx, virtual_pantry_state),
+            ctx.engine.version,
+            time_bucket(),
+            tuple(categories),
+            limit,
+            max_missing,
+        )
+        cached = _RESULT_CACHE.get(key)
+        if cached is None:
+            cached = self._ranked_uncached(ctx, categories, limit, max_missing, virtual_pantry_state)
+            _RESULT_CACHE.put(key, cached)
 
-        return ranked[:limit]
-    
-    def recommend_by_category(self, category, limit=5, max_missing=1, virtual_pantry_state=None):
+        return [[dict(rec) for rec in recs] for recs in cached]
 
-        item_scores = self.calculate_item_scores(virtual_pantry_state)
-        category = category.lower()
+    def _ranked_uncached(self, ctx, categories, limit, max_missing, virtual_pantry_state):
+        """
+        One ranked list per category keyword (None = all recipes).
 
-        recipes = [
-            r for r in self.session.query(Recipe).all()
-            if self.recipe_matches_category(r, category)
+        The real pantry comes fully scored from the incremental cache, so it
+        is simply ranked. A virtual pantry goes through the bounded top-k
+        search, with exact scores shared between the categories.
+        """
+        engine = ctx.engine
+        if virtual_pantry_state is None:
+            batch = self._score_batch(ctx, None, max_missing)
+            return [
+                engine.rank(
+                    batch,
+                    limit=limit,
+                    max_missing=max_missing,
+                    candidates=None if category is None else engine.category_mask(category),
+                )
+                for category in categories
+            ]
+
+        lots = self._prepared_lots(ctx, virtual_pantry_state)
+        memo = {}
+        return [
+            engine.top_k(
+                lots,
+                limit=limit,
+                max_missing=max_missing,
+                candidates=None if category is None else engine.category_mask(category),
+                memo=memo,
+            )
+            for category in categories
         ]
 
-        scored = [
-            self.score_recipe(r, item_scores, virtual_pantry_state)
-            for r in recipes
-        ]
+    def plan_horizon(self, days=14, slots=MEAL_SLOTS, max_missing=1, virtual_pantry_state=None,
+                     occupied=None, beam_width=4, branch=6):
+        """
+        Plan `days` days x `slots` meal slots at once, choosing the schedule
+        that leaves the least projected trash (leftover amount of lots that
+        expire inside the horizon, weighted by CATEGORY_MULTIPLIERS).
+        `occupied` holds (date string, slot) pairs that are already planned.
+        See HorizonPlanner for the search.
+        """
+        ctx = self.context
+        planner = HorizonPlanner.from_items(
+            ctx.engine,
+            self._items(ctx, virtual_pantry_state),
+            ctx.catalog,
+            max_missing=max_missing,
+            beam_width=beam_width,
+            branch=branch,
+        )
+        return planner.plan(days=days, slots=slots, occupied=occupied)
 
-        scored = [s for s in scored if s["matched"] > 0]
-        scored = [s for s in scored if s["missing"] <= max_missing]
-        scored = [s for s in scored if s["score"] > 0]
+    def score_by_day(self, days=14, virtual_pantry_state=None, recipe_ids=None, slot_hours=None):
+        """
+        Recipe x day score matrix: the waste-reduction score of cooking each
+        recipe today (now) and at the start of each of the next `days` - 1
+        days, computed in one vectorized pass (see
+        RecipeScoringEngine.score_by_day).
+
+        With `slot_hours` (hour of day per meal slot) every day is scored at
+        each slot's time instead of at midnight, never earlier than now, and
+        scores/times gain a trailing slot axis. Returns:
+            {
+                "days": [date, ...],
+                "index": {recipe_id: row in scores},
+                "scores": ndarray (recipes x days [x slots]),
+                "times": ndarray of the scored timestamps (days [x slots]),
+                "soonest_expiration": ndarray of timestamps (inf = none),
+            }
+        """
+        ctx = self.context
+        engine = ctx.engine
+        now = datetime.now()
+        lots = PantryLots.from_items(engine, self._items(ctx, virtual_pantry_state), ctx.catalog, now=now)
 
-        ranked = sorted(scored, key=lambda x: x["score"], reverse=True)
-        return ranked[:limit]
+        if recipe_ids is None:
+            rows = np.arange(engine.n_recipes)
+        else:
+            rows = np.array(
+                [engine.row_of[int(rid)] for rid in recipe_ids if int(rid) in engine.row_of],
+                dtype=np.int64,
+            )
+
+        today = datetime.combine(now.date(), datetime.min.time())
+        hours = [0] if slot_hours is None else list(slot_hours)
+        times = np.array([
+            [(today + timedelta(days=d, hours=h)).timestamp() for h in hours]
+            for d in range(days)
+        ])
+        times = np.maximum(times, now.timestamp())
+        if slot_hours is None:
+            times = times[:, 0]
+        scores, soonest = engine.score_by_day(lots, times.ravel(), rows)
 
-    def get_rationale(self, recipe_id):
-        recipe = (
-            self.session.query(Recipe)
-            .filter_by(recipe_id=recipe_id)
-            .first()
+        return {
+            "days": [(today + timedelta(days=d)).date() for d in range(days)],
+            "index": {int(rid): i for i, rid in enumerate(engine.recipe_ids[rows].tolist())},
+            "scores": scores.reshape((len(rows),) + times.shape),
+            "times": times,
+            "soonest_expiration": soonest,
+        }
+
+    def clear_expiring(self, within_days=3, max_recipes=None, max_missing=1, virtual_pantry_state=None):
+        """
+        The fewest recipes that together consume the most of what expires
+        within `within_days` (weighted by CATEGORY_MULTIPLIERS), picked by
+        lazy-greedy search; see clear_expiring_shelf.
+        """
+        ctx = self.context
+        engine = ctx.engine
+        lots = PantryLots.from_items(engine, self._items(ctx, virtual_pantry_state), ctx.catalog)
+        result = clear_expiring_shelf(
+            lots, within_days=within_days, max_recipes=max_recipes, max_missing=max_missing
         )
 
-        rationale = []
-        for ing in recipe.ingredients:
-            exp_days = None
+        expiring = result["expiring"]
+        return {
+            "recipes": [
+                {
+                    "recipe_id": int(engine.recipe_ids[row]),
+                    "title": engine.titles[row],
+                    "consumed": round(gain, 3),
+                    "missing": missing,
+                }
+                for row, gain, missing in result["recipes"]
+            ],
+            "expiring": round(expiring, 3),
+            "covered": round(result["covered"], 3),
+            "coverage": round(result["covered"] / expiring, 3) if expiring else 0.0,
+        }
 
-            if ing.matched_product:
-                pantry_item = (
-                    self.session.query(PantryItem)
-                    .filter_by(product_id=ing.matched_product_id)
-                    .first()
-                )
-                if pantry_item and pantry_item.expiration_date:
-                    exp_days = (pantry_item.expiration_date - datetime.now()).days
-
-            rationale.append({
-                "ingredient": ing.name,
-                "matched_product": ing.matched_product.name if ing.matched_product else None,
-                "expires_in_days": exp_days,
-                "is_external": ing.matched_product is None,
+    def simulate_scenarios(self, scenarios, virtual_pantry_state=None, horizon_end=None, workers=None):
+        """
+        What-if evaluation of many candidate plans (lists of recipe_id/date
+        pairs) against the current pantry: projected waste, consumption and
+        missing items per plan. Large batches are spread over a process
+        pool; see ScenarioSimulator.
+        """
+        ctx = self.context
+        items = self._items(ctx, virtual_pantry_state)
+        with ScenarioSimulator(ctx.engine, items, ctx.catalog, workers=workers) as simulator:
+            return simulator.run(scenarios, horizon_end=horizon_end)
+
+    def complementary(self, recipe_id, k=5):
+        """
+        Up to `k` recipes that share the most perishable products with
+        `recipe_id` (weighted Jaccard, see recommender_system.overlap_index),
+        e.g. to finish a package the recipe opens. Served from the persisted
+        overlap index, so the answer is a slice of precomputed neighbours.
+        """
+        ctx = self.context
+        engine = ctx.engine
+        row = engine.row_of.get(int(recipe_id))
+        if row is None:
+            return []
+
+        index = load_overlap_index(self.session, engine, ctx.catalog)
+        rows, similarity = index.neighbors(row, k)
+
+        return [
+            {
+                "recipe_id": int(engine.recipe_ids[r]),
+                "title": engine.titles[r],
+                "similarity": round(float(sim), 3),
+            }
+            for r, sim in zip(rows.tolist(), similarity.tolist())
+        ]
+
+    def get_rationale(self, recipe_id):
+        return self.get_rationales([recipe_id]).get(int(recipe_id), [])
+
+    def get_rationales(self, recipe_ids, virtual_pantry_state=None):
+        """
+        Per-ingredient rationale for many recipes at once:
+            { recipe_id: [ {ingredient, matched_product, product_id, needed,
+                            unit, on_hand, in_stock, expires_in_days,
+                            soonest_expiration, contribution, coverage,
+                            is_external}, ... ] }
+
+        Contribution, coverage and the on-hand amount (usable lots only) come
+        from the same FEFO allocation used for scoring (the real pantry reuses
+        the warm score cache), and the expiry is the soonest-expiring usable
+        lot. Ingredient rows are matched to the engine's entries by
+        ingredient_id; names and units are read with one join.
+        """
+        recipe_ids = list(dict.fromkeys(int(rid) for rid in recipe_ids))
+        if not recipe_ids:
+            return {}
+
+        ctx = self.context
+        engine = ctx.engine
+        lots = self._prepared_lots(ctx, virtual_pantry_state)
+
+        rows = np.array(
+            [engine.row_of[rid] for rid in recipe_ids if rid in engine.row_of],
+            dtype=np.int64,
+        )
+        ing, _ = engine.ingredients_of_rows(rows)
+        details = engine.ingredient_details(ing, lots)
+        entry_of = {int(iid): i for i, iid in enumerate(details["ingredient_id"].tolist())}
+
+        ingredients = (
+            self.session.query(
+                Ingredient.recipe_id,
+                Ingredient.ingredient_id,
+                Ingredient.name,
+                Ingredient.matched_product_id,
+                Ingredient.pantry_amount,
+                Ingredient.pantry_unit,
+                TJInventory.name.label("product_name"),
+            )
+            .outerjoin(TJInventory, TJInventory.product_id == Ingredient.matched_product_id)
+            .filter(Ingredient.recipe_id.in_(recipe_ids))
+            .order_by(Ingredient.recipe_id, Ingredient.ingredient_id)
+            .all()
+        )
+
+        now = datetime.now()
+        rationales = {rid: [] for rid in recipe_ids}
+
+        for ingredient in ingredients:
+            contribution, coverage, on_hand, soonest = 0.0, 0.0, 0.0, None
+            in_stock = False
+
+            i = entry_of.get(ingredient.ingredient_id) if ingredient.matched_product_id else None
+            if i is not None:
+                contribution = float(details["contribution"][i])
+                coverage = float(details["coverage"][i])
+                on_hand = float(details["on_hand"][i])
+                lot = details["soonest"][i]
+                if lot >= 0:
+                    in_stock = True
+                    soonest = lots["exp"][lot].item()
+
+            rationales[ingredient.recipe_id].append({
+                "ingredient": ingredient.name,
+                "matched_product": ingredient.product_name,
+                "product_id": ingredient.matched_product_id,
+                "needed": ingredient.pantry_amount or 0,
+                "unit": ingredient.pantry_unit,
+                "on_hand": round(on_hand, 3),
+                "in_stock": in_stock,
+                "expires_in_days": (soonest - now).days if soonest else None,
+                "soonest_expiration": soonest,
+                "contribution": round(contribution, 3),
+                "coverage": round(coverage, 3),
+                "is_external": ingredient.product_name is None,
             })
 
-        return rationale
+        return rationales
+
+    def category_label(self, recipe_id):
+        """normalize_category_label for a recipe id, read from the engine (no query)."""
+        row = self.engine.row_of.get(int(recipe_id))
+        category = self.engine.categories[row] if row is not None else None
+        return category or "Uncategorized"
     
     def recipe_matches_category(self, recipe, category):
         """Return True if a recipe belongs to the given category keyword."""
@@ -222,7 +577,7 @@ class RecipeRecommender:
             })
         return out
     
-    def _apply_recipe_to_virtual_state(self, recipe: Recipe, state: list):
+    def _apply_recipe_to_virtual_state(self, recipe: Recipe, state):
         """
         Consume ingredients from the virtual pantry FEFO-style.
         `state` is a LIST of pantry-item dicts:
@@ -231,38 +586,13 @@ class RecipeRecommender:
             {"product_id": 141, "amount": 12, "expiration_date": date},
             ...
         ]
+        or a VirtualPantry. A VirtualPantry comes back as a new VirtualPantry
+        sharing every product the recipe does not use; a list comes back as
+        a new list and is not mutated.
         """
-        # Make copy so original is not mutated
-        new_state = [item.copy() for item in state]
-
-        for ing in recipe.ingredients:
-            pid = ing.matched_product_id
-            required = ing.pantry_amount or 0
-            if not pid or required <= 0:
-                continue
-
-            # FEFO items for this product
-            items = [it for it in new_state if it["product_id"] == pid]
-
-            # Sort FEFO (earliest expiration first)
-            items.sort(key=lambda it: it["expiration_date"] or datetime.max)
-
-            for item in items:
-                if required <= 0:
-                    break
-
-                available = item["amount"]
-                if available <= 0:
-                    continue
-
-                used = min(available, required)
-                item["amount"] -= used
-                required -= used
-
-        # Filter out zero-amount items (optional)
-        new_state = [it for it in new_state if it["amount"] > 0]
-
-        return new_state
+        if isinstance(state, VirtualPantry):
+            return state.apply_recipe(recipe)
+        return VirtualPantry.from_items(state).apply_recipe(recipe).to_items()
 
     def _compute_waste_score(self, item):
         """
@@ -275,25 +605,28 @@ class RecipeRecommender:
 
         if not exp or amt <= 0:
             return 0
-        
-        delta = exp - datetime.now()
-        seconds_remaining = delta.total_seconds()
 
-        if seconds_remaining <= 0:
-            return 0
-
-        product = (
-            self.session.query(TJInventory)
-            .filter_by(product_id=item["product_id"])
-            .first()
+        score = self._compute_waste_scores(
+            [item["product_id"]], [amt], [exp], datetime.now(), self.context.catalog
         )
-        category = (product.sub_category or product.category or "").lower()
-        mult = CATEGORY_MULTIPLIERS.get(category, CATEGORY_MULTIPLIERS["other"])
+        return float(score[0])
+
+    def _compute_waste_scores(self, product_ids, amounts, expirations, now, catalog):
+        """
+        Vectorized per-unit urgency for many lots:
+            multiplier(product) / hours_remaining
+        Lots that are empty or already expired score 0.
+        """
+        mult = catalog.multipliers_for(product_ids)
+
+        amt = np.array([a or 0 for a in amounts], dtype=np.float64)
+        exp = np.array(expirations, dtype="datetime64[us]")
+        seconds_remaining = (exp - np.datetime64(now, "us")) / np.timedelta64(1, "s")
 
-        hours_remaining = seconds_remaining / 3600
-        urgency = 1 / (hours_remaining)
+        live = (amt > 0) & (seconds_remaining > 0)
+        hours_remaining = np.where(live, seconds_remaining, 1.0) / 3600
 
-        return urgency * mult
+        return np.where(live, (1 / hours_remaining) * mult, 0.0)
     
     def normalize_category_label(self, recipe: Recipe):
         """Return a clean category label to display on tiles."""
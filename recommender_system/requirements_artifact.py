@@ -0,0 +1,351 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+import numpy as np
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session, object_session
+from database.config import ARTIFACT_DIR
+from database.tables import Recipe, Ingredient
+
+# Bump when the on-disk layout changes so old artifacts are rebuilt.
+ARTIFACT_VERSION = 2
+
+MANIFEST_FILE = "manifest.json"
+ARRAY_FILES = (
+    "recipe_ids",
+    "indptr",
+    "indices",
+    "pantry_amount",
+    "ingredient_ids",
+    "product_ids",
+    "external",
+    "category_codes",
+)
+
+_LOADED = {}
+# Serializes artifact builds and loads between threads (pages and the
+# background worker can both notice a recipe-table change).
+_BUILD_LOCK = threading.RLock()
+
+# Bumped whenever a Recipe or Ingredient row is written through the ORM. The
+# full fingerprint (which hashes every title) is only recomputed when this
+# counter or the tables' highest ids move; see requirements_checksum.
+_requirements_version = 0
+_CHECKSUMS = {}
+
+
+def _bump_requirements_version(*_):
+    global _requirements_version
+    _requirements_version += 1
+
+
+def _on_requirements_write(mapper, connection, target):
+    # Bump again when the transaction ends, so a checksum another session
+    # computed before this write was committed is not kept.
+    session = object_session(target)
+    if session is not None:
+        session.info["requirements_written"] = True
+    _bump_requirements_version()
+
+
+def _on_transaction_end(session):
+    if session.info.pop("requirements_written", False):
+        _bump_requirements_version()
+
+
+for _model in (Recipe, Ingredient):
+    for _evt in ("after_insert", "after_update", "after_delete"):
+        event.listen(_model, _evt, _on_requirements_write)
+event.listen(Session, "after_commit", _on_transaction_end)
+event.listen(Session, "after_rollback", _on_transaction_end)
+
+
+class RecipeRequirements:
+    """
+    Compiled recipe requirements in CSR form.
+
+    Row r is recipe `recipe_ids[r]`; its matched ingredients are entries
+    indptr[r]:indptr[r+1], each with a product column (`indices`, into
+    `product_ids`), a `pantry_amount`, its `ingredient_ids` row id and an
+    `ingredient_names` label.
+    Arrays are plain NumPy arrays when compiled in memory and read-only
+    memory maps when loaded from the artifact directory.
+    """
+
+    def __init__(self, arrays, titles, category_names, ingredient_names, checksum):
+        for name in ARRAY_FILES:
+            setattr(self, name, arrays[name])
+        self.titles = titles
+        self.category_names = category_names
+        self.ingredient_names = ingredient_names
+        self.checksum = checksum
+
+    @property
+    def n_recipes(self):
+        return len(self.recipe_ids)
+
+    @property
+    def categories(self):
+        """Recipe category strings, decoded from the category codes."""
+        return [
+            self.category_names[c] if c >= 0 else None
+            for c in self.category_codes.tolist()
+        ]
+
+    def rows_for(self, recipe_ids):
+        """Row index per recipe_id, -1 for unknown recipes."""
+        ids = np.asarray(list(recipe_ids), dtype=np.int64)
+        if not len(self.recipe_ids) or not ids.size:
+            return np.full(ids.shape, -1, dtype=np.int64)
+        rows = np.minimum(np.searchsorted(self.recipe_ids, ids), len(self.recipe_ids) - 1)
+        return np.where(self.recipe_ids[rows] == ids, rows, -1)
+
+
+def artifact_dir_for(session: Session):
+    """Artifact directory next to the session's SQLite file (ARTIFACT_DIR for other databases)."""
+    url = session.get_bind().url
+    if url.get_backend_name() == "sqlite" and url.database and url.database != ":memory:":
+        return Path(url.database).with_suffix(".requirements")
+    return ARTIFACT_DIR
+
+
+def requirements_fingerprint(session: Session):
+    """Cheap aggregate over recipe + ingredient that changes when recipe requirements change."""
+    recipe_part = session.query(
+        func.count(Recipe.recipe_id),
+        func.max(Recipe.recipe_id),
+    ).one()
+
+    # Titles and categories are hashed: a same-length edit ("Lunch" ->
+    # "Snack") has to invalidate the artifact and the category masks too.
+    ordered = session.query(
+        (func.coalesce(Recipe.category, "") + "\x1f" + func.coalesce(Recipe.title, "")).label("text")
+    ).order_by(Recipe.recipe_id).subquery()
+    recipe_text = session.query(func.group_concat(ordered.c.text, "\x1e")).scalar() or ""
+
+    ingredient_part = session.query(
+        func.count(Ingredient.ingredient_id),
+        func.max(Ingredient.ingredient_id),
+        func.sum(Ingredient.recipe_id),
+        func.sum(Ingredient.matched_product_id),
+        func.sum(Ingredient.pantry_amount),
+        # Position-weighted sums catch values moving between ingredients
+        func.sum(Ingredient.ingredient_id * Ingredient.recipe_id),
+        func.sum(Ingredient.ingredient_id * Ingredient.matched_product_id),
+        func.sum(Ingredient.ingredient_id * Ingredient.pantry_amount),
+    ).one()
+    return (
+        tuple(recipe_part)
+        + (hashlib.sha1(recipe_text.encode()).hexdigest(),)
+        + tuple(ingredient_part)
+    )
+
+
+def requirements_token(session: Session):
+    """
+    O(1) change token: the ORM write counter plus the highest recipe and
+    ingredient ids (primary-key lookups), which also move when rows are
+    appended outside the ORM, e.g. by bulk inserts or the data pipeline.
+    """
+    ids = session.query(
+        session.query(func.max(Recipe.recipe_id)).scalar_subquery(),
+        session.query(func.max(Ingredient.ingredient_id)).scalar_subquery(),
+    ).one()
+    return (_requirements_version,) + tuple(ids)
+
+
+def requirements_checksum(session: Session):
+    """
+    Checksum tying an artifact to the current recipe/ingredient tables.
+    The full fingerprint is computed on first use per database and whenever
+    requirements_token changes; otherwise the cached checksum is returned.
+    """
+    key = str(session.get_bind().url)
+    token = requirements_token(session)
+    cached = _CHECKSUMS.get(key)
+    if cached is not None and cached[0] == token:
+        return cached[1]
+
+    payload = repr((ARTIFACT_VERSION, requirements_fingerprint(session)))
+    checksum = hashlib.sha1(payload.encode()).hexdigest()
+    _CHECKSUMS[key] = (token, checksum)
+    return checksum
+
+
+def invalidate_requirements():
+    """Forget cached checksums (e.g. after another process edited recipe rows in place)."""
+    _CHECKSUMS.clear()
+
+
+def compile_requirements(session: Session, checksum=None):
+    """Read recipe + ingredient rows once and compile them into a RecipeRequirements."""
+    checksum = checksum or requirements_checksum(session)
+
+    recipes = (
+        session.query(Recipe.recipe_id, Recipe.title, Recipe.category)
+        .order_by(Recipe.recipe_id)
+        .all()
+    )
+    recipe_ids = np.array([r.recipe_id for r in recipes], dtype=np.int64)
+    row_of = {int(rid): i for i, rid in enumerate(recipe_ids)}
+
+    category_names = sorted({r.category for r in recipes if r.category})
+    code_of = {name: i for i, name in enumerate(category_names)}
+    category_codes = np.array(
+        [code_of[r.category] if r.category else -1 for r in recipes],
+        dtype=np.int32,
+    )
+
+    ingredients = (
+        session.query(
+            Ingredient.ingredient_id,
+            Ingredient.recipe_id,
+            Ingredient.matched_product_id,
+            Ingredient.pantry_amount,
+            Ingredient.norm_name,
+        )
+        .order_by(Ingredient.recipe_id, Ingredient.ingredient_id)
+        .all()
+    )
+
+    rows, pids, needed, ids, names = [], [], [], [], []
+    external = np.zeros(len(recipe_ids), dtype=np.int64)
+
+    for ing in ingredients:
+        row = row_of.get(ing.recipe_id)
+        if row is None:
+            continue
+        if not ing.matched_product_id:
+            external[row] += 1
+            continue
+        rows.append(row)
+        pids.append(ing.matched_product_id)
+        needed.append(ing.pantry_amount or 0)
+        ids.append(ing.ingredient_id)
+        names.append(ing.norm_name)
+
+    rows = np.array(rows, dtype=np.int64)
+    pids = np.array(pids, dtype=np.int64)
+
+    product_ids = np.unique(pids)
+    indptr = np.zeros(len(recipe_ids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=len(recipe_ids)), out=indptr[1:])
+
+    arrays = {
+        "recipe_ids": recipe_ids,
+        "indptr": indptr,
+        "indices": np.searchsorted(product_ids, pids).astype(np.int32),
+        "pantry_amount": np.array(needed, dtype=np.float64),
+        "ingredient_ids": np.array(ids, dtype=np.int64),
+        "product_ids": product_ids,
+        "external": external,
+        "category_codes": category_codes,
+    }
+    titles = [r.title for r in recipes]
+    return RecipeRequirements(arrays, titles, category_names, names, checksum)
+
+
+def write_atomic(directory, name, write):
+    """Write through a unique temp file in `directory`, then rename it over `name`."""
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=f".{name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.chmod(tmp, 0o644)  # mkstemp creates 0600
+        os.replace(tmp, os.path.join(directory, name))
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def build_requirements_artifact(session: Session, directory=None):
+    """
+    Compile the requirements and write them to `directory` as .npy arrays
+    plus a JSON manifest. Every file goes through its own temp file and the
+    manifest is replaced last, so readers never see a checksum for arrays
+    that are not fully written; concurrent builds are serialized.
+    """
+    directory = directory or artifact_dir_for(session)
+    with _BUILD_LOCK:
+        requirements = compile_requirements(session)
+        os.makedirs(directory, exist_ok=True)
+
+        for name in ARRAY_FILES:
+            array = getattr(requirements, name)
+            write_atomic(directory, f"{name}.npy", lambda f: np.save(f, array))
+
+        manifest = {
+            "version": ARTIFACT_VERSION,
+            "checksum": requirements.checksum,
+            "n_recipes": requirements.n_recipes,
+            "n_products": len(requirements.product_ids),
+            "n_entries": len(requirements.indices),
+            "titles": requirements.titles,
+            "category_names": requirements.category_names,
+            "ingredient_names": requirements.ingredient_names,
+        }
+        write_atomic(directory, MANIFEST_FILE, lambda f: f.write(json.dumps(manifest).encode("utf-8")))
+
+        _LOADED.pop(str(directory), None)
+    return requirements
+
+
+def _read_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def load_requirements_artifact(session: Session, directory=None):
+    """
+    Return the memory-mapped requirements for the current database.
+
+    The artifact is rebuilt automatically when it is missing, was written by
+    another ARTIFACT_VERSION, or its checksum no longer matches the
+    recipe/ingredient tables. If the directory cannot be written the
+    requirements are compiled in memory instead.
+    """
+    directory = directory or artifact_dir_for(session)
+    checksum = requirements_checksum(session)
+
+    loaded = _LOADED.get(str(directory))
+    if loaded is not None and loaded.checksum == checksum:
+        return loaded
+
+    with _BUILD_LOCK:
+        loaded = _LOADED.get(str(directory))
+        if loaded is not None and loaded.checksum == checksum:
+            return loaded
+
+        manifest = _read_manifest(directory)
+        if not manifest or manifest.get("version") != ARTIFACT_VERSION or manifest.get("checksum") != checksum:
+            try:
+                build_requirements_artifact(session, directory)
+            except OSError:
+                return compile_requirements(session, checksum)
+            manifest = _read_manifest(directory)
+
+        try:
+            arrays = {
+                name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+                for name in ARRAY_FILES
+            }
+        except (OSError, ValueError):
+            # Truncated or foreign files (e.g. written by another process)
+            return compile_requirements(session, checksum)
+
+        requirements = RecipeRequirements(
+            arrays,
+            manifest["titles"],
+            manifest["category_names"],
+            manifest["ingredient_names"],
+            manifest["checksum"],
+        )
+        _LOADED[str(directory)] = requirements
+    return requirements
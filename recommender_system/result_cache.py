@@ -0,0 +1,97 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from sqlalchemy.orm import Session
+from services.pantry_manager import add_pantry_listener
+from recommender_system.score_cache import pantry_fingerprint
+
+# Minutes per time bucket: cached results are reused for at most this long,
+# since urgency scores drift with the clock even when nothing else changes.
+TIME_BUCKET_MINUTES = 5
+
+_pantry_generation = 0
+
+
+class LRUResultCache:
+    """
+    Small size-capped LRU mapping used for recommendation lists and virtual
+    pantries. Values are returned as stored, so callers copy before mutating.
+    Safe to use from several threads.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def time_bucket(now=None, minutes=TIME_BUCKET_MINUTES):
+    """Coarse clock value that changes every `minutes` minutes."""
+    now = now or datetime.now()
+    return int(now.timestamp() // (minutes * 60))
+
+
+def state_fingerprint(items):
+    """Order-independent hash of a list of pantry-item dicts (product_id, amount, expiration_date)."""
+    rows = sorted(
+        (int(it["product_id"]), float(it["amount"] or 0), str(it["expiration_date"]))
+        for it in items
+    )
+    return hashlib.sha1(repr(rows).encode()).hexdigest()
+
+
+def planned_fingerprint(planned_recipes):
+    """Hash of the planning queue (recipe, date, slot, status per entry)."""
+    rows = sorted(
+        (
+            str(sel_id),
+            pdata.get("recipe_id"),
+            pdata.get("planned_for"),
+            pdata.get("meal_slot"),
+            pdata.get("status"),
+        )
+        for sel_id, pdata in (planned_recipes or {}).items()
+    )
+    return hashlib.sha1(repr(rows).encode()).hexdigest()
+
+
+def real_pantry_key(session: Session):
+    """
+    Key for the real pantry: the write counter bumped by PantryManager
+    listeners plus an aggregate fingerprint for writes made elsewhere.
+    """
+    return (str(session.get_bind().url), _pantry_generation, pantry_fingerprint(session))
+
+
+def _on_pantry_change(session, product_ids):
+    global _pantry_generation
+    _pantry_generation += 1
+
+
+add_pantry_listener(_on_pantry_change)
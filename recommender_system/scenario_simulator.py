@@ -0,0 +1,258 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+from multiprocessing import shared_memory
+import numpy as np
+from recommender_system.horizon_planner import PantryLots, consume_fefo, recipe_lot_layout
+
+# Scenarios per task sent to a worker; keeps pickling overhead per what-if low.
+CHUNK_SIZE = 64
+
+# Below this many scenarios per worker the pool costs more than it saves.
+MIN_SCENARIOS_PER_WORKER = 32
+
+_WORKER = {}
+
+
+def _attach(name):
+    """Attach to a block created by the parent, which stays responsible for unlinking it."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13: pool workers share the parent's resource tracker,
+        # so the registration made here is the parent's own and is cleared
+        # by its unlink()
+        return shared_memory.SharedMemory(name=name)
+
+
+def _init_worker(specs):
+    """Pool initializer: map the shared arrays and build the per-product lot segments."""
+    blocks, arrays = [], {}
+    for name, (shm_name, shape, dtype) in specs.items():
+        shm = _attach(shm_name)
+        blocks.append(shm)
+        arrays[name] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+    _WORKER.clear()
+    _WORKER.update(_prepare(arrays))
+    # Keep the blocks referenced for as long as the views are in use
+    _WORKER["blocks"] = blocks
+
+
+def _prepare(arrays):
+    n_cols = len(arrays["product_ids"])
+    context = dict(arrays)
+    context["seg_start"] = np.searchsorted(arrays["lot_cols"], np.arange(n_cols), side="left")
+    context["seg_end"] = np.searchsorted(arrays["lot_cols"], np.arange(n_cols), side="right")
+    context["by_exp"] = np.argsort(arrays["lot_exp"], kind="stable")
+    context["exp_sorted"] = arrays["lot_exp"][context["by_exp"]]
+    context["layouts"] = {}
+    return context
+
+
+def _run_chunk(chunk):
+    return [_simulate(_WORKER, rows, times, horizon_end) for rows, times, horizon_end in chunk]
+
+
+def _simulate(context, rows, times, horizon_end):
+    """
+    Replay one plan (recipe rows + cook timestamps) against the lot arrays.
+    Lots are trashed when they pass their expiration date; recipes consume
+    FEFO. Returns (weighted waste, per-lot consumption, missing entries).
+    """
+    amount = context["lot_amount"].copy()
+    weight = context["lot_mult"] * (context["lot_exp"] <= horizon_end)
+    consumed = np.zeros_like(amount)
+    layouts = context["layouts"]
+
+    waste = 0.0
+    missing = []
+
+    # Lots in expiration order: each step only trashes the newly expired ones
+    by_exp, exp_sorted = context["by_exp"], context["exp_sorted"]
+    trashed = 0
+
+    order = np.argsort(times, kind="stable")
+    for row, t in zip(rows[order].tolist(), times[order].tolist()):
+        upto = np.searchsorted(exp_sorted, t, side="right")
+        if upto > trashed:
+            expired = by_exp[trashed:upto]
+            waste += float((amount[expired] * weight[expired]).sum())
+            amount[expired] = 0
+            trashed = upto
+
+        layout = layouts.get(row)
+        if layout is None:
+            layout = recipe_lot_layout(
+                context["indptr"], context["indices"], context["pantry_amount"],
+                context["seg_start"], context["seg_end"], row,
+            )
+            layouts[row] = layout
+
+        taken, short = consume_fefo(amount, layout)
+        consumed[layout[0]] += taken
+        for j in np.flatnonzero(short > 1e-9):
+            missing.append((row, int(layout[4][j]), float(short[j])))
+
+    expired = by_exp[trashed:np.searchsorted(exp_sorted, horizon_end, side="right")]
+    waste += float((amount[expired] * weight[expired]).sum())
+
+    by_product = np.bincount(context["lot_cols"], weights=consumed, minlength=len(context["product_ids"]))
+    return waste, by_product, missing
+
+
+def _as_datetime(value):
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime.combine(value, datetime.min.time())
+    return datetime.fromisoformat(str(value))
+
+
+class ScenarioSimulator:
+    """
+    Evaluate many what-if meal plans against one pantry snapshot.
+
+    The requirement CSR arrays, the pantry lots and their category
+    multipliers are copied once into `multiprocessing.shared_memory`; a
+    ProcessPoolExecutor maps them read-only in every worker, so a scenario
+    only ships its recipe rows and timestamps. Small batches run in-process
+    on the same arrays.
+
+    Use as a context manager (or call close()) so the pool and the shared
+    memory blocks are released.
+    """
+
+    def __init__(self, engine, items, catalog, now=None, workers=None):
+        self.engine = engine
+        self.now = now or datetime.now()
+        self.workers = workers or os.cpu_count() or 1
+
+        lots = PantryLots.from_items(engine, items, catalog, now=self.now)
+        self._unusable_waste = lots.unusable_waste
+
+        self.arrays = {
+            "indptr": np.ascontiguousarray(engine.requirements.indptr),
+            "indices": np.ascontiguousarray(engine.ing_col),
+            "pantry_amount": np.ascontiguousarray(engine.ing_needed),
+            "product_ids": np.ascontiguousarray(engine.product_ids),
+            "lot_cols": np.ascontiguousarray(lots.cols, dtype=np.int64),
+            "lot_exp": np.ascontiguousarray(lots.exp, dtype=np.float64),
+            "lot_amount": np.ascontiguousarray(lots.amount, dtype=np.float64),
+            "lot_mult": np.ascontiguousarray(lots.mult, dtype=np.float64),
+        }
+        self._local = _prepare(self.arrays)
+        self._blocks = []
+        self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _start_pool(self):
+        specs = {}
+        for name, arr in self.arrays.items():
+            shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+            np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+            self._blocks.append(shm)
+            specs[name] = (shm.name, arr.shape, arr.dtype.str)
+
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(specs,),
+        )
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        for shm in self._blocks:
+            shm.close()
+            shm.unlink()
+        self._blocks = []
+
+    def run(self, scenarios, horizon_end=None):
+        """
+        Evaluate each scenario, a list of (recipe_id, date) pairs or dicts
+        with recipe_id / planned_for (planner queue entries and plan_horizon
+        schedules both work). Dates are cooked at the start of the day, or
+        now for today. Waste counts lots expiring before `horizon_end`
+        (default: the day after the latest planned date).
+
+        Returns one dict per scenario:
+            {
+                "projected_waste": weighted amount trashed,
+                "consumed": {product_id: amount},
+                "missing": [{recipe_id, product_id, amount}],
+                "unknown_recipes": [recipe_id, ...],
+            }
+        """
+        parsed = [self._parse(scenario) for scenario in scenarios]
+
+        if horizon_end is None:
+            latest = max(
+                (max(entries, key=lambda e: e[1])[1] for entries in parsed if entries),
+                default=self.now,
+            )
+            horizon_end = datetime.combine(latest.date(), datetime.min.time()) + timedelta(days=1)
+        end_ts = _as_datetime(horizon_end).timestamp()
+        unusable = self._unusable_waste(end_ts)
+
+        jobs = []
+        unknown = []
+        for entries in parsed:
+            rows = self.engine_rows([rid for rid, _ in entries])
+            known = rows >= 0
+            times = np.array(
+                [max(t, self.now).timestamp() for _, t in entries], dtype=np.float64
+            )
+            jobs.append((rows[known], times[known], end_ts))
+            unknown.append([rid for (rid, _), ok in zip(entries, known.tolist()) if not ok])
+
+        if self.workers <= 1 or len(jobs) < self.workers * MIN_SCENARIOS_PER_WORKER:
+            results = [_simulate(self._local, *job) for job in jobs]
+        else:
+            if self._pool is None:
+                self._start_pool()
+            chunks = [jobs[i:i + CHUNK_SIZE] for i in range(0, len(jobs), CHUNK_SIZE)]
+            results = [r for part in self._pool.map(_run_chunk, chunks) for r in part]
+
+        recipe_ids = self.engine.recipe_ids
+        product_ids = self.engine.product_ids
+        out = []
+        for (waste, by_product, missing), skipped in zip(results, unknown):
+            used = np.flatnonzero(by_product > 0)
+            out.append({
+                "projected_waste": round(waste + unusable, 3),
+                "consumed": {
+                    int(product_ids[c]): round(float(by_product[c]), 3) for c in used
+                },
+                "missing": [
+                    {
+                        "recipe_id": int(recipe_ids[row]),
+                        "product_id": int(product_ids[col]),
+                        "amount": round(short, 3),
+                    }
+                    for row, col, short in missing
+                ],
+                "unknown_recipes": skipped,
+            })
+        return out
+
+    def engine_rows(self, recipe_ids):
+        """Engine row per recipe_id, -1 for recipes the engine does not know."""
+        row_of = self.engine.row_of
+        return np.array([row_of.get(int(rid), -1) for rid in recipe_ids], dtype=np.int64)
+
+    def _parse(self, scenario):
+        entries = []
+        for entry in scenario:
+            if isinstance(entry, dict):
+                rid, when = entry["recipe_id"], entry.get("planned_for")
+            else:
+                rid, when = entry
+            entries.append((rid, _as_datetime(when) if when else self.now))
+        return entries
@@ -0,0 +1,172 @@
+import threading
+import numpy as np
+from datetime import datetime
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from database.tables import PantryItem
+
+_SCORE_CACHES = {}
+_SCORE_CACHES_LOCK = threading.Lock()
+
+
+def pantry_fingerprint(session: Session):
+    """Cheap aggregate over the pantry table used to notice writes that bypassed PantryManager."""
+    return tuple(
+        session.query(
+            func.count(PantryItem.pantry_id),
+            func.max(PantryItem.pantry_id),
+            func.sum(PantryItem.amount),
+        ).one()
+    )
+
+
+class IncrementalScoreCache:
+    """
+    Real-pantry recipe scores kept warm between planner reruns.
+
+    The cache stores FEFO-sorted lots per product and, for every ingredient,
+    which lots it draws from (see RecipeScoringEngine.allocate). It is fed
+    ScoringContext snapshots: a new snapshot is compared with the cached
+    lots and only the ingredients of the products whose lots differ are
+    re-allocated, found through the engine's product -> ingredient inverted
+    index.
+
+    Time decay does not change which lots an ingredient uses, only how urgent
+    they are, so between snapshots every score is refreshed by re-weighting
+    the cached allocations with the current per-lot urgency (one cumulative
+    sum over the lots). Lots that expire in the meantime are dropped and
+    their products re-allocated like any other change.
+
+    The cache is shared by the Streamlit script threads and the background
+    recommendation worker, so every public method holds `lock`.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.lock = threading.RLock()
+        self.context = None
+        self._next_expiry = None
+        self._layout = None
+        self._seg_end = None
+        self.lot_unit = None
+
+        n_ing = len(engine.ing_col)
+        self.has_lots = np.zeros(n_ing, dtype=bool)
+        self.short = np.zeros(n_ing, dtype=bool)
+        self.k = np.zeros(n_ing, dtype=np.int64)
+        self.rem = np.zeros(n_ing, dtype=np.float64)
+
+    def scores(self, context, now=None, max_missing=None):
+        """
+        Bring the cache up to date with `context` and return the engine-style
+        score batch. `max_missing` skips re-weighting recipes the bitset
+        filter rules out.
+        """
+        with self.lock:
+            self.refresh(context, now)
+
+            lot_cols, _, lot_amount, seg_start = self._layout
+            ing = self.engine.feasible_ingredients(lot_cols, max_missing)
+            ing_score = self.engine.evaluate(seg_start, self.k[ing], self.rem[ing], self.lot_unit, lot_amount, ing)
+            return self.engine.aggregate(ing_score, self.has_lots[ing], self.short[ing], ing)
+
+    def refresh(self, context, now=None):
+        """Apply a new pantry snapshot and expiries, and re-weight the lots for `now`."""
+        with self.lock:
+            now = now or datetime.now()
+            now64 = np.datetime64(now, "us")
+
+            expired = self._next_expiry is not None and self._next_expiry < now64
+            if context is not self.context or expired or self._layout is None:
+                self._apply_snapshot(context, now64)
+                self.context = context
+
+            lot_cols, lot_exp, lot_amount, _ = self._layout
+            self.lot_unit = self._lot_urgency(context.catalog, lot_cols, lot_exp, lot_amount, now64)
+
+    def prepared_lots(self):
+        """The cached lots in engine.prepare_lots form, as of the last refresh()."""
+        with self.lock:
+            lot_cols, lot_exp, lot_amount, seg_start = self._layout
+            return {
+                "cols": lot_cols,
+                "amount": lot_amount,
+                "unit": self.lot_unit,
+                "exp": lot_exp,
+                "seg_start": seg_start,
+                "seg_end": self._seg_end,
+            }
+
+    def refreshed_lots(self, context, now=None):
+        """refresh() and prepared_lots() as one step, so another thread cannot refresh in between."""
+        with self.lock:
+            self.refresh(context, now)
+            return self.prepared_lots()
+
+    def _apply_snapshot(self, context, now64):
+        """Replace the cached lots with the live lots of `context` and re-allocate what changed."""
+        cols, exp, amount = context.live_lots(now64)
+
+        if self._layout is None:
+            changed = np.arange(len(self.engine.product_ids))
+        else:
+            changed = self._changed_columns(cols, exp, amount)
+
+        seg_start, seg_end = self.engine.segments(cols)
+        self._layout = (cols, exp, amount, seg_start)
+        self._seg_end = seg_end
+        self._next_expiry = exp.min() if len(exp) else None
+
+        if len(changed):
+            self._reallocate(changed)
+
+    def _changed_columns(self, cols, exp, amount):
+        """
+        Product columns whose lots differ from the cached layout. Both sides
+        are sorted by (column, expiration), so columns with the same lot
+        count line up entry by entry.
+        """
+        old_cols, old_exp, old_amount, _ = self._layout
+        n = len(self.engine.product_ids)
+        changed = np.bincount(old_cols, minlength=n) != np.bincount(cols, minlength=n)
+
+        old_same = ~changed[old_cols]
+        new_same = ~changed[cols]
+        differs = (old_exp[old_same] != exp[new_same]) | (old_amount[old_same] != amount[new_same])
+        changed[old_cols[old_same][differs]] = True
+        return np.flatnonzero(changed)
+
+    def _reallocate(self, changed_cols):
+        ing = self.engine.ingredients_using(changed_cols)
+        if not len(ing):
+            return
+
+        _, _, lot_amount, seg_start = self._layout
+        has_lots, short, k, rem = self.engine.allocate(ing, seg_start, self._seg_end, lot_amount)
+        self.has_lots[ing] = has_lots
+        self.short[ing] = short
+        self.k[ing] = k
+        self.rem[ing] = rem
+
+    def _lot_urgency(self, catalog, lot_cols, lot_exp, lot_amount, now64):
+        """Per-unit urgency of every cached lot: multiplier / hours remaining."""
+        mult = catalog.multipliers_for(self.engine.product_ids)[lot_cols]
+
+        seconds_remaining = (lot_exp - now64) / np.timedelta64(1, "s")
+        live = (lot_amount > 0) & (seconds_remaining > 0)
+        hours_remaining = np.where(live, seconds_remaining, 1.0) / 3600
+
+        return np.where(live, (1 / hours_remaining) * mult, 0.0)
+
+
+def get_score_cache(context):
+    """Return the process-wide score cache for the context's database, rebuilt when recipes change."""
+    engine = context.engine
+    key = engine.version[0]
+
+    with _SCORE_CACHES_LOCK:
+        cache = _SCORE_CACHES.get(key)
+        if cache is None or cache.engine is not engine:
+            cache = IncrementalScoreCache(engine)
+            _SCORE_CACHES[key] = cache
+        return cache
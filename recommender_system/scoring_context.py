@@ -0,0 +1,132 @@
+import threading
+import numpy as np
+from datetime import datetime
+from sqlalchemy.orm import Session
+from database.tables import PantryItem, TJInventory
+from services.pantry_manager import PantryRecords
+from recommender_system.scoring_engine import get_scoring_engine
+from recommender_system.catalog import get_product_catalog
+from recommender_system.result_cache import real_pantry_key
+
+_CONTEXTS = {}
+_CONTEXTS_LOCK = threading.Lock()
+
+
+def _readonly(arr):
+    arr.setflags(write=False)
+    return arr
+
+
+class ScoringContext:
+    """
+    Immutable snapshot of everything recipe scoring reads from the database:
+    the compiled recipe requirements (the scoring engine), the product
+    catalog multipliers and the pantry lots.
+
+    The pantry is read with a single SELECT into read-only columns, in the
+    same order and with the same TJInventory join as
+    PantryManager.get_all_items, and is also kept as engine lots (product
+    column, expiration, amount) sorted FEFO per product. Nothing is loaded
+    lazily afterwards, so a context can be shared between threads and used
+    while the pages keep writing through their session.
+
+    `version` identifies the snapshot: (engine version, catalog, pantry key).
+    get_scoring_context hands out the same instance until it changes.
+    """
+
+    __slots__ = (
+        "engine", "catalog", "pantry_key", "version", "created_at",
+        "pantry_ids", "product_ids", "amount", "expiration",
+        "lot_cols", "lot_exp", "lot_amount",
+    )
+
+    def __init__(self, engine, catalog, pantry_key, pantry_ids, product_ids, amount, expiration):
+        self.engine = engine
+        self.catalog = catalog
+        self.pantry_key = pantry_key
+        self.version = (engine.version, id(catalog), pantry_key)
+        self.created_at = datetime.now()
+
+        self.pantry_ids = _readonly(pantry_ids)
+        self.product_ids = _readonly(product_ids)
+        self.amount = _readonly(amount)
+        self.expiration = _readonly(expiration)
+        self._build_lots()
+
+    @classmethod
+    def from_session(cls, session: Session, engine, catalog, pantry_key):
+        rows = (
+            session.query(
+                PantryItem.pantry_id,
+                PantryItem.product_id,
+                PantryItem.amount,
+                PantryItem.expiration_date,
+            )
+            .join(TJInventory, TJInventory.product_id == PantryItem.product_id)
+            .order_by(PantryItem.pantry_id)
+            .all()
+        )
+        return cls(
+            engine,
+            catalog,
+            pantry_key,
+            np.array([r.pantry_id for r in rows], dtype=np.int64),
+            np.array([r.product_id for r in rows], dtype=np.int64),
+            np.array([r.amount if r.amount is not None else np.nan for r in rows], dtype=np.float64),
+            np.array([r.expiration_date for r in rows], dtype="datetime64[us]"),
+        )
+
+    def _build_lots(self):
+        """Dated lots of products the engine knows, as engine columns sorted by (column, expiration)."""
+        engine = self.engine
+        pids = self.product_ids
+        if len(engine.product_ids) and len(pids):
+            cols = np.minimum(np.searchsorted(engine.product_ids, pids), len(engine.product_ids) - 1)
+            keep = (engine.product_ids[cols] == pids) & ~np.isnat(self.expiration)
+        else:
+            cols = np.zeros(len(pids), dtype=np.int64)
+            keep = np.zeros(len(pids), dtype=bool)
+
+        cols, exp = cols[keep], self.expiration[keep]
+        amount = np.maximum(np.nan_to_num(self.amount[keep]), 0)
+        order = np.lexsort((exp, cols))
+
+        self.lot_cols = _readonly(cols[order])
+        self.lot_exp = _readonly(exp[order])
+        self.lot_amount = _readonly(amount[order])
+
+    def __len__(self):
+        return len(self.pantry_ids)
+
+    def items(self):
+        """The pantry as a PantryRecords view (product_id, amount, expiration_date), like PantryManager.get_all_items."""
+        return PantryRecords(self.product_ids, self.amount, self.expiration)
+
+    def live_lots(self, now64):
+        """Engine lots that have not expired at `now64`: (cols, exp, amount)."""
+        keep = self.lot_exp >= now64
+        return self.lot_cols[keep], self.lot_exp[keep], self.lot_amount[keep]
+
+
+def get_scoring_context(session: Session, category_multipliers):
+    """
+    Return the ScoringContext for this session's database, reusing the
+    cached one while the engine, the catalog and the pantry key (write
+    counter + fingerprint) are unchanged. The checks are aggregate queries;
+    a rebuild adds one pantry SELECT.
+    """
+    engine = get_scoring_engine(session)
+    catalog = get_product_catalog(session, category_multipliers)
+    pantry_key = real_pantry_key(session)
+    version = (engine.version, id(catalog), pantry_key)
+
+    key = str(session.get_bind().url)
+    with _CONTEXTS_LOCK:
+        cached = _CONTEXTS.get(key)
+    if cached is not None and cached.version == version and cached.catalog is catalog:
+        return cached
+
+    context = ScoringContext.from_session(session, engine, catalog, pantry_key)
+    with _CONTEXTS_LOCK:
+        _CONTEXTS[key] = context
+    return context
@@ -0,0 +1,552 @@
+import heapq
+import numpy as np
+from scipy.sparse import csr_matrix
+from sqlalchemy.orm import Session
+from recommender_system.requirements_artifact import load_requirements_artifact
+
+_ENGINE_CACHE = {}
+
+
+class RecipeScoringEngine:
+    """
+    Batch scorer for every recipe at once.
+
+    Recipe requirements are loaded a single time into a sparse
+    recipe x product matrix (one stored entry per matched ingredient, so a
+    recipe that lists the same product twice keeps both entries, exactly like
+    `RecipeRecommender.score_recipe`). Scoring a pantry is then a handful of
+    NumPy operations instead of one Python loop per recipe.
+    """
+
+    def __init__(self, requirements):
+        self.version = None
+        self._load_requirements(requirements)
+        self._build_product_index()
+        self._build_requirement_bits()
+        self._category_masks = {}
+
+    def _load_requirements(self, requirements):
+        """
+        Adopt compiled requirements (see recommender_system.requirements_artifact).
+        The CSR arrays are used as-is, so a memory-mapped artifact is not copied.
+        """
+        self.recipe_ids = requirements.recipe_ids
+        self.titles = requirements.titles
+        self.categories = requirements.categories
+        self.row_of = {int(rid): i for i, rid in enumerate(self.recipe_ids.tolist())}
+        self.product_ids = requirements.product_ids
+        self.external = requirements.external
+        self.ingredient_names = requirements.ingredient_names
+        self.ingredient_ids = requirements.ingredient_ids
+
+        self.requirements = csr_matrix(
+            (requirements.pantry_amount, requirements.indices, requirements.indptr),
+            shape=(len(self.recipe_ids), len(self.product_ids)),
+            copy=False,
+        )
+
+        # Flat per-ingredient views of the CSR arrays
+        self.ing_row = np.repeat(
+            np.arange(len(self.recipe_ids)), np.diff(requirements.indptr)
+        )
+        self.ing_col = self.requirements.indices
+        self.ing_needed = self.requirements.data
+
+    def _build_product_index(self):
+        """Inverted index: product column -> ingredient indices (and so recipes) that use it."""
+        order = np.argsort(self.ing_col, kind="stable")
+        self.ingredients_by_product = order
+        self.product_indptr = np.searchsorted(
+            self.ing_col[order], np.arange(len(self.product_ids) + 1)
+        )
+
+    def _build_requirement_bits(self):
+        """Pack each recipe's distinct required products into a row of uint64 words."""
+        self.n_words = max((len(self.product_ids) + 63) // 64, 1)
+        self.required_bits = np.zeros((self.n_recipes, self.n_words), dtype=np.uint64)
+        if len(self.ing_col):
+            np.bitwise_or.at(
+                self.required_bits,
+                (self.ing_row, self.ing_col >> 6),
+                np.left_shift(np.uint64(1), (self.ing_col & 63).astype(np.uint64)),
+            )
+        self.required_counts = np.bitwise_count(self.required_bits).sum(axis=1, dtype=np.int64)
+
+    def pantry_bits(self, cols):
+        """Bitset (uint64 words) of the product columns that currently have lots."""
+        bits = np.zeros(self.n_words, dtype=np.uint64)
+        cols = np.unique(np.asarray(cols, dtype=np.int64))
+        if len(cols):
+            np.bitwise_or.at(
+                bits,
+                cols >> 6,
+                np.left_shift(np.uint64(1), (cols & 63).astype(np.uint64)),
+            )
+        return bits
+
+    def present_products(self, available_bits):
+        """Per recipe: number of distinct required products that have lots, popcount(required & available)."""
+        return np.bitwise_count(self.required_bits & available_bits).sum(axis=1, dtype=np.int64)
+
+    def missing_products(self, available_bits):
+        """Per recipe: number of distinct required products with no lots, popcount(required & ~available)."""
+        return self.required_counts - self.present_products(available_bits)
+
+    def feasible(self, available_bits, max_missing):
+        """
+        Rows that can still pass the recommender filters. The distinct-product
+        popcount never exceeds the scored missing count (duplicate ingredients
+        and quantity shortfalls only add to it), so nothing feasible is dropped.
+        """
+        present = self.present_products(available_bits)
+        return (present > 0) & (self.required_counts - present <= max_missing)
+
+    def feasible_ingredients(self, lot_cols, max_missing):
+        """Ingredient indices belonging to recipes that pass the bitset feasibility filter."""
+        if max_missing is None:
+            return np.arange(len(self.ing_col))
+        rows = self.feasible(self.pantry_bits(lot_cols), max_missing)
+        return np.flatnonzero(rows[self.ing_row])
+
+    def columns_for(self, product_ids):
+        """Product columns for the given product_ids, silently skipping unused products."""
+        pids = np.asarray(list(product_ids), dtype=np.int64)
+        if not pids.size or not len(self.product_ids):
+            return np.zeros(0, dtype=np.int64)
+        cols = np.minimum(np.searchsorted(self.product_ids, pids), len(self.product_ids) - 1)
+        return np.unique(cols[self.product_ids[cols] == pids])
+
+    def ingredients_using(self, cols):
+        """Ingredient indices whose matched product is in the given product columns."""
+        if not len(cols):
+            return np.zeros(0, dtype=np.int64)
+        parts = [
+            self.ingredients_by_product[self.product_indptr[c]:self.product_indptr[c + 1]]
+            for c in cols
+        ]
+        return np.concatenate(parts)
+
+    def recipes_using(self, product_ids):
+        """recipe_ids of every recipe that uses at least one of `product_ids`."""
+        ing = self.ingredients_using(self.columns_for(product_ids))
+        return self.recipe_ids[np.unique(self.ing_row[ing])]
+
+    def category_mask(self, category):
+        """
+        Boolean row mask of recipes whose category string contains `category`
+        (same rule as RecipeRecommender.recipe_matches_category). Masks are
+        memoized, so each keyword scans the category strings once per engine.
+        """
+        category = category.lower()
+        mask = self._category_masks.get(category)
+        if mask is None:
+            mask = np.array(
+                [bool(raw) and category in raw.lower() for raw in self.categories],
+                dtype=bool,
+            )
+            self._category_masks[category] = mask
+        return mask
+
+    @property
+    def n_recipes(self):
+        return len(self.recipe_ids)
+
+    def _lot_arrays(self, item_scores):
+        """
+        Convert `calculate_item_scores` output into FEFO-sorted lot arrays,
+        keeping only lots whose product is used by at least one recipe.
+        """
+        if not item_scores or not len(self.product_ids):
+            empty = np.zeros(0)
+            return empty.astype(np.int64), empty, empty, empty.astype("datetime64[us]")
+
+        n = len(item_scores)
+        pids = np.fromiter((e["product_id"] for e in item_scores), dtype=np.int64, count=n)
+        exp = np.fromiter((e["expiration_date"].timestamp() for e in item_scores), dtype=np.float64, count=n)
+        amount = np.fromiter((e["amount"] or 0 for e in item_scores), dtype=np.float64, count=n)
+        per_unit = np.fromiter((e["per_unit_score"] for e in item_scores), dtype=np.float64, count=n)
+        exp_dates = np.array([e["expiration_date"] for e in item_scores], dtype="datetime64[us]")
+
+        cols = np.searchsorted(self.product_ids, pids)
+        cols = np.minimum(cols, len(self.product_ids) - 1)
+        known = self.product_ids[cols] == pids
+
+        cols, exp, amount, per_unit = cols[known], exp[known], amount[known], per_unit[known]
+        exp_dates = exp_dates[known]
+        order = np.lexsort((exp, cols))
+
+        return cols[order], np.maximum(amount[order], 0), per_unit[order], exp_dates[order]
+
+    def segments(self, lot_cols):
+        """Start/end offsets of each product column inside FEFO-sorted lot arrays."""
+        cols = np.arange(len(self.product_ids))
+        return (
+            np.searchsorted(lot_cols, cols, side="left"),
+            np.searchsorted(lot_cols, cols, side="right"),
+        )
+
+    def allocate(self, ing, seg_start, seg_end, lot_amount):
+        """
+        FEFO allocation for the ingredient indices `ing`.
+
+        Each ingredient draws from the first `k` lots of its product segment,
+        using all of lots 0..k-2 and `rem` units of lot k-1. Positions are
+        relative to the segment so an allocation stays valid while only other
+        products' lots change. Returns (has_lots, short, k, rem).
+        """
+        col = self.ing_col[ing]
+        return self.allocate_segments(seg_start[col], seg_end[col], self.ing_needed[ing], lot_amount)
+
+    def allocate_segments(self, lo, hi, needed, lot_amount):
+        """FEFO allocation of `needed` units from each lot range lo:hi (see allocate)."""
+        cum_amount = np.concatenate(([0.0], np.cumsum(lot_amount)))
+
+        has_lots = hi > lo
+        available = cum_amount[hi] - cum_amount[lo]
+        wanted = needed > 0
+        short = wanted & (needed > available)
+        covered = wanted & has_lots & ~short
+
+        k = np.where(wanted & has_lots, hi - lo, 0)
+        last = np.maximum(hi - 1, 0)
+        rem = np.where(wanted & has_lots, lot_amount[last] if len(lot_amount) else 0.0, 0.0)
+
+        # Partially used product: find the lot where the requirement runs out
+        if covered.any():
+            c_lo = lo[covered]
+            target = cum_amount[c_lo] + needed[covered]
+            j = np.searchsorted(cum_amount, target, side="left")
+            j = np.clip(j, c_lo + 1, hi[covered])
+            k[covered] = j - c_lo
+            rem[covered] = target - cum_amount[j - 1]
+
+        return has_lots, short, k, rem
+
+    def evaluate(self, seg_start, k, rem, lot_unit, lot_amount, ing=None):
+        """
+        Per-ingredient FEFO-capped score for a precomputed allocation, given
+        the current per-unit urgency of every lot. `k`/`rem` are aligned with
+        `ing` (all ingredients when omitted).
+        """
+        cols = self.ing_col if ing is None else self.ing_col[ing]
+        return self.evaluate_segments(seg_start[cols], k, rem, lot_unit, lot_amount)
+
+    def evaluate_segments(self, lo, k, rem, lot_unit, lot_amount):
+        """Score of allocations that start at lot `lo` (see evaluate)."""
+        cum_score = np.concatenate(([0.0], np.cumsum(lot_amount * lot_unit)))
+
+        used = k > 0
+        last = np.where(used, lo + k - 1, 0)
+
+        score = np.zeros(len(k), dtype=np.float64)
+        if used.any():
+            score[used] = (
+                cum_score[last[used]] - cum_score[lo[used]]
+                + lot_unit[last[used]] * rem[used]
+            )
+        return score
+
+    def aggregate(self, ing_score, has_lots, short, ing=None):
+        """
+        Sum per-ingredient results into per-recipe score / matched / missing
+        counts. Recipes with no ingredient in `ing` come out unmatched.
+        """
+        n = self.n_recipes
+        rows = self.ing_row if ing is None else self.ing_row[ing]
+        return {
+            "score": np.bincount(rows, weights=ing_score, minlength=n),
+            "matched": np.bincount(rows, weights=has_lots, minlength=n).astype(np.int64),
+            "missing": np.bincount(rows, weights=~has_lots | short, minlength=n).astype(np.int64),
+            "external": self.external,
+        }
+
+    def prepare_lots(self, item_scores):
+        """FEFO-sorted lot arrays plus their per-product segments, shared by the scoring paths."""
+        lot_cols, lot_amount, lot_unit, lot_exp = self._lot_arrays(item_scores)
+        seg_start, seg_end = self.segments(lot_cols)
+        return {
+            "cols": lot_cols,
+            "amount": lot_amount,
+            "unit": lot_unit,
+            "exp": lot_exp,
+            "seg_start": seg_start,
+            "seg_end": seg_end,
+        }
+
+    def score_all(self, item_scores, max_missing=None):
+        """
+        Score every recipe against the given lots.
+
+        When `max_missing` is given, recipes that the bitset filter proves
+        infeasible are skipped before allocation and left unmatched.
+
+        Returns a dict of arrays aligned with `self.recipe_ids`:
+            score, matched, missing, external
+        """
+        lots = self.prepare_lots(item_scores)
+        ing = self.feasible_ingredients(lots["cols"], max_missing)
+        return self._score_ingredients(ing, lots)
+
+    def _score_ingredients(self, ing, lots):
+        has_lots, short, k, rem = self.allocate(ing, lots["seg_start"], lots["seg_end"], lots["amount"])
+        ing_score = self.evaluate(lots["seg_start"], k, rem, lots["unit"], lots["amount"], ing)
+        return self.aggregate(ing_score, has_lots, short, ing)
+
+    def ingredient_details(self, ing, lots):
+        """
+        Rationale numbers for the ingredient indices `ing` against prepared
+        lots: the Ingredient row id, FEFO-capped score contribution, position
+        of the soonest-expiring lot of the product (-1 when there is none),
+        the needed and on-hand amounts and coverage, the share of the needed
+        amount that is on hand.
+        """
+        has_lots, _, k, rem = self.allocate(ing, lots["seg_start"], lots["seg_end"], lots["amount"])
+        contribution = self.evaluate(lots["seg_start"], k, rem, lots["unit"], lots["amount"], ing)
+
+        cols = self.ing_col[ing]
+        lo, hi = lots["seg_start"][cols], lots["seg_end"][cols]
+        cum_amount = np.concatenate(([0.0], np.cumsum(lots["amount"])))
+        on_hand = cum_amount[hi] - cum_amount[lo]
+
+        needed = self.ing_needed[ing]
+        coverage = np.where(
+            needed > 0,
+            np.minimum(on_hand / np.where(needed > 0, needed, 1), 1.0),
+            has_lots.astype(np.float64),
+        )
+        return {
+            "ingredient_id": np.asarray(self.ingredient_ids)[ing],
+            "contribution": contribution,
+            "soonest": np.where(has_lots, lo, -1),
+            "needed": needed,
+            "on_hand": on_hand,
+            "coverage": coverage,
+        }
+
+    def score_by_day(self, lots, times, rows=None):
+        """
+        Recipe x day score matrix for a PantryLots snapshot.
+
+        Column d scores every recipe as if cooked at timestamp `times[d]`:
+        lots expired by then are empty, and the rest carry the urgency
+        multiplier / hours remaining at that moment. All days are allocated
+        in one pass over a day-stacked copy of the lot arrays (each day's lots
+        are shifted by the number of lots, so FEFO segments never cross).
+
+        Returns (scores, soonest): scores is (len(rows), len(times));
+        soonest is each recipe's earliest lot expiration among its products
+        with stock (inf when none).
+        """
+        rows = np.arange(self.n_recipes) if rows is None else np.asarray(rows, dtype=np.int64)
+        times = np.asarray(times, dtype=np.float64)
+        n_days, n_lots = len(times), len(lots.amount)
+
+        ing, local = self.ingredients_of_rows(rows)
+        cols = self.ing_col[ing]
+
+        alive = (lots.exp[None, :] > times[:, None]) & (lots.amount[None, :] > 0)
+        hours = np.where(alive, (lots.exp[None, :] - times[:, None]) / 3600, 1.0)
+        amount = np.where(alive, lots.amount[None, :], 0.0).ravel()
+        unit = np.where(alive, lots.mult[None, :] / hours, 0.0).ravel()
+
+        offset = (np.arange(n_days) * n_lots)[:, None]
+        lo = (lots.seg_start[cols][None, :] + offset).ravel()
+        hi = (lots.seg_end[cols][None, :] + offset).ravel()
+        needed = np.tile(self.ing_needed[ing], n_days)
+
+        _, _, k, rem = self.allocate_segments(lo, hi, needed, amount)
+        ing_score = self.evaluate_segments(lo, k, rem, unit, amount).reshape(n_days, len(ing))
+
+        scores = np.zeros((len(rows), n_days), dtype=np.float64)
+        np.add.at(scores, local, ing_score.T)
+
+        # Earliest expiration per product among lots that still have stock
+        col_soonest = np.full(len(self.product_ids), np.inf)
+        stocked = lots.amount > 0
+        np.minimum.at(col_soonest, lots.cols[stocked], lots.exp[stocked])
+        soonest = np.full(len(rows), np.inf)
+        np.minimum.at(soonest, local, col_soonest[cols])
+
+        return scores, soonest
+
+    def upper_bounds(self, lots):
+        """
+        Optimistic score per recipe: for every ingredient, the usable amount
+        min(needed, on hand) times the product's highest per-unit urgency.
+        Never below the exact FEFO-capped score.
+        """
+        seg_start, seg_end = lots["seg_start"], lots["seg_end"]
+        n_cols = len(self.product_ids)
+
+        max_unit = np.zeros(n_cols, dtype=np.float64)
+        nonempty = seg_end > seg_start
+        if nonempty.any():
+            max_unit[nonempty] = np.maximum.reduceat(lots["unit"], seg_start[nonempty])
+
+        cum_amount = np.concatenate(([0.0], np.cumsum(lots["amount"])))
+        on_hand = cum_amount[seg_end] - cum_amount[seg_start]
+
+        usable = np.clip(self.ing_needed, 0, on_hand[self.ing_col])
+        bound = usable * max_unit[self.ing_col]
+        return np.bincount(self.ing_row, weights=bound, minlength=self.n_recipes)
+
+    def ingredients_of_rows(self, rows):
+        """Ingredient indices of the given recipe rows (CSR slices), plus each one's position in `rows`."""
+        indptr = self.requirements.indptr
+        starts = indptr[rows]
+        lens = indptr[rows + 1] - starts
+        offsets = np.repeat(starts - np.cumsum(lens) + lens, lens)
+        ing = np.arange(lens.sum()) + offsets
+        return ing, np.repeat(np.arange(len(rows)), lens)
+
+    def top_k(self, lots, limit=5, max_missing=1, candidates=None, memo=None):
+        """
+        Same result as `rank(score_all(...))` without scoring every recipe.
+
+        Recipes are visited in descending upper-bound order and scored
+        exactly in chunks, keeping a min-heap of the best `limit` results.
+        Once the best remaining bound rounds below the current k-th score no
+        later recipe can enter, so the rest are never allocated. `memo`
+        (row -> exact result) lets several calls on the same lots share work.
+        """
+        ranked = []
+        for ranked in self.iter_top_k(lots, limit, max_missing, candidates, memo):
+            pass
+        return ranked
+
+    def iter_top_k(self, lots, limit=5, max_missing=1, candidates=None, memo=None, chunk=None):
+        """
+        The bounded search behind `top_k`, yielding the provisional ranked
+        list every time a chunk of recipes changes it. Chunks go in
+        descending upper-bound order, so early lists are usually close to
+        final; the last list yielded is exactly `top_k`'s result.
+        """
+        if limit <= 0:
+            yield []
+            return
+        memo = {} if memo is None else memo
+
+        keep = self.feasible(self.pantry_bits(lots["cols"]), max_missing)
+        if candidates is not None:
+            keep &= candidates
+        rows = np.flatnonzero(keep)
+
+        bounds = self.upper_bounds(lots)[rows]
+        # Slack so float noise in the exact sum can never exceed the bound
+        bounds = bounds * (1 + 1e-9) + 1e-12
+        order = np.argsort(-bounds, kind="stable")
+        rows, bounds = rows[order], bounds[order]
+
+        heap = []
+        chunk = chunk or max(4 * limit, 64)
+        yielded = False
+
+        for start in range(0, len(rows), chunk):
+            if len(heap) == limit and round(float(bounds[start]), 3) < heap[0][0]:
+                break
+
+            chunk_rows = rows[start:start + chunk]
+            todo = np.array([r for r in chunk_rows if r not in memo], dtype=np.int64)
+            if len(todo):
+                ing, local = self.ingredients_of_rows(todo)
+                has_lots, short, k, rem = self.allocate(ing, lots["seg_start"], lots["seg_end"], lots["amount"])
+                ing_score = self.evaluate(lots["seg_start"], k, rem, lots["unit"], lots["amount"], ing)
+
+                score = np.bincount(local, weights=ing_score, minlength=len(todo))
+                matched = np.bincount(local, weights=has_lots, minlength=len(todo))
+                missing = np.bincount(local, weights=~has_lots | short, minlength=len(todo))
+
+                for r, s_, m, mi in zip(todo, score, matched, missing):
+                    memo[int(r)] = (round(float(s_), 3), int(m), int(mi))
+
+            changed = False
+            for r in chunk_rows:
+                score, matched, missing = memo[int(r)]
+                if matched <= 0 or missing > max_missing or score <= 0:
+                    continue
+                # Ties keep recipe_id order, so a lower row wins an equal score
+                entry = (score, -int(r))
+                if len(heap) < limit:
+                    heapq.heappush(heap, entry)
+                    changed = True
+                elif entry > heap[0]:
+                    heapq.heapreplace(heap, entry)
+                    changed = True
+
+            if changed:
+                yielded = True
+                yield self._ranked_heap(heap, memo)
+
+        # Every change was yielded, so only an empty result is still owed
+        if not yielded:
+            yield []
+
+    def _ranked_heap(self, heap, memo):
+        return [
+            self._result_row(-neg_row, score, memo[-neg_row][1], memo[-neg_row][2])
+            for score, neg_row in sorted(heap, reverse=True)
+        ]
+
+    def rank(self, batch, limit=5, max_missing=1, candidates=None):
+        """
+        Apply the recommender filters (matched > 0, missing <= max_missing,
+        rounded score > 0) and return the top `limit` rows as recommendation
+        dicts. `candidates` optionally restricts ranking to a boolean row mask.
+        """
+        keep = (batch["matched"] > 0) & (batch["missing"] <= max_missing)
+        if candidates is not None:
+            keep &= candidates
+
+        rows = np.flatnonzero(keep)
+        if limit <= 0 or not len(rows):
+            return []
+
+        # Only rows that can round to at least the k-th best score need exact
+        # rounding and sorting; everything else is cut with a partition.
+        raw = batch["score"][rows]
+        if len(rows) > limit:
+            kth = np.partition(raw, len(raw) - limit)[len(raw) - limit]
+            near = raw >= round(float(kth), 3) - 0.001
+            rows, raw = rows[near], raw[near]
+
+        rounded = np.array([round(float(s), 3) for s in raw], dtype=np.float64)
+
+        positive = rounded > 0
+        rows, rounded = rows[positive], rounded[positive]
+
+        # Stable descending sort keeps recipe_id order among ties, like sorted()
+        order = np.argsort(-rounded, kind="stable")[:limit]
+
+        return [
+            self._result_row(rows[i], rounded[i], batch["matched"][rows[i]], batch["missing"][rows[i]])
+            for i in order
+        ]
+
+    def _result_row(self, row, score, matched, missing):
+        return {
+            "recipe_id": int(self.recipe_ids[row]),
+            "title": self.titles[row],
+            "score": float(score),
+            "matched": int(matched),
+            "missing": int(missing),
+            "external": int(self.external[row]),
+        }
+
+
+def get_scoring_engine(session: Session):
+    """
+    Return the RecipeScoringEngine for this database, shared across sessions
+    and Streamlit reruns. It is built from the memory-mapped requirements
+    artifact and replaced when the artifact checksum changes.
+    """
+    key = str(session.get_bind().url)
+    requirements = load_requirements_artifact(session)
+
+    cached = _ENGINE_CACHE.get(key)
+    if cached is not None and cached[0] == requirements.checksum:
+        return cached[1]
+
+    engine = RecipeScoringEngine(requirements)
+    engine.version = (key, requirements.checksum)
+    _ENGINE_CACHE[key] = (requirements.checksum, engine)
+    return engine
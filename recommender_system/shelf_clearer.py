@@ -0,0 +1,78 @@
+import heapq
+import numpy as np
+from recommender_system.horizon_planner import fefo_take
+
+# Gains below this are float noise, not food.
+MIN_GAIN = 1e-9
+
+
+def clear_expiring_shelf(lots, within_days=3, max_recipes=None, max_missing=1, candidates=None):
+    """
+    Pick a small set of recipes that together use up as much as possible of
+    the lots expiring within `within_days` (amount weighted by category
+    multiplier), on a PantryLots snapshot.
+
+    Lazy-greedy maximization: every recipe starts in a max-heap keyed on an
+    upper bound of its gain (one vectorized allocation over all recipes,
+    which treats repeated products independently and so never undercounts).
+    Cooking recipes only shrinks the pantry, so gains can only go down; a
+    popped recipe is re-evaluated against the current pantry and taken if it
+    still beats the next bound, otherwise pushed back with its new gain.
+    Most recipes are never re-evaluated.
+
+    Returns:
+        {
+            "recipes": [(row, gain, missing)] in pick order,
+            "expiring": weighted amount expiring in the window,
+            "covered": weighted amount the picks consume,
+        }
+    """
+    engine = lots.engine
+    cutoff = lots.now.timestamp() + within_days * 86400
+    weight = lots.mult * (lots.exp <= cutoff)
+    amount = lots.amount.copy()
+
+    keep = np.ones(engine.n_recipes, dtype=bool)
+    if max_missing is not None:
+        keep &= engine.feasible(engine.pantry_bits(lots.cols[amount > 0]), max_missing)
+    if candidates is not None:
+        keep &= candidates
+    rows = np.flatnonzero(keep)
+
+    heap = []
+    if len(rows):
+        ing, local = engine.ingredients_of_rows(rows)
+        _, _, k, rem = engine.allocate(ing, lots.seg_start, lots.seg_end, amount)
+        gain = engine.evaluate(lots.seg_start, k, rem, weight, amount, ing)
+        bound = np.bincount(local, weights=gain, minlength=len(rows))
+        # Ties keep recipe_id order (lower row first)
+        heap = [(-b, r) for r, b in zip(rows.tolist(), bound.tolist()) if b > MIN_GAIN]
+        heapq.heapify(heap)
+
+    picks = []
+    covered = 0.0
+    while heap and (max_recipes is None or len(picks) < max_recipes):
+        _, row = heapq.heappop(heap)
+
+        layout = lots.layout(row)
+        taken, short = fefo_take(amount, layout)
+        gain = float((taken * weight[layout[0]]).sum())
+        missing = int((short > MIN_GAIN).sum())
+
+        # Both only get worse as the pantry empties, so the recipe is done
+        if gain <= MIN_GAIN or (max_missing is not None and missing > max_missing):
+            continue
+
+        if heap and gain < -heap[0][0]:
+            heapq.heappush(heap, (-gain, row))
+            continue
+
+        amount[layout[0]] -= taken
+        covered += gain
+        picks.append((row, gain, missing))
+
+    return {
+        "recipes": picks,
+        "expiring": float((lots.amount * weight).sum()),
+        "covered": covered,
+    }
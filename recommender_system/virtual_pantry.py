@@ -0,0 +1,224 @@
+from datetime import datetime
+
+
+def _fefo_key(lot):
+    return lot[0] or datetime.max
+
+
+def _has_stock(amount):
+    return bool(amount) and amount > 0
+
+
+def _merged(products, changes):
+    """Copy of `products` with `changes` applied (None removes a product)."""
+    products = dict(products)
+    for pid, lots in changes.items():
+        if lots is None:
+            products.pop(pid, None)
+        else:
+            products[pid] = lots
+    return products
+
+
+class ProductLots:
+    """
+    The lots of one product in FEFO order (earliest expiration first, no
+    date last, ties in insertion order), as parallel tuples. Instances are
+    never modified, so pantries can share them.
+    """
+
+    __slots__ = ("expiration", "amount", "seq")
+
+    def __init__(self, expiration, amount, seq):
+        self.expiration = expiration
+        self.amount = amount
+        self.seq = seq
+
+    @classmethod
+    def from_lots(cls, lots):
+        """Build from (expiration_date, amount, seq) triples in any order."""
+        lots = sorted(lots, key=_fefo_key)
+        return cls(
+            tuple(lot[0] for lot in lots),
+            tuple(lot[1] for lot in lots),
+            tuple(lot[2] for lot in lots),
+        )
+
+    def __len__(self):
+        return len(self.amount)
+
+    @property
+    def total(self):
+        return sum(a for a in self.amount if _has_stock(a))
+
+    def consume(self, required):
+        """
+        Take `required` units FEFO and drop emptied lots.
+        Returns (new ProductLots or None when nothing is left, units still missing).
+        """
+        amount = list(self.amount)
+        for i, available in enumerate(amount):
+            if required <= 0:
+                break
+            if not _has_stock(available):
+                continue
+            used = min(available, required)
+            amount[i] = available - used
+            required -= used
+
+        return self._nonempty(amount), required
+
+    def pruned(self):
+        """Copy without empty lots (None when none are left)."""
+        return self._nonempty(self.amount)
+
+    def _nonempty(self, amount):
+        keep = [i for i, a in enumerate(amount) if _has_stock(a)]
+        if not keep:
+            return None
+        if len(keep) == len(amount) and amount is self.amount:
+            return self
+        return ProductLots(
+            tuple(self.expiration[i] for i in keep),
+            tuple(amount[i] for i in keep),
+            tuple(self.seq[i] for i in keep),
+        )
+
+
+class VirtualPantry:
+    """
+    Copy-on-write virtual pantry keyed by product_id.
+
+    Each product maps to an immutable ProductLots, so applying a recipe
+    builds a new pantry that shares every untouched product with the old
+    one and only re-creates the lots of the products the recipe uses.
+    A derived pantry stores just those changes on top of a parent pointer
+    (None marks a product that ran out); once the chain is MAX_DEPTH deep
+    it is flattened into a new root, so lookups stay short.
+    Converting to and from the list-of-dicts state
+    ([{product_id, amount, expiration_date}, ...]) is lossless: every lot
+    keeps its sequence number, so `to_items()` returns the lots in their
+    original order.
+
+    Consumption follows `RecipeRecommender._apply_recipe_to_virtual_state`:
+    FEFO per ingredient, then empty lots are dropped. Empty lots that came
+    in with the state are dropped on the first applied recipe, as the list
+    version does.
+    """
+
+    MAX_DEPTH = 8
+
+    __slots__ = ("_parent", "_changes", "_depth", "_empty", "_flat")
+
+    def __init__(self, products=None, empty=frozenset(), parent=None):
+        self._parent = parent
+        self._changes = products or {}
+        self._depth = parent._depth + 1 if parent is not None else 0
+        self._empty = empty
+        self._flat = None if parent is not None else self._changes
+
+    @classmethod
+    def from_items(cls, items):
+        """Build from a list of pantry-item dicts (product_id, amount, expiration_date)."""
+        if isinstance(items, VirtualPantry):
+            return items
+
+        grouped = {}
+        for seq, it in enumerate(items):
+            grouped.setdefault(it["product_id"], []).append(
+                (it["expiration_date"], it["amount"], seq)
+            )
+
+        products = {pid: ProductLots.from_lots(lots) for pid, lots in grouped.items()}
+        empty = frozenset(
+            pid for pid, lots in products.items()
+            if not all(_has_stock(a) for a in lots.amount)
+        )
+        return cls(products, empty)
+
+    @property
+    def _products(self):
+        """product_id -> ProductLots with the parent chain applied (built once per pantry)."""
+        if self._flat is None:
+            self._flat = _merged(self._parent._products, self._changes)
+        return self._flat
+
+    def to_items(self):
+        """The list-of-dicts state, in the original lot order."""
+        lots = [
+            (seq, pid, exp, amt)
+            for pid, product in self._products.items()
+            for exp, amt, seq in zip(product.expiration, product.amount, product.seq)
+        ]
+        lots.sort(key=lambda lot: lot[0])
+        return [
+            {"product_id": pid, "amount": amt, "expiration_date": exp}
+            for _, pid, exp, amt in lots
+        ]
+
+    def __iter__(self):
+        return iter(self.to_items())
+
+    def __len__(self):
+        return sum(len(lots) for lots in self._products.values())
+
+    def __bool__(self):
+        return bool(self._products)
+
+    def __contains__(self, product_id):
+        return self.lots(product_id) is not None
+
+    def product_ids(self):
+        return list(self._products)
+
+    def lots(self, product_id):
+        """ProductLots of a product, or None when the pantry has none."""
+        if self._flat is not None:
+            return self._flat.get(product_id)
+        pantry = self
+        while pantry._flat is None:
+            if product_id in pantry._changes:
+                return pantry._changes[product_id]
+            pantry = pantry._parent
+        return pantry._flat.get(product_id)
+
+    def amount(self, product_id):
+        """Total positive amount on hand for a product."""
+        lots = self.lots(product_id)
+        return lots.total if lots is not None else 0
+
+    def consume(self, requirements):
+        """
+        New pantry after consuming (product_id, amount) requirements in order.
+        Only the products in `requirements` (plus any empty lots still left
+        from the input state) are re-created and recorded as changes; all
+        others are read through the parent.
+        """
+        changes = {}
+
+        def current(pid):
+            return changes[pid] if pid in changes else self.lots(pid)
+
+        for pid in self._empty:
+            lots = current(pid)
+            if lots is not None:
+                changes[pid] = lots.pruned()
+
+        for pid, required in requirements:
+            if not pid or not required or required <= 0:
+                continue
+            lots = current(pid)
+            if lots is None:
+                continue
+            changes[pid], _ = lots.consume(required)
+
+        if self._depth + 1 < self.MAX_DEPTH:
+            return VirtualPantry(changes, parent=self)
+
+        return VirtualPantry(_merged(self._products, changes))
+
+    def apply_recipe(self, recipe):
+        """New pantry after cooking an ORM Recipe (matched ingredients, pantry_amount each)."""
+        return self.consume(
+            (ing.matched_product_id, ing.pantry_amount) for ing in recipe.ingredients
+        )
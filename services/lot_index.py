@@ -0,0 +1,98 @@
+import heapq
+from datetime import datetime
+from sqlalchemy.orm import Session
+from database.tables import PantryItem
+
+
+def _fefo_key(expiration_date, pantry_id):
+    return (expiration_date or datetime.max, pantry_id)
+
+
+class FefoLotIndex:
+    """
+    Pantry lots of a set of products held in memory, with one min-heap per
+    product keyed on (expiration_date, pantry_id): earliest expiration first,
+    undated lots last, ties in insertion order (the same FEFO order as
+    recommender_system.virtual_pantry).
+
+    The index is loaded with one SELECT and consume() plans FEFO usage
+    against it in O(log n) per emptied lot, updating the amounts in memory.
+    changes() then gives the net result (rows to delete, amounts to update)
+    so all writes go to the pantry table in one batched flush.
+    """
+
+    def __init__(self, rows):
+        self.lots = {}
+        self.heaps = {}
+        self._deleted = set()
+        self._updated = set()
+
+        for pantry_id, product_id, amount, unit, expiration_date in rows:
+            self.lots[pantry_id] = [0 if amount is None else amount, unit, expiration_date]
+            self.heaps.setdefault(product_id, []).append(_fefo_key(expiration_date, pantry_id))
+        for heap in self.heaps.values():
+            heapq.heapify(heap)
+
+    @classmethod
+    def load(cls, session: Session, product_ids):
+        """Index every pantry lot of `product_ids` (one query)."""
+        product_ids = {pid for pid in product_ids if pid}
+        if not product_ids:
+            return cls([])
+
+        rows = (
+            session.query(
+                PantryItem.pantry_id,
+                PantryItem.product_id,
+                PantryItem.amount,
+                PantryItem.unit,
+                PantryItem.expiration_date,
+            )
+            .filter(PantryItem.product_id.in_(product_ids))
+            .all()
+        )
+        return cls(rows)
+
+    def has_lots(self, product_id):
+        return bool(self.heaps.get(product_id))
+
+    def unit(self, pantry_id):
+        return self.lots[pantry_id][1]
+
+    def expiration_date(self, pantry_id):
+        return self.lots[pantry_id][2]
+
+    def consume(self, product_id, amount):
+        """
+        Take `amount` from the product's lots FEFO. A lot that is used up is
+        popped and marked for deletion; the last lot touched keeps its
+        remainder. Returns ([(pantry_id, used), ...], amount still missing).
+        """
+        heap = self.heaps.get(product_id)
+        used_lots = []
+
+        while heap and amount > 0:
+            pantry_id = heap[0][1]
+            lot = self.lots[pantry_id]
+
+            used = min(lot[0], amount)
+            amount -= used
+            used_lots.append((pantry_id, used))
+
+            if used == lot[0]:
+                heapq.heappop(heap)
+                lot[0] = 0
+                self._deleted.add(pantry_id)
+            else:
+                lot[0] -= used
+                self._updated.add(pantry_id)
+
+        return used_lots, amount
+
+    def changes(self):
+        """(pantry_ids to delete, [{pantry_id, amount}, ...] to update) since the index was loaded."""
+        updates = [
+            {"pantry_id": pantry_id, "amount": self.lots[pantry_id][0]}
+            for pantry_id in sorted(self._updated - self._deleted)
+        ]
+        return sorted(self._deleted), updates
@@ -3,7 +3,7 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-import math
+from collections.abc import Sequence
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 import json
@@ -16,19 +16,121 @@ if str(ROOT) not in sys.path:
 
 from database.tables import Ingredient, PantryItem, TJInventory, PantryEvent, RecipeSelected, Recipe
 from database.config import DATABASE_URL
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, func, insert, update, delete, select, literal, DateTime
+from recommender_system.requirements_artifact import load_requirements_artifact
+from services.lot_index import FefoLotIndex
 
 engine = create_engine(DATABASE_URL)
 
 Session = sessionmaker(bind = engine)
 session = Session()
 
+# Callbacks run after every pantry write as callback(session, product_ids).
+# product_ids is None when the whole pantry may have changed.
+_pantry_listeners = []
+
+
+def add_pantry_listener(callback):
+    """
+    Register a callback that is told which product_ids changed whenever a
+    PantryManager commits a pantry write (used to keep recommender caches warm).
+    """
+    if callback not in _pantry_listeners:
+        _pantry_listeners.append(callback)
+
+
+def remove_pantry_listener(callback):
+    if callback in _pantry_listeners:
+        _pantry_listeners.remove(callback)
+
+
+PANTRY_COLUMNS = (
+    "pantry_id",
+    "product_id",
+    "product_name",
+    "category",
+    "sub_category",
+    "amount",
+    "unit",
+    "date_added",
+    "expiration_date",
+)
+
+
+class PantryRecords(Sequence):
+    """
+    Read-only list-of-dicts view (product_id, amount, expiration_date) over
+    pantry columns, the format the recommender consumes. The arrays are not
+    copied: each dict is built when it is read, with None for a missing
+    amount or expiration date. Slicing returns a view as well.
+    """
+
+    def __init__(self, product_ids, amounts, expirations):
+        self.product_ids = product_ids
+        self.amounts = amounts
+        self.expirations = expirations
+
+    def __len__(self):
+        return len(self.product_ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return PantryRecords(
+                self.product_ids[index], self.amounts[index], self.expirations[index]
+            )
+        amount = float(self.amounts[index])
+        return {
+            "product_id": int(self.product_ids[index]),
+            "amount": None if amount != amount else amount,
+            "expiration_date": self.expirations[index].item(),
+        }
+
+    def __iter__(self):
+        for pid, amount, exp in zip(
+            self.product_ids.tolist(), self.amounts.tolist(), self.expirations.tolist()
+        ):
+            yield {
+                "product_id": pid,
+                "amount": None if amount != amount else amount,
+                "expiration_date": exp,
+            }
 
 
 class PantryManager:
     def __init__(self, session):
         self.session = session
+        self._pending_products = set()
 
+    def commit(self):
+        """
+        Commit the session and notify listeners of every product written by
+        calls made with commit=False since the last commit.
+        """
+        self.session.commit()
+        pending, self._pending_products = self._pending_products, set()
+        self._notify_pantry_change(pending)
+
+    def _flush_lot_changes(self, lots, events=()):
+        """Write a FefoLotIndex's deletes and amount updates, plus PantryEvent rows, as one batch."""
+        deleted, updates = lots.changes()
+        if deleted:
+            self.session.execute(delete(PantryItem).where(PantryItem.pantry_id.in_(deleted)))
+        if updates:
+            self.session.execute(update(PantryItem), updates)
+        if events:
+            self.session.execute(insert(PantryEvent), list(events))
+
+    def _notify_pantry_change(self, product_ids=None):
+        """
+        Tell registered listeners which products were written. Pass None when
+        the change is not limited to known products.
+        """
+        if product_ids is not None:
+            product_ids = {int(pid) for pid in product_ids}
+            if not product_ids:
+                return
+        for callback in list(_pantry_listeners):
+            callback(self.session, product_ids)
 
     def add_item(self, product_id, amount, unit, planned_date = None):
         """
@@ -61,6 +163,7 @@ class PantryManager:
         message = f"Added {amount} {unit} of {tj_product.norm_name}"
         
         self.session.commit()
+        self._notify_pantry_change({product_id})
         
         return message
 
@@ -82,6 +185,7 @@ class PantryManager:
         product_id = pantry_item.product_id
         self.session.delete(pantry_item)
         self.session.commit()
+        self._notify_pantry_change({product_id})
 
         removed_recipes = self.remove_related_planned_recipes(product_id)
 
@@ -98,151 +202,231 @@ class PantryManager:
         """
         Check if ingredients are in pantry first. If ingredient is not there, or not enough of it, add 
         ingredient to grocery list. Return grocery list. 
+        Each ingredient is compared with the full non-expired stock of its product.
         """
 
-        ingredients = self.session.query(Ingredient).filter(Ingredient.recipe_id == recipe_id).all()
+        ingredients = (
+            self.session.query(Ingredient.norm_name, Ingredient.matched_product_id, Ingredient.pantry_amount)
+            .filter(Ingredient.recipe_id == recipe_id)
+            .filter(Ingredient.matched_product_id.isnot(None))
+            .filter(Ingredient.pantry_amount.isnot(None))
+            .order_by(Ingredient.ingredient_id)
+            .all()
+        )
+        product_ids = {ing.matched_product_id for ing in ingredients}
+        on_hand = self._on_hand_amounts(product_ids)
+        products = self._products_by_id(product_ids)
 
         grocery_list = []
         for ingredient in ingredients:
-            pid = getattr(ingredient, "matched_product_id", None)
-            needed = ingredient.pantry_amount
-            if pid is None or needed is None:
+            pid = ingredient.matched_product_id
+            current_amount = on_hand.get(pid, 0)
+            tj_product = products.get(pid)
+            if current_amount >= ingredient.pantry_amount or tj_product is None:
                 continue
-            pantry_items = self.session.query(PantryItem).filter(PantryItem.product_id == ingredient.matched_product_id).all()
-            
-            current_amount = sum(
-                item.amount for item in pantry_items
-                if item.expiration_date >= datetime.now()
-            )
-            has_enough = current_amount >= ingredient.pantry_amount
-
-            if not has_enough:
-                needed_amount = ingredient.pantry_amount - current_amount
-                tj_product = self.session.query(TJInventory).filter(TJInventory.product_id == ingredient.matched_product_id).first()
-
-                if tj_product:
-                    grocery_item = {
-                        'ingredient_name': ingredient.norm_name,
-                        'product_name': tj_product.name,
-                        'product_id': ingredient.matched_product_id,
-                        'amount': tj_product.quantity,      
-                        'unit': tj_product.unit,  
-                        'needed_amount': needed_amount
-                    }
-                    grocery_list.append(grocery_item)
-                
+
+            grocery_list.append({
+                'ingredient_name': ingredient.norm_name,
+                'product_name': tj_product.name,
+                'product_id': pid,
+                'amount': tj_product.quantity,
+                'unit': tj_product.unit,
+                'needed_amount': ingredient.pantry_amount - current_amount
+            })
+
         return grocery_list
     
 
     def get_grocery_list(self, recipe_id_list):
         """
         Get combined grocery list for multiple recipes, combining duplicate products and only buying what's needed.
+
+        Requirements of all recipes (a recipe listed twice counts twice) are
+        summed per product from the memory-mapped requirements artifact, and
+        the non-expired stock is netted once against that total, so stock
+        shared between recipes is not counted for each of them. Shortfalls
+        are rounded up to whole packages in one vectorized step. Apart from
+        the artifact checksum this is two queries: on-hand amounts and
+        package sizes.
         """
 
-        all_items = []
-        for recipe_id in recipe_id_list:
-            items = self.get_needed_recipe_items(recipe_id)
-            all_items.extend(items)
+        reqs = load_requirements_artifact(self.session)
+        rows = reqs.rows_for(recipe_id_list)
+        rows = rows[rows >= 0]
+        if not len(rows):
+            return []
 
-        combined_items = {}
-        for item in all_items:
-            product_name = item['product_name']
-            
-            if product_name in combined_items:
-                combined_items[product_name]['total_needed'] += item['needed_amount']
-            else:
-                combined_items[product_name] = {
-                    'ingredient_name': item['ingredient_name'],
-                    'product_name': item['product_name'],
-                    'product_id': item['product_id'],
-                    'amount': item['amount'],
-                    'unit': item['unit'],
-                    'total_needed': item['needed_amount']
-                }
+        # CSR entries of every requested row, in recipe then ingredient order
+        starts = reqs.indptr[rows]
+        lens = reqs.indptr[rows + 1] - starts
+        entries = np.arange(lens.sum()) + np.repeat(starts - np.cumsum(lens) + lens, lens)
+        needed = np.asarray(reqs.pantry_amount[entries], dtype=np.float64)
+        entries, needed = entries[needed > 0], needed[needed > 0]
+        if not len(entries):
+            return []
+
+        cols, first, inverse = np.unique(reqs.indices[entries], return_index=True, return_inverse=True)
+        total_needed = np.bincount(inverse, weights=needed, minlength=len(cols))
+        product_ids = reqs.product_ids[cols].tolist()
+
+        on_hand = self._on_hand_amounts(set(product_ids))
+        products = self._products_by_id(product_ids)
+
+        current = np.array([on_hand.get(pid, 0) for pid in product_ids], dtype=np.float64)
+        package = np.array(
+            [(products[pid].quantity or 0) if pid in products else 0 for pid in product_ids],
+            dtype=np.float64,
+        )
+        shortfall = total_needed - current
+        buy = (shortfall > 0) & np.array([pid in products for pid in product_ids], dtype=bool)
+
+        # Products without a package size are bought as a single package
+        quantity = np.where(package > 0, np.ceil(shortfall / np.where(package > 0, package, 1)), 1)
 
-        
         combined_grocery_list = []
-        for item in combined_items.values():        
-            quantity = math.ceil(item['total_needed'] / item['amount'])
-            
+        for i in np.flatnonzero(buy)[np.argsort(first[buy], kind="stable")].tolist():
+            pid = product_ids[i]
+            tj_product = products[pid]
             combined_grocery_list.append({
-                'ingredient_name': item['ingredient_name'],
-                'product_name': item['product_name'],
-                'product_id': item['product_id'],
-                'amount': item['amount'],
-                'unit': item['unit'],
-                'quantity': quantity,
-                'total_needed': item['total_needed']
+                'ingredient_name': reqs.ingredient_names[int(entries[first[i]])],
+                'product_name': tj_product.name,
+                'product_id': pid,
+                'amount': tj_product.quantity,
+                'unit': tj_product.unit,
+                'quantity': int(quantity[i]),
+                'total_needed': float(shortfall[i])
             })
         
         return combined_grocery_list
     
 
-    def add_grocery_list(self, grocery_list, planned_date=None):
+    def _products_by_id(self, product_ids):
+        """TJInventory name, package quantity and unit per product_id, from one IN query."""
+        if not product_ids:
+            return {}
+
+        return {
+            p.product_id: p
+            for p in self.session.query(
+                TJInventory.product_id, TJInventory.name, TJInventory.quantity, TJInventory.unit
+            ).filter(TJInventory.product_id.in_(set(product_ids)))
+        }
+
+    def _on_hand_amounts(self, product_ids):
         """
-        Add items from grocery list to pantry. Each package of an item is tracked
-        separately for expiration purposes, using the planned_date as the purchase
-        date (if provided).
+        Total non-expired pantry amount per product_id, from one grouped query.
         """
+        if not product_ids:
+            return {}
+
+        rows = (
+            self.session.query(PantryItem.product_id, func.sum(PantryItem.amount))
+            .filter(PantryItem.product_id.in_(product_ids))
+            .filter(PantryItem.expiration_date >= datetime.now())
+            .group_by(PantryItem.product_id)
+            .all()
+        )
+        return {pid: total or 0 for pid, total in rows}
 
-        messages = []
-
-        for item in grocery_list:
-            product_id = item["product_id"]
-            amount_per_package = item["amount"]
-            unit = item["unit"]
-            qty = item["quantity"]
+    def add_items_bulk(self, records, purchase_date=None, commit=True):
+        """
+        Add many packages in one transaction. Each record is a dict with
+        product_id, amount (per package), unit and optionally quantity
+        (number of packages, default 1) and product_name (for warnings).
+        Every package is still its own pantry row for expiration tracking.
+
+        Products are fetched with one IN query, expirations are computed in
+        one vectorized pass from purchase_date (default now) and the rows go
+        in with a single executemany insert and one commit (deferred to
+        commit() when commit=False). Returns one message per record, like
+        add_grocery_list.
+        """
+        records = list(records)
+        if not records:
+            return []
 
-            tj_product = (
-                self.session.query(TJInventory)
-                .filter(TJInventory.product_id == product_id)
-                .first()
-            )
+        if purchase_date is None:
+            date_purchased = datetime.now()
+        elif isinstance(purchase_date, datetime):
+            date_purchased = purchase_date
+        else:
+            date_purchased = datetime.combine(purchase_date, datetime.min.time())
+
+        product_ids = {rec["product_id"] for rec in records}
+        products = {
+            p.product_id: p
+            for p in self.session.query(
+                TJInventory.product_id, TJInventory.name, TJInventory.shelf_life_days
+            ).filter(TJInventory.product_id.in_(product_ids))
+        }
 
-            if not tj_product:
+        messages = []
+        found = []
+        for rec in records:
+            tj_product = products.get(rec["product_id"])
+            if tj_product is None:
                 messages.append(
-                    f"Warning: Could not find TJ product for product_id {product_id} "
-                    f"({item.get('product_name', 'Unknown')})"
+                    f"Warning: Could not find TJ product for product_id {rec['product_id']} "
+                    f"({rec.get('product_name', 'Unknown')})"
                 )
                 continue
-            planned_date = None
-            if planned_date:
-                if isinstance(planned_date, datetime):
-                    date_purchased = planned_date
-                else:
-                    date_purchased = datetime.combine(planned_date, datetime.min.time())
-            else:
-                date_purchased = datetime.now()
-
-            shelf_days = tj_product.shelf_life_days or 0
-            expiration_date = date_purchased + timedelta(days=shelf_days)
-
-            for _ in range(qty):
-                pantry_item = PantryItem(
-                    product_id=product_id,
-                    amount=amount_per_package,
-                    unit=unit,
-                    date_added=date_purchased,
-                    expiration_date=expiration_date,
-                )
-                self.session.add(pantry_item)
-
+            found.append(rec)
             messages.append(
-                f"Added {qty} package(s) of {tj_product.name} "
-                f"({amount_per_package} {unit} each)"
+                f"Added {rec.get('quantity', 1)} package(s) of {tj_product.name} "
+                f"({rec['amount']} {rec['unit']} each)"
             )
-            print(messages)
-        self.session.commit()
+
+        if not found:
+            return messages
+
+        shelf_days = np.array(
+            [products[rec["product_id"]].shelf_life_days or 0 for rec in found], dtype="timedelta64[D]"
+        )
+        expirations = (np.datetime64(date_purchased, "us") + shelf_days).tolist()
+
+        rows = [
+            {
+                "product_id": rec["product_id"],
+                "amount": rec["amount"],
+                "unit": rec["unit"],
+                "date_added": date_purchased,
+                "expiration_date": expiration_date,
+            }
+            for rec, expiration_date in zip(found, expirations)
+            for _ in range(int(rec.get("quantity", 1)))
+        ]
+        if rows:
+            self.session.execute(insert(PantryItem), rows)
+        self._pending_products.update(row["product_id"] for row in rows)
+        if commit:
+            self.commit()
         return messages
 
+    def add_grocery_list(self, grocery_list, planned_date=None):
+        """
+        Add items from grocery list to pantry. Each package of an item is tracked
+        separately for expiration purposes. Packages are dated at purchase time
+        (now); planned_date is accepted for the callers that pass it.
+        """
+        return self.add_items_bulk(grocery_list)
+
 
     def delete_recipe_items(self, recipe_id):
         """ 
         Remove amounts of all ingredients for a recipe from the pantry. Use oldest items first (first in, first out based on
         expiration date).
+        Lots are planned against a FefoLotIndex and written in one batch.
         """
 
-        ingredients = self.session.query(Ingredient).filter(Ingredient.recipe_id == recipe_id).all()
+        ingredients = (
+            self.session.query(
+                Ingredient.norm_name, Ingredient.matched_product_id, Ingredient.pantry_amount, Ingredient.unit
+            )
+            .filter(Ingredient.recipe_id == recipe_id)
+            .order_by(Ingredient.ingredient_id)
+            .all()
+        )
+        lots = FefoLotIndex.load(self.session, {ing.matched_product_id for ing in ingredients})
 
         messages = []
         for ingredient in ingredients:
@@ -250,70 +434,75 @@ class PantryManager:
                 messages.append(f"Warning: No product matched for {ingredient.norm_name}")
                 continue
 
-            pantry_items = self.session.query(PantryItem).filter(
-                PantryItem.product_id == ingredient.matched_product_id
-            ).order_by(PantryItem.expiration_date).all()
-            
-            if not pantry_items:
+            if not lots.has_lots(ingredient.matched_product_id):
                 messages.append(f"Warning: {ingredient.norm_name} not found in pantry")
                 continue
-            
-            amount_needed = ingredient.pantry_amount
-            items_used = []
-            
-            for pantry_item in pantry_items:
-                if amount_needed <= 0:
-                    break
-                
-                if pantry_item.amount <= amount_needed:
-                    amount_needed -= pantry_item.amount
-                    items_used.append(pantry_item.amount)
-                    self.session.delete(pantry_item)
-                else:
-                    pantry_item.amount -= amount_needed
-                    items_used.append(amount_needed)
-                    amount_needed = 0
-            
-            total_used = sum(items_used)
-            message = f"Removed {total_used} {ingredient.unit} of {ingredient.norm_name} ({len(items_used)} package(s))"
+
+            used_lots, _ = lots.consume(ingredient.matched_product_id, ingredient.pantry_amount)
+            total_used = sum(used for _, used in used_lots)
+            message = f"Removed {total_used} {ingredient.unit} of {ingredient.norm_name} ({len(used_lots)} package(s))"
             messages.append(message)
         
-        self.session.commit()
+        self._flush_lot_changes(lots)
+        self._pending_products.update(ing.matched_product_id for ing in ingredients if ing.matched_product_id)
+        self.commit()
 
         return "\n".join(messages)
     
 
+    def get_pantry_columns(self):
+        """
+        The pantry joined with tj_inventory in one SELECT, as typed NumPy
+        columns in pantry_id order: pantry_id/product_id int64, amount
+        float64 (NaN = unknown), date_added/expiration_date datetime64[us]
+        (NaT = none) and object arrays for the text columns. Items whose
+        product is not in tj_inventory are left out.
+        """
+        rows = (
+            self.session.query(
+                PantryItem.pantry_id,
+                PantryItem.product_id,
+                TJInventory.name,
+                TJInventory.category,
+                TJInventory.sub_category,
+                PantryItem.amount,
+                PantryItem.unit,
+                PantryItem.date_added,
+                PantryItem.expiration_date,
+            )
+            .join(TJInventory, TJInventory.product_id == PantryItem.product_id)
+            .order_by(PantryItem.pantry_id)
+            .all()
+        )
+        cols = list(zip(*rows)) if rows else [()] * len(PANTRY_COLUMNS)
+
+        def text(values):
+            out = np.empty(len(values), dtype=object)
+            out[:] = values
+            return out
+
+        return {
+            "pantry_id": np.array(cols[0], dtype=np.int64),
+            "product_id": np.array(cols[1], dtype=np.int64),
+            "product_name": text(cols[2]),
+            "category": text(cols[3]),
+            "sub_category": text(cols[4]),
+            "amount": np.array([np.nan if a is None else a for a in cols[5]], dtype=np.float64),
+            "unit": text(cols[6]),
+            "date_added": np.array(cols[7], dtype="datetime64[us]"),
+            "expiration_date": np.array(cols[8], dtype="datetime64[us]"),
+        }
+
     def get_pantry_items(self):
         """
         Get all items currently in the pantry as a DataFrame.
         Includes category + subcategory for filtering and visualizations.
+        Built from get_pantry_columns, with categorical category columns.
         """
-
-        pantry_items = self.session.query(PantryItem).all()
-
-        items_data = []
-        for pantry_item in pantry_items:
-            tj_product = (
-                self.session.query(TJInventory)
-                .filter(TJInventory.product_id == pantry_item.product_id)
-                .first()
-            )
-
-            if tj_product:
-                items_data.append({
-                    'pantry_id': pantry_item.pantry_id,
-                    'product_id': pantry_item.product_id,
-                    'product_name': tj_product.name,
-                    'category': tj_product.category,
-                    'sub_category': tj_product.sub_category,
-                    'amount': pantry_item.amount,
-                    'unit': pantry_item.unit,
-                    'date_added': pantry_item.date_added,
-                    'expiration_date': pantry_item.expiration_date
-                })
-
-        return pd.DataFrame(items_data)
-    
+        cols = self.get_pantry_columns()
+        for name in ("category", "sub_category"):
+            cols[name] = pd.Categorical(cols[name])
+        return pd.DataFrame(cols, columns=PANTRY_COLUMNS)
 
     def get_expiring_soonest(self):
         """
@@ -347,20 +536,11 @@ class PantryManager:
     
     def get_all_items(self):
         """
-        Return pantry items in list-of-dict format for the recommender.
+        Return pantry items in list-of-dict format for the recommender, as a
+        PantryRecords view over the pantry columns.
         """
-        df = self.get_pantry_items()
-        if df.empty:
-            return []
-
-        return [
-            {
-                "product_id": row.product_id,
-                "amount": row.amount,
-                "expiration_date": row.expiration_date
-            }
-            for _, row in df.iterrows()
-        ]
+        cols = self.get_pantry_columns()
+        return PantryRecords(cols["product_id"], cols["amount"], cols["expiration_date"])
     
     def import_state(self, virtual_state: list):
         """
@@ -381,65 +561,74 @@ class PantryManager:
         Consume pantry items FIFO/FEFO for a recipe.
         Logs PantryEvent(event_type='consume') for each usage.
         """
+        self.consume_recipes([(recipe_id, sel_id)])
 
-        ingredients = (
-            self.session.query(Ingredient)
-            .filter(Ingredient.recipe_id == recipe_id)
-            .all()
-        )
-
-        for ing in ingredients:
-            if not ing.matched_product_id:
-                continue
-
-            needed = ing.pantry_amount
-            if needed is None or needed <= 0:
-                continue
-
-            pantry_items = (
-                self.session.query(PantryItem)
-                .filter(PantryItem.product_id == ing.matched_product_id)
-                .order_by(PantryItem.expiration_date.asc())  # FEFO
-                .all()
-            )
-
-            for pi in pantry_items:
-                if needed <= 0:
-                    break
-
-                used = min(pi.amount, needed)
-                needed -= used
-
+    def consume_recipes(self, selections, commit=True):
+        """
+        Consume pantry items FEFO for (recipe_id, sel_id) pairs, in order, as
+        one transaction. Each lot used logs PantryEvent(event_type='consume'),
+        preceded by an 'avoid' event when the lot expires within two days.
+
+        The ingredients of every recipe are read in one query and the lots of
+        their products loaded once into a FefoLotIndex, so there are no
+        per-ingredient SELECTs. Deletes, amount updates and events are
+        written in one batched flush; with commit=False the caller commits
+        through commit().
+        """
+        selections = list(selections)
+        recipe_ids = {recipe_id for recipe_id, _ in selections}
+        if not recipe_ids:
+            return
+
+        ingredients_by_recipe = {}
+        for rid, pid, needed in (
+            self.session.query(Ingredient.recipe_id, Ingredient.matched_product_id, Ingredient.pantry_amount)
+            .filter(Ingredient.recipe_id.in_(recipe_ids))
+            .filter(Ingredient.matched_product_id.isnot(None))
+            .order_by(Ingredient.recipe_id, Ingredient.ingredient_id)
+        ):
+            ingredients_by_recipe.setdefault(rid, []).append((pid, needed))
+
+        touched = {pid for ings in ingredients_by_recipe.values() for pid, _ in ings}
+        lots = FefoLotIndex.load(self.session, touched)
+        today = datetime.now().date()
+
+        events = []
+        for recipe_id, sel_id in selections:
+            for pid, needed in ingredients_by_recipe.get(recipe_id, []):
+                if needed is None or needed <= 0:
+                    continue
 
-                expiring_soon = (
-                    pi.expiration_date.date() - datetime.now().date()
-                ) <= timedelta(days=2)
+                used_lots, _ = lots.consume(pid, needed)
+                for pantry_id, used in used_lots:
+                    unit = lots.unit(pantry_id)
+                    expiration_date = lots.expiration_date(pantry_id)
 
-                if expiring_soon:
-                    avoid_event = PantryEvent(
-                        pantry_id=pi.pantry_id,
-                        event_type="avoid",
-                        amount=used,
-                        unit=pi.unit,
-                        recipe_selection_id=sel_id
+                    expiring_soon = (
+                        expiration_date is not None
+                        and (expiration_date.date() - today) <= timedelta(days=2)
                     )
-                    self.session.add(avoid_event)
-
-                event = PantryEvent(
-                    pantry_id=pi.pantry_id,
-                    event_type="consume",
-                    amount=used,
-                    unit=pi.unit,
-                    recipe_selection_id=sel_id
-                )
-                self.session.add(event)
-
-                if used == pi.amount:
-                    self.session.delete(pi)
-                else:
-                    pi.amount -= used
-
-        self.session.commit()
+                    if expiring_soon:
+                        events.append({
+                            "pantry_id": pantry_id,
+                            "event_type": "avoid",
+                            "amount": used,
+                            "unit": unit,
+                            "recipe_selection_id": sel_id,
+                        })
+
+                    events.append({
+                        "pantry_id": pantry_id,
+                        "event_type": "consume",
+                        "amount": used,
+                        "unit": unit,
+                        "recipe_selection_id": sel_id,
+                    })
+
+        self._flush_lot_changes(lots, events)
+        self._pending_products.update(touched)
+        if commit:
+            self.commit()
 
     def clear_pantry(self):
         """
@@ -447,64 +636,49 @@ class PantryManager:
         - Delete ALL pantry items
         - Delete ALL planned recipes
         - Delete ALL pantry events (consume, trash, avoid)
+        One DELETE per table in a single transaction; messages report the row counts.
         """
 
-        messages = []
-
-        events = self.session.query(PantryEvent).all()
-        num_events = len(events)
-        for ev in events:
-            self.session.delete(ev)
-        messages.append(f"Deleted {num_events} pantry events.")
-
-        pantry_items = self.session.query(PantryItem).all()
-        num_items = len(pantry_items)
-        for pi in pantry_items:
-            self.session.delete(pi)
-        messages.append(f"Deleted {num_items} pantry items.")
-
-        planned = self.session.query(RecipeSelected).all()
-        num_planned = len(planned)
-        for p in planned:
-            self.session.delete(p)
-        messages.append(f"Deleted {num_planned} planned recipes.")
+        num_events = self._bulk_delete(delete(PantryEvent))
+        num_items = self._bulk_delete(delete(PantryItem))
+        num_planned = self._bulk_delete(delete(RecipeSelected))
 
         self.session.commit()
+        self._notify_pantry_change()
 
-        return messages
+        return [
+            f"Deleted {num_events} pantry events.",
+            f"Deleted {num_items} pantry items.",
+            f"Deleted {num_planned} planned recipes.",
+        ]
     
     def trash_pantry(self, category=None):
         """
         Throw away all pantry items, OR only items of a given category.
         Logs PantryEvent(event_type='trash') for each removal.
+        The events are written with one INSERT ... SELECT from the pantry and
+        the items removed with one DELETE, in a single transaction, so no
+        rows are loaded; messages report the counts.
         """
 
-        messages = []
-
-        q = self.session.query(PantryItem).join(TJInventory)
+        selected = (
+            select(PantryItem.pantry_id)
+            .join(TJInventory, TJInventory.product_id == PantryItem.product_id)
+        )
         if category:
-            q = q.filter(TJInventory.category == category)
-
-        items = q.all()
-
-        for pi in items:
-            event = PantryEvent(
-                pantry_id=pi.pantry_id,
-                event_type="trash",
-                amount=pi.amount,
-                unit=pi.unit,
-                recipe_selection_id=None
-            )
-            self.session.add(event)
+            selected = selected.where(TJInventory.category == category)
 
-            self.session.delete(pi)
+        touched = None
+        if category:
+            touched = self._distinct_products(PantryItem.pantry_id.in_(selected))
 
-            messages.append(
-                f"Trashed {pi.amount} {pi.unit} of product_id={pi.product_id}"
-            )
+        num_events = self._log_events_from_pantry("trash", PantryItem.pantry_id.in_(selected))
+        num_items = self._bulk_delete(delete(PantryItem).where(PantryItem.pantry_id.in_(selected)))
 
         self.session.commit()
+        self._notify_pantry_change(touched)
 
+        messages = [f"Trashed {num_items} pantry item(s), logged {num_events} trash event(s)."]
         if category:
             messages.append(f"All items in category '{category}' trashed.")
         else:
@@ -512,6 +686,35 @@ class PantryManager:
 
         return messages
 
+    def _bulk_delete(self, statement):
+        """Run a bulk DELETE without loading the rows into the session; returns the row count."""
+        result = self.session.execute(statement, execution_options={"synchronize_session": False})
+        return result.rowcount
+
+    def _log_events_from_pantry(self, event_type, *criteria):
+        """
+        INSERT INTO pantry_event ... SELECT from the pantry rows matching
+        `criteria` (amount and unit of each lot). Returns the row count.
+        """
+        statement = insert(PantryEvent).from_select(
+            ["pantry_id", "timestamp", "event_type", "amount", "unit"],
+            select(
+                PantryItem.pantry_id,
+                literal(datetime.now(), DateTime),
+                literal(event_type),
+                PantryItem.amount,
+                PantryItem.unit,
+            ).where(*criteria),
+        )
+        return self.session.execute(statement).rowcount
+
+    def _distinct_products(self, *criteria):
+        """Distinct product_ids of the pantry rows matching `criteria` (at most one per catalog product)."""
+        return {
+            pid for (pid,) in
+            self.session.query(PantryItem.product_id).filter(*criteria).distinct()
+        }
+
     def remove_related_planned_recipes(self, product_id):
         """
         Remove planned/confirmed recipes that rely on a specific pantry product.
@@ -567,6 +770,7 @@ class PantryManager:
         self.session.add(event)
         self.session.delete(pantry_item)
         self.session.commit()
+        self._notify_pantry_change({product_id})
 
         removed_recipes = self.remove_related_planned_recipes(product_id)
 
@@ -781,6 +985,7 @@ class PantryManager:
         add_backdated_items("Fresh Fruits & Veggies", 2)
 
         self.session.commit()
+        self._notify_pantry_change()
 
         return messages
 
@@ -791,42 +996,31 @@ class PantryManager:
         - Expired = expiration_date < now
         - Log a PantryEvent for each (event_type='trash_expired')
         - Remove the item from the pantry
+
+        Events for lots with a positive amount are written with one
+        INSERT ... SELECT and the lots removed with one DELETE, in a single
+        transaction, so memory does not grow with the number of lots.
         """
 
         now = datetime.now()
-
-        expired_items = (
-            self.session.query(PantryItem)
-            .filter(PantryItem.expiration_date.isnot(None))
-            .filter(PantryItem.expiration_date < now)
-            .all()
+        expired = (
+            PantryItem.expiration_date.isnot(None),
+            PantryItem.expiration_date < now,
         )
 
-        if not expired_items:
+        touched = self._distinct_products(*expired)
+        if not touched:
             return ["No expired items found."]
 
-        messages = []
-
-        for item in expired_items:
-            amount = item.amount or 0
-            unit = item.unit
-            product_name = item.product.name if item.product else "Unknown item"
-
-            if amount > 0:
-                evt = PantryEvent(
-                    pantry_id=item.pantry_id,
-                    event_type="trash_expired",
-                    amount=amount,
-                    unit=unit,
-                )
-
-                self.session.add(evt)
-            self.session.delete(item)
-
-            messages.append(f"Trashed {amount} {unit} of {product_name} (expired).")
+        num_events = self._log_events_from_pantry("trash_expired", *expired, PantryItem.amount > 0)
+        num_items = self._bulk_delete(delete(PantryItem).where(*expired))
 
         self.session.commit()
-        return messages
+        self._notify_pantry_change(touched)
+        return [
+            f"Trashed {num_items} expired item(s) across {len(touched)} product(s), "
+            f"logged {num_events} as waste."
+        ]
 
 if __name__ == "__main__":
     pantry_ids = set(item.product_id for item in session.query(PantryItem).all())
@@ -80,28 +80,41 @@ class RecipeManager:
         return planned
 
     def confirm_recipe(self, sel_id: int):
+        confirmed = self.confirm_recipes([sel_id])
+        return confirmed[0] if confirmed else None
+
+    def confirm_recipes(self, sel_ids):
+        """
+        Confirm several planned recipes (e.g. a whole week) in one
+        transaction: buy the combined grocery list, which nets pantry stock
+        shared between the recipes, then consume the recipes in planned
+        order and mark them cooked. Returns the confirmed RecipeSelected rows.
+        """
+        sel_ids = list(sel_ids)
+        if not sel_ids:
+            return []
 
         planned = (
             self.session.query(RecipeSelected)
-            .filter_by(sel_id=sel_id)
-            .first()
+            .filter(RecipeSelected.sel_id.in_(sel_ids))
+            .order_by(RecipeSelected.planned_for.asc(), RecipeSelected.sel_id)
+            .all()
         )
         if not planned:
-            return None
-
-        recipe_id = planned.recipe_id
-        planned_date = planned.planned_for.date() if planned.planned_for else datetime.now().date()
+            return []
 
         pm = PantryManager(self.session)
-        grocery_list = pm.get_grocery_list([recipe_id])
+        grocery_list = pm.get_grocery_list([p.recipe_id for p in planned])
 
         if grocery_list:
-            pm.add_grocery_list(grocery_list, planned_date)
+            pm.add_items_bulk(grocery_list, commit=False)
 
-        pm.consume_recipe(recipe_id, sel_id)
+        pm.consume_recipes([(p.recipe_id, p.sel_id) for p in planned], commit=False)
 
-        planned.cooked_at = datetime.now()
-        self.session.commit()
+        cooked_at = datetime.now()
+        for p in planned:
+            p.cooked_at = cooked_at
+        pm.commit()
 
         return planned
 
@@ -245,7 +245,7 @@ with col2:
 
         def render_category_totals(dfx, title):
             chart_df = (
-                dfx.groupby("category")["amount"]
+                dfx.groupby("category", observed=True)["amount"]
                 .sum()
                 .reindex(categories)
                 .fillna(0)
@@ -338,8 +338,12 @@ with col3:
         num = st.number_input("Packages to Add", min_value=1, step=1)
 
         if st.button("Add to Pantry"):
-            for _ in range(num):
-                pm.add_item(prod.product_id, prod.quantity, prod.unit)
+            pm.add_items_bulk([{
+                "product_id": prod.product_id,
+                "amount": prod.quantity,
+                "unit": prod.unit,
+                "quantity": num,
+            }])
             st.success(f"Added {num} × {prod.name}")
             st.rerun()
 
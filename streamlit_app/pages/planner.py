@@ -1,6 +1,7 @@
 import streamlit as st
 import plotly.graph_objects as go
 import pandas as pd
+import numpy as np
 from datetime import datetime, timedelta
 import plotly.graph_objects as go
 from config.theme_config import apply_base_config
@@ -10,6 +11,12 @@ from database.tables import TJInventory
 from services.recipe_manager import RecipeManager
 from services.pantry_manager import PantryManager
 from recommender_system.recipe_recommender_sys import RecipeRecommender
+from recommender_system.virtual_pantry import VirtualPantry
+from recommender_system.meal_slots import MEAL_SLOTS, SLOT_HOURS, allowed_slots
+from recommender_system.background_worker import RecommendationWorker
+from recommender_system.result_cache import (
+    LRUResultCache, real_pantry_key, planned_fingerprint, state_fingerprint, time_bucket
+)
 
 apply_base_config()
 render_sidebar()
@@ -21,29 +28,56 @@ rm = RecipeManager(session)
 pm = PantryManager(session)
 recommender = RecipeRecommender(session)
 
+@st.cache_resource
+def get_virtual_pantry_cache():
+    return LRUResultCache(max_entries=32)
+
+@st.cache_resource
+def get_recommendation_worker():
+    """One background recommendation worker per server, fed by PantryManager writes."""
+    return RecommendationWorker(str(session.get_bind().url)).start()
+
 def rebuild_virtual_pantry():
     """
     Build a virtual pantry that mirrors the real pantry structure:
     a list of individual items, each with its own expiration date.
+    Reuses the last build while the pantry, planning queue and time bucket
+    are unchanged.
     """
+    cache = get_virtual_pantry_cache()
+    key = (
+        real_pantry_key(session),
+        planned_fingerprint(st.session_state.planned_recipes),
+        time_bucket(),
+    )
+    cached = cache.get(key)
+    if cached is None:
+        cached = _build_virtual_pantry()
+        cache.put(key, cached)
+
+    # VirtualPantry is immutable, so every caller gets fresh dicts
+    return cached.to_items()
+
+def _build_virtual_pantry():
     items = [
         it for it in recommender.pm.get_all_items()
         if it["expiration_date"] and it["expiration_date"] > datetime.now()
     ]
 
-    state = [
+    state = VirtualPantry.from_items(
         {
             "product_id": item["product_id"],
             "amount": item["amount"],
             "expiration_date": item["expiration_date"],
         }
         for item in items
-    ]
+    )
     planned_sorted = sorted(
         st.session_state.planned_recipes.items(),
         key=lambda kv: kv[1]["planned_for"] or "9999-12-31"
     )
 
+    # Each recipe only re-creates the lots of the products it uses
     for sel_id, pdata in planned_sorted:
         if pdata.get("status") == "confirmed":
             continue
@@ -51,7 +85,7 @@ def rebuild_virtual_pantry():
         rid = pdata["recipe_id"]
         recipe = rm.get_recipe_by_id(rid)
         if recipe:
-            state = recommender._apply_recipe_to_virtual_state(recipe, state)
+            state = state.apply_recipe(recipe)
 
     return state
 
@@ -166,27 +200,14 @@ def compute_optimal_date_for_recipe(
 
     today = datetime.now().date()
 
-    norm_cat = recommender.normalize_category_label(recipe).lower()
-
-    allowed_slots = set()
-    if "breakfast" in norm_cat: allowed_slots.add("Breakfast")
-    if "lunch" in norm_cat: allowed_slots.add("Lunch")
-    if "dinner" in norm_cat: allowed_slots.add("Dinner")
-    if any(x in norm_cat for x in ["appetizer", "side", "snack"]):
-        allowed_slots.add("Snack")
-    if "dessert" in norm_cat:
-        allowed_slots.add("Dessert")
-    if any(x in norm_cat for x in ["beverage", "drink", "cocktail"]):
-        allowed_slots.add("Beverage")
-    if not allowed_slots:
-        allowed_slots = set(MEAL_SLOTS)
+    slots = allowed_slots(recommender.normalize_category_label(recipe))
 
     raw_day, raw_slot, earliest_exp = compute_optimal_date_for_recipe_no_override(
         recipe, virtual_state, planned_recipes
     )
     if current_day and current_slot and sel_id:
 
-        if current_slot in allowed_slots:
+        if current_slot in slots:
 
             conflict = any(
                 pdata.get("planned_for") == str(current_day)
@@ -201,78 +222,93 @@ def compute_optimal_date_for_recipe(
 
     return raw_day, raw_slot, earliest_exp
 
+@st.cache_resource
+def get_day_score_cache():
+    return LRUResultCache(max_entries=8)
+
+def day_score_matrix(virtual_state):
+    """
+    Recipe x day x slot scores for the virtual pantry over SEARCH_RANGE
+    days, each slot scored at its SLOT_HOURS time, computed once per pantry
+    state and time bucket and shared by every date suggestion on the page.
+    """
+    cache = get_day_score_cache()
+    key = (state_fingerprint(virtual_state), recommender.engine.version, time_bucket())
+    cached = cache.get(key)
+    if cached is None:
+        cached = recommender.score_by_day(
+            SEARCH_RANGE,
+            virtual_pantry_state=virtual_state,
+            slot_hours=[SLOT_HOURS[slot] for slot in MEAL_SLOTS],
+        )
+        cache.put(key, cached)
+    return cached
+
+def before_first_drop(scores, times):
+    """
+    Mask of (day, slot) cells scored before the recipe's score first drops.
+    Urgency only rises as time passes, so a lower score than an earlier
+    slot means one of its lots has expired by then.
+    """
+    order = np.argsort(times, axis=None, kind="stable")
+    flat = scores.ravel()[order]
+    peak = np.maximum.accumulate(flat)
+    ok = np.logical_and.accumulate(flat >= peak * (1 - 1e-9))
+    mask = np.empty(flat.shape, dtype=bool)
+    mask[order] = ok
+    return mask.reshape(scores.shape)
+
+def slot_occupancy(planned_recipes, today, n_days):
+    """Boolean days x MEAL_SLOTS matrix of slots already taken in the planning queue."""
+    occupied = np.zeros((n_days, len(MEAL_SLOTS)), dtype=bool)
+    for pdata in planned_recipes.values():
+        try:
+            d = (datetime.fromisoformat(str(pdata.get("planned_for"))).date() - today).days
+        except ValueError:
+            continue
+        slot = pdata.get("meal_slot")
+        if 0 <= d < n_days and slot in MEAL_SLOTS:
+            occupied[d, MEAL_SLOTS.index(slot)] = True
+    return occupied
+
 def compute_optimal_date_for_recipe_no_override(recipe, virtual_state, planned_recipes):
-    """Original version that computes best date/slot WITHOUT override logic."""
+    """
+    Best date/slot WITHOUT override logic: the earliest free allowed slot
+    on or before the earliest expiration, skipping slots whose score in the
+    recipe x day matrix has dropped because a lot expired; otherwise the
+    earliest free allowed slot.
+    """
 
     today = datetime.now().date()
-    SEARCH_RANGE = 14
 
-    exp_dates = []
-    for ing in recipe.ingredients:
-        pid = getattr(ing, "matched_product_id", None)
-        if not pid:
-            continue
+    day_scores = day_score_matrix(virtual_state)
+    row = day_scores["index"].get(recipe.recipe_id)
+    scores = (
+        day_scores["scores"][row] if row is not None
+        else np.zeros((SEARCH_RANGE, len(MEAL_SLOTS)))
+    )
 
-        now = datetime.now()
-        entries = [
-            it for it in virtual_state
-            if it["product_id"] == pid
-            and it["expiration_date"]
-            and it["expiration_date"] > now
-        ]
-        if not entries:
-            continue
+    soonest = day_scores["soonest_expiration"][row] if row is not None else np.inf
+    earliest_exp = (
+        datetime.fromtimestamp(soonest).date() if np.isfinite(soonest)
+        else today + timedelta(days=10)
+    )
 
-        exp = min(
-            (it["expiration_date"] for it in entries if it["expiration_date"]),
-            default=None
-        )
+    slots = allowed_slots(recommender.normalize_category_label(recipe))
+    slot_cols = [MEAL_SLOTS.index(slot) for slot in slots]
 
-        if isinstance(exp, datetime):
-            exp = exp.date()
+    free = ~slot_occupancy(planned_recipes, today, SEARCH_RANGE)[:, slot_cols]
+    before_exp = (np.arange(SEARCH_RANGE) <= (earliest_exp - today).days)[:, None]
+    fresh = before_first_drop(scores, day_scores["times"])[:, slot_cols]
 
-        if exp:
-            exp_dates.append(exp)
-
-    earliest_exp = min(exp_dates) if exp_dates else today + timedelta(days=10)
-
-
-    norm_cat = recommender.normalize_category_label(recipe).lower()
-    slots = set()
-    if "breakfast" in norm_cat: slots.add("Breakfast")
-    if "lunch" in norm_cat: slots.add("Lunch")
-    if "dinner" in norm_cat: slots.add("Dinner")
-    if any(x in norm_cat for x in ["appetizer","side","snack"]): slots.add("Snack")
-    if "dessert" in norm_cat: slots.add("Dessert")
-    if any(x in norm_cat for x in ["beverage","drink","cocktail"]): slots.add("Beverage")
-    if not slots:
-        slots = set(MEAL_SLOTS)
-
-    for offset in range(SEARCH_RANGE):
-        d = today + timedelta(days=offset)
-        if d > earliest_exp:
-            break
-        used = {
-            pdata.get("meal_slot")
-            for rid2, pdata in planned_recipes.items()
-            if pdata.get("planned_for") == str(d)
-        }
-        for slot in slots:
-            if slot not in used:
-                return d, slot, earliest_exp
-
-    for offset in range(SEARCH_RANGE):
-        d = today + timedelta(days=offset)
-        used = {
-            pdata.get("meal_slot")
-            for rid2, pdata in planned_recipes.items()
-            if pdata.get("planned_for") == str(d)
-        }
-        for slot in slots:
-            if slot not in used:
-                return d, slot, earliest_exp
+    # Forward scan: days up to the earliest expiration while every lot is
+    # still usable at the slot's time, then any open day
+    for candidates in (free & before_exp & fresh, free):
+        if candidates.any():
+            d, s = np.argwhere(candidates)[0]
+            return today + timedelta(days=int(d)), MEAL_SLOTS[slot_cols[s]], earliest_exp
 
-    return today + timedelta(days=1), list(slots)[0], earliest_exp
+    return today + timedelta(days=1), MEAL_SLOTS[slot_cols[0]], earliest_exp
 
 def cleanup_past_planned_recipes(session):
     today = datetime.now().date()
@@ -302,16 +338,7 @@ def purge_missed_recipes():
         del st.session_state.planned_recipes[sel]
 
 
-MEAL_SLOTS = ["Breakfast", "Lunch", "Dinner", "Snack", "Dessert", "Beverage"]
-
-ALLOWED_FOR_SLOT = {
-    "Breakfast": ["breakfast", "breakfast & desserts"],
-    "Lunch": ["lunch", "dinner & lunch", "breakfast, lunch & dinner"],
-    "Dinner": ["dinner", "dinner & lunch", "breakfast, lunch & dinner"],
-    "Snack": ["appetizer", "appetizers", "appetizers & sides", "side", "snack"],
-    "Dessert": ["dessert", "breakfast & desserts", "appetizers & sides & desserts"],
-    "Beverage": ["beverage"],
-}
+SEARCH_RANGE = 14
 
 CATEGORIES = {
     "Breakfast": "breakfast",
@@ -415,7 +442,9 @@ with col2:
 
         if today <= exp < today + timedelta(days=DAYS_TO_SHOW):
             idx = (exp - today).days
-            cat = row.get("category") or "Other"
+            cat = row.get("category")
+            if pd.isna(cat) or not cat:
+                cat = "Other"
             amt = row.get("amount", 1)
 
             waste_data.setdefault(cat, [0]*DAYS_TO_SHOW)
@@ -557,16 +586,69 @@ with col2:
 
 st.markdown("## Recommendations by Category")
 
+# With nothing planned the virtual pantry scores exactly like the real one,
+# so the background worker's latest result can be shown without scoring here.
+# A result from before a pantry write (e.g. a recipe just confirmed) is never
+# shown: the page scores synchronously instead, which is cheap on warm caches.
+worker = get_recommendation_worker()
+worker_key = worker.track(CATEGORIES.values(), limit=10, max_missing=max_missing)
+has_pending_plans = any(
+    pdata.get("status") != "confirmed" for pdata in st.session_state.planned_recipes.values()
+)
+latest = None if has_pending_plans else worker.latest(worker_key)
+if latest is not None and worker.pantry_changed(latest):
+    latest = None
+
+if latest is not None:
+    if worker.is_stale(latest):
+        st.caption(
+            f"Computed at {latest.computed_at:%H:%M:%S}. "
+            "Updated recommendations are being prepared, press Refresh to load them."
+        )
+    else:
+        st.caption(f"Up to date as of {latest.computed_at:%H:%M:%S}.")
+
 tabs = st.tabs(list(CATEGORIES.keys()))
 
-for tab, (label, keyword) in zip(tabs, CATEGORIES.items()):
+tab_slots = {}
+for tab, keyword in zip(tabs, CATEGORIES.values()):
     with tab:
-        category_recs = recommender.recommend_by_category(
-            keyword,
-            limit=10,
-            max_missing=max_missing,
-            virtual_pantry_state=st.session_state.virtual_pantry,
-        )
+        tab_slots[keyword] = st.empty()
+
+def render_preview_tiles(slot, category_recs):
+    """Lightweight tiles (title + score) shown while the ranking is still being refined."""
+    with slot.container():
+        cols = st.columns(5)
+        for col, rec in zip(cols, category_recs):
+            with col:
+                with st.container(border=True):
+                    st.subheader(rec["title"])
+                    st.caption(f"Score {rec['score']:.3f}")
+
+if latest is not None:
+    recs_by_category = latest.value
+else:
+    # Provisional top lists stream in best-bound first, so the first tiles show
+    # before every recipe is scored; the full tiles below replace them.
+    recs_by_category = {}
+    for keyword, category_recs in recommender.iter_recommendations(
+        limit=10,
+        max_missing=max_missing,
+        virtual_pantry_state=st.session_state.virtual_pantry,
+        categories=CATEGORIES.values(),
+    ):
+        recs_by_category[keyword] = category_recs
+        render_preview_tiles(tab_slots[keyword], category_recs)
+
+# Ingredient rows for every tile in one batched call (5 tiles per category)
+rationales = recommender.get_rationales(
+    [rec["recipe_id"] for category_recs in recs_by_category.values() for rec in category_recs[:5]],
+    virtual_pantry_state=st.session_state.virtual_pantry,
+)
+
+for label, keyword in CATEGORIES.items():
+    with tab_slots[keyword].container():
+        category_recs = recs_by_category.get(keyword, [])
 
         if not category_recs:
             st.info("No recommendations available for this category.")
@@ -576,7 +658,6 @@ for tab, (label, keyword) in zip(tabs, CATEGORIES.items()):
 
         for i, (col, rec) in enumerate(zip(cols, category_recs)):
             recipe_id = rec["recipe_id"]
-            recipe_obj = rm.get_recipe_by_id(recipe_id)
             is_added = any(pdata["recipe_id"] == recipe_id for pdata in st.session_state.planned_recipes.values())
 
 
@@ -584,33 +665,23 @@ for tab, (label, keyword) in zip(tabs, CATEGORIES.items()):
                 with st.container(border=True):
 
                     st.subheader(rec["title"])
-                    st.caption("📂 " + recommender.normalize_category_label(recipe_obj))
+                    st.caption("📂 " + recommender.category_label(recipe_id))
+                    if rec["missing"] == 0:
+                        st.caption("✅ Can make this now")
 
                     matched_rows = []
                     missing_rows = []
 
-                    vp = st.session_state.virtual_pantry
-
-                    for ing in recipe_obj.ingredients:
-                        name = (
-                            getattr(ing, "name", None)
-                            or getattr(ing, "ingredient_name", None)
-                            or getattr(ing, "ingredient", None)
-                            or getattr(ing, "display_name", None)
-                            or "Unknown Ingredient"
-                        )
-
-                        needed = ing.pantry_amount or 0
-                        unit = ing.pantry_unit or ""
-                        pid = getattr(ing, "matched_product_id", None)
-
-                        if not pid:
+                    for r in rationales.get(recipe_id, []):
+                        if not r["product_id"]:
                             continue
 
-                        entries = [it for it in vp if it["product_id"] == pid]
+                        name = r["ingredient"] or "Unknown Ingredient"
+                        needed = r["needed"]
+                        unit = r["unit"] or ""
 
-                        if entries:
-                            total_amount = sum(it["amount"] for it in entries)
+                        if r["in_stock"]:
+                            total_amount = r["on_hand"]
 
                             used = min(total_amount, needed)
                             remaining = max(total_amount - used, 0)
@@ -633,7 +704,7 @@ for tab, (label, keyword) in zip(tabs, CATEGORIES.items()):
                     if st.button("➕ Add", key=f"catadd_{recipe_id}_{label}_{i}"):
 
                         optimal_day, optimal_slot, _ = compute_optimal_date_for_recipe(
-                            recipe_obj,
+                            rm.get_recipe_by_id(recipe_id),
                             st.session_state.virtual_pantry,
                             st.session_state.planned_recipes,
                         )
@@ -690,6 +761,19 @@ else:
 
         grouped[slot].append((sel_id, pdata, recipe_obj))
 
+    pending = [
+        sel_id for sel_id, pdata in st.session_state.planned_recipes.items()
+        if pdata.get("status") != "confirmed"
+    ]
+    if len(pending) > 1 and st.button(f"✔️ Confirm all ({len(pending)})", key="confirm_all"):
+        for sel_id in pending:
+            st.session_state.planned_recipes[sel_id]["status"] = "confirmed"
+
+        rm.confirm_recipes(pending)
+
+        st.session_state.virtual_pantry = rebuild_virtual_pantry()
+        st.rerun()
+
     cols = st.columns(len(CATEGORY_COLUMNS))
 
     for col, category in zip(cols, CATEGORY_COLUMNS):
@@ -807,30 +891,14 @@ else:
                     )
 
                     chosen_date_str = str(date)
-                    norm_cat = recommender.normalize_category_label(recipe_obj).lower()
-                    allowed_slots = set()
-
-                    if "breakfast" in norm_cat:
-                        allowed_slots.add("Breakfast")
-                    if "lunch" in norm_cat:
-                        allowed_slots.add("Lunch")
-                    if "dinner" in norm_cat:
-                        allowed_slots.add("Dinner")
-                    if any(x in norm_cat for x in ["appetizer", "side", "snack"]):
-                        allowed_slots.add("Snack")
-                    if "dessert" in norm_cat:
-                        allowed_slots.add("Dessert")
-                    if any(x in norm_cat for x in ["beverage", "drink", "cocktail"]):
-                        allowed_slots.add("Beverage")
-                    if not allowed_slots:
-                        allowed_slots = set(MEAL_SLOTS)
+                    slots = allowed_slots(recommender.normalize_category_label(recipe_obj))
 
                     taken_slots = {
                         pdata2.get("meal_slot")
                         for other_sel_id, pdata2 in st.session_state.planned_recipes.items()
                         if pdata2.get("planned_for") == chosen_date_str and other_sel_id != sel_id
                     }
-                    available_slots = [s for s in allowed_slots if s not in taken_slots]
+                    available_slots = [s for s in slots if s not in taken_slots]
 
                     stored_slot = pdata.get("meal_slot")
                     if stored_slot in available_slots:
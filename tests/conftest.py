@@ -0,0 +1,6 @@
+import sys
+from pathlib import Path
+
+# Allow tests to import database + services + recommender_system
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(PROJECT_ROOT))
@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta
+import numpy as np
+import pytest
+from benchmarks.synthetic_data import build_synthetic_database
+from database.tables import PantryItem
+from recommender_system.batch_recommender import BatchRecommender, HouseholdPantries
+from recommender_system.catalog import get_product_catalog
+from recommender_system.recipe_recommender_sys import RecipeRecommender, CATEGORY_MULTIPLIERS
+from recommender_system.scoring_engine import get_scoring_engine
+
+
+@pytest.fixture
+def session(tmp_path):
+    session = build_synthetic_database(tmp_path / "batch.sqlite", n_recipes=400, n_lots=0, seed=3)
+    yield session
+    session.close()
+
+
+def add_split_lots(session, now):
+    """Pantry where most products have several lots with different expirations."""
+    engine = get_scoring_engine(session)
+    rng = np.random.default_rng(7)
+    product_ids = rng.choice(engine.product_ids, size=40, replace=False).tolist()
+    for pid in product_ids:
+        for _ in range(int(rng.integers(1, 4))):
+            session.add(PantryItem(
+                product_id=pid,
+                amount=float(rng.choice([0.5, 1, 2, 4, 8])),
+                unit="oz",
+                date_added=now,
+                expiration_date=now + timedelta(hours=float(rng.uniform(1, 24 * 14))),
+            ))
+    session.commit()
+
+
+def single_household_ranking(session, items, now, limit, max_missing):
+    recommender = RecipeRecommender(session)
+    engine = recommender.engine
+    per_unit = recommender._compute_waste_scores(
+        [it["product_id"] for it in items],
+        [it["amount"] for it in items],
+        [it["expiration_date"] for it in items],
+        now,
+        get_product_catalog(session, CATEGORY_MULTIPLIERS),
+    )
+    item_scores = [dict(it, per_unit_score=float(u)) for it, u in zip(items, per_unit)]
+    ranked = engine.rank(engine.score_all(item_scores), limit=limit, max_missing=max_missing)
+    return [(r["recipe_id"], r["score"]) for r in ranked]
+
+
+def test_batch_matches_single_household_with_split_lots(session):
+    now = datetime.now()
+    add_split_lots(session, now)
+    items = RecipeRecommender(session).pm.get_all_items()
+    items = [dict(it) for it in items]
+    assert len({it["product_id"] for it in items}) < len(items)
+
+    engine = get_scoring_engine(session)
+    catalog = get_product_catalog(session, CATEGORY_MULTIPLIERS)
+    pantries = HouseholdPantries.from_lots(
+        engine,
+        catalog,
+        [1] * len(items),
+        [it["product_id"] for it in items],
+        [it["amount"] for it in items],
+        [it["expiration_date"] for it in items],
+        now=now,
+    )
+    _, recipes, _, scores = BatchRecommender(engine).top_k(pantries, limit=10, max_missing=1)
+
+    expected = single_household_ranking(session, items, now, limit=10, max_missing=1)
+    assert recipes.tolist() == [rid for rid, _ in expected]
+    np.testing.assert_allclose(scores, [score for _, score in expected])
+
+
+def test_soonest_lot_is_used_first(session):
+    now = datetime.now()
+    engine = get_scoring_engine(session)
+    catalog = get_product_catalog(session, CATEGORY_MULTIPLIERS)
+
+    # A product one recipe needs a little of, held as an urgent lot and a
+    # large lot that expires much later
+    ing = int(np.flatnonzero(engine.ing_needed > 0)[0])
+    pid, needed = int(engine.product_ids[engine.ing_col[ing]]), float(engine.ing_needed[ing])
+    exps = [now + timedelta(hours=2), now + timedelta(hours=300)]
+    pantries = HouseholdPantries.from_lots(
+        engine, catalog, [1, 1], [pid, pid], [needed, needed * 10], exps, now=now
+    )
+    assert pantries.entry_hi.tolist() == [2] and pantries.entry_lo.tolist() == [0]
+
+    score = BatchRecommender(engine).score(pantries)["score"][0, engine.ing_row[ing]]
+    urgent = catalog.multipliers_for([pid])[0] / 2 * needed
+    assert score >= urgent * (1 - 1e-9)
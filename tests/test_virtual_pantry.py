@@ -0,0 +1,48 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from recommender_system.virtual_pantry import VirtualPantry
+
+
+NOW = datetime(2026, 1, 1)
+
+
+def recipe(*ingredients):
+    return SimpleNamespace(ingredients=[
+        SimpleNamespace(matched_product_id=pid, pantry_amount=amount)
+        for pid, amount in ingredients
+    ])
+
+
+def pantry_items(n_products=50):
+    return [
+        {"product_id": pid, "amount": 4.0, "expiration_date": NOW + timedelta(days=day)}
+        for pid in range(1, n_products + 1)
+        for day in (1, 3)
+    ]
+
+
+def test_apply_recipe_shares_untouched_products():
+    parent = VirtualPantry.from_items(pantry_items())
+    child = parent.apply_recipe(recipe((1, 5), (2, 8)))
+
+    # Only the touched products are recorded on the child
+    assert set(child._changes) == {1, 2}
+    assert child.lots(2) is None
+    assert child.lots(1).amount == (3.0,)
+    for pid in range(3, 51):
+        assert child.lots(pid) is parent.lots(pid)
+        assert child._products[pid] is parent._products[pid]
+
+
+def test_long_chains_are_flattened():
+    items = pantry_items()
+    pantry = VirtualPantry.from_items(items)
+    for step in range(3 * VirtualPantry.MAX_DEPTH):
+        pantry = pantry.apply_recipe(recipe((step % 50 + 1, 1)))
+        assert pantry._depth < VirtualPantry.MAX_DEPTH
+
+    expected = {pid: 8.0 for pid in range(1, 51)}
+    for step in range(3 * VirtualPantry.MAX_DEPTH):
+        expected[step % 50 + 1] -= 1
+    assert {pid: pantry.amount(pid) for pid in range(1, 51)} == expected
+    assert sum(it["amount"] for it in pantry.to_items()) == sum(expected.values())